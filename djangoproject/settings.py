@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'crispy_forms',
     "crispy_bootstrap5",
     'widget_tweaks',
@@ -51,16 +52,33 @@ INSTALLED_APPS = [
 ]
 
 # Caching Configuration
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# The cache must be shared by all gunicorn workers, so it is Redis when
+# REDIS_URL is set (needs the `redis` package) and a file-based cache
+# otherwise (never per-process).
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', str(BASE_DIR / '.cache')),
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
     }
-}
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add this after SecurityMiddleware
+    # Query count / DB time per request (Server-Timing header + log line)
+    'inventorymgmt.middleware.RequestTimingMiddleware',
+    # Off unless PROFILING_ENABLED; browse results at /profiles/ (staff)
+    'inventorymgmt.middleware.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -92,18 +110,21 @@ WSGI_APPLICATION = 'djangoproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.postgresql')
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
+        'ENGINE': DB_ENGINE,
         'NAME': os.getenv('DB_NAME', 'railway'),
         'USER': os.getenv('DB_USER', 'postgres'),
         'PASSWORD': os.getenv('DB_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
         'CONN_MAX_AGE': 600,
+        # connect_timeout is a libpq option; sqlite3 rejects unknown kwargs
         'OPTIONS': {
             'connect_timeout': 10,
-        }
+        } if 'postgresql' in DB_ENGINE else {},
     }
 }
 
@@ -170,6 +191,80 @@ SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY', '')
 SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY', '')
 SUPABASE_BUCKET_NAME = os.getenv('SUPABASE_BUCKET_NAME', 'inv_management')
 
+# Storage client: (connect, read) timeouts, retries and circuit breaker
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '3.05'))
+SUPABASE_READ_TIMEOUT = float(os.getenv('SUPABASE_READ_TIMEOUT', '30'))
+SUPABASE_RETRIES = int(os.getenv('SUPABASE_RETRIES', '2'))
+SUPABASE_BREAKER_THRESHOLD = int(os.getenv('SUPABASE_BREAKER_THRESHOLD', '5'))
+SUPABASE_BREAKER_RESET_SECONDS = float(os.getenv('SUPABASE_BREAKER_RESET_SECONDS', '30'))
+
+# Uploads are queued in StorageJob and sent by `manage.py run_storage_worker`
+STORAGE_JOB_MAX_ATTEMPTS = int(os.getenv('STORAGE_JOB_MAX_ATTEMPTS', '5'))
+STORAGE_JOB_BACKOFF_SECONDS = int(os.getenv('STORAGE_JOB_BACKOFF_SECONDS', '30'))
+# Processes for thumbnail/WebP rendering in the worker (default: CPU count)
+IMAGE_PROCESS_WORKERS = int(os.getenv('IMAGE_PROCESS_WORKERS', '0')) or None
+
+# ==========================================
+# REQUEST INSTRUMENTATION
+# ==========================================
+# Same SQL this many times in one request is logged as a likely N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', '10'))
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', 'True').lower() == 'true'
+# Statements slower than this are aggregated in SlowQuery (slow_query_report)
+SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', '200'))
+# Capture plans for slow queries in a background thread
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'True').lower() == 'true'
+# Write the slow-query log from that thread; off, jobs wait for slowlog.drain()
+SLOW_QUERY_BACKGROUND = os.getenv('SLOW_QUERY_BACKGROUND', 'True').lower() == 'true'
+
+# Bearer token a Prometheus scraper sends to /metrics (staff sessions need none)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Request profiling: cProfile a sample of requests, keep stack samples of slow
+# ones, newest PROFILE_MAX_FILES kept in PROFILE_DIR
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.01'))
+PROFILE_SLOW_MS = int(os.getenv('PROFILE_SLOW_MS', '1000'))
+PROFILE_SAMPLE_INTERVAL_MS = int(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON line per request
+        'inventorymgmt.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# ==========================================
+# ARCHIVE CONFIGURATION
+# ==========================================
+# `manage.py archive_data` moves movements/sales older than this to ARCHIVE_DIR
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', '365'))
+
+# ==========================================
+# PERFORMANCE TOOLS
+# ==========================================
+# seed_perf_data / bench_views write generated rows. They only run with DEBUG
+# on, or against a dedicated benchmark database that sets this
+PERF_ALLOW_DATABASE = os.getenv('PERF_ALLOW_DATABASE', 'False').lower() == 'true'
+
+# ==========================================
+# SEARCH CONFIGURATION
+# ==========================================
+# 'trigram' (typo tolerant, default) or 'fulltext' (weighted tsvector ranking)
+INVENTORY_SEARCH_MODE = os.getenv('INVENTORY_SEARCH_MODE', 'trigram')
+
 # ==========================================
 # SECURITY SETTINGS
 # ==========================================
@@ -0,0 +1,22 @@
+"""
+Gunicorn settings, loaded automatically from the working directory.
+
+Each worker process writes its Prometheus values to memory-mapped files
+in PROMETHEUS_MULTIPROC_DIR so `/metrics` can add them up (see
+inventorymgmt/metrics.py). The directory is emptied when the master
+starts, and a dead worker's live gauges are dropped when it exits.
+"""
+import os
+import shutil
+
+multiproc_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+
+
+def on_starting(server):
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
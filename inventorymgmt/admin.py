@@ -1,6 +1,7 @@
 from django.contrib import admin
 from .forms import StockCreateForm
-from .models import Stock
+from .models import SlowQuery, Stock
+from .services import save_edited_stock
 # Register your models here.
 
 class StockAdminForm(admin.ModelAdmin):
@@ -9,5 +10,20 @@ class StockAdminForm(admin.ModelAdmin):
     search_fields = ['item_name', 'category', 'brand']
     list_filter = ['category',  'brand',]
 
+    def save_model(self, request, obj, form, change):
+        # Quantity edits and new items go through the ledger
+        obj.added_by = obj.added_by or request.user
+        save_edited_stock(obj, request.user)
 
-admin.site.register(Stock, StockAdminForm)
\ No newline at end of file
+
+admin.site.register(Stock, StockAdminForm)
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['fingerprint', 'view', 'call_site', 'calls', 'total_ms', 'max_ms', 'last_seen']
+    search_fields = ['statement', 'view', 'call_site']
+    ordering = ['-total_ms']
+    readonly_fields = [field.name for field in SlowQuery._meta.fields]
+
+
+admin.site.register(SlowQuery, SlowQueryAdmin)
\ No newline at end of file
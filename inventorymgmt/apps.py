@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class InventorymgmtConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventorymgmt'
+
+    def ready(self):
+        from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+        from suppliers.models import Supplier
+        from .caching import invalidate_on_change
+        from .models import Sale, Stock
+        from .rollups import fold_deleted_stock
+        from .search import ensure_search_indexes
+        from .services import sync_low_stock_on_save
+
+        post_migrate.connect(ensure_search_indexes, sender=self)
+        for model in (Stock, Sale, Supplier):
+            post_save.connect(invalidate_on_change, sender=model, dispatch_uid=f'catalog_cache_save_{model.__name__}')
+            post_delete.connect(invalidate_on_change, sender=model, dispatch_uid=f'catalog_cache_delete_{model.__name__}')
+        m2m_changed.connect(invalidate_on_change, sender=Supplier.brands.through, dispatch_uid='catalog_cache_brands')
+        post_save.connect(sync_low_stock_on_save, sender=Stock, dispatch_uid='low_stock_save')
+        post_delete.connect(fold_deleted_stock, sender=Stock, dispatch_uid='sales_rollup_stock_delete')
@@ -0,0 +1,170 @@
+"""
+Cold storage for old ledger and sales rows.
+
+`manage.py archive_data` moves StockMovement and Sale rows older than the
+retention horizon into gzip-compressed files partitioned by month
+(`<ARCHIVE_DIR>/<dataset>/<YYYY-MM>.jsonl.gz`, or `.csv.gz`). Rows are
+written and then deleted in bounded primary-key batches, so no statement
+holds locks on a large range. Daily sales totals survive in
+DailySalesSummary, which archiving deliberately leaves alone and which
+`rollups.rebuild` never recomputes before the oldest remaining sale.
+
+Archived months are read back with `read_month()` / `query()`; a batch that
+was written but not deleted (crash in between) is simply archived again on
+the next run, and readers drop the duplicate ids.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .filters import day_start
+from .models import Sale, StockMovement
+
+
+class Dataset:
+    def __init__(self, name, model, date_field, fields):
+        self.name = name
+        self.model = model
+        self.date_field = date_field
+        self.fields = fields
+
+
+# Movements first: deleting a sale nulls the sale_id of its movements
+DATASETS = {
+    'movements': Dataset('movements', StockMovement, 'created_at', [
+        'id', 'stock_id', 'stock__item_name', 'kind', 'delta', 'balance',
+        'actor__username', 'supplier__name', 'sale_id', 'party', 'created_at',
+    ]),
+    'sales': Dataset('sales', Sale, 'sale_date', [
+        'id', 'stock_id', 'stock__item_name', 'quantity_sold', 'selling_price',
+        'subtotal', 'sold_by', 'sale_date',
+    ]),
+}
+
+EXTENSIONS = {'jsonl': '.jsonl.gz', 'csv': '.csv.gz'}
+
+
+def archive_dir():
+    return str(getattr(settings, 'ARCHIVE_DIR', os.path.join(settings.BASE_DIR, 'archive')))
+
+
+def retention_cutoff(days=None):
+    """Start of the local day `days` ago; rows before it are archived"""
+    if days is None:
+        days = getattr(settings, 'ARCHIVE_RETENTION_DAYS', 365)
+    return day_start(timezone.localdate() - timedelta(days=days))
+
+
+def _path(dataset, month, fmt):
+    return os.path.join(archive_dir(), dataset.name, f"{month}{EXTENSIONS[fmt]}")
+
+
+def _append(dataset, month, rows, fmt):
+    """Append rows to a month file; each call adds one gzip member"""
+    path = _path(dataset, month, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    new_file = not os.path.exists(path)
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        if new_file:
+            writer.writerow(dataset.fields)
+        for row in rows:
+            writer.writerow([row[field] for field in dataset.fields])
+    else:
+        for row in rows:
+            buffer.write(json.dumps(row, default=str, ensure_ascii=False) + '\n')
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as out:
+            out.write(buffer.getvalue().encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archive(dataset, cutoff, batch_size=1000, fmt='jsonl', dry_run=False):
+    """
+    Move rows of `dataset` older than `cutoff` into month files. Returns the
+    number of rows archived (or that would be, with dry_run).
+    """
+    old = dataset.model.objects.filter(**{f'{dataset.date_field}__lt': cutoff})
+    if dry_run:
+        return old.count()
+
+    moved = 0
+    last_pk = 0
+    while True:
+        rows = list(old.filter(pk__gt=last_pk).order_by('pk').values(*dataset.fields)[:batch_size])
+        if not rows:
+            return moved
+        last_pk = rows[-1]['id']
+
+        months = {}
+        for row in rows:
+            # Stored in local time, so the file month and the date prefix agree
+            row[dataset.date_field] = timezone.localtime(row[dataset.date_field]).isoformat()
+            months.setdefault(row[dataset.date_field][:7], []).append(row)
+        for month, month_rows in months.items():
+            _append(dataset, month, month_rows, fmt)
+
+        # Written and synced; now drop the batch in its own short transaction
+        with transaction.atomic():
+            dataset.model.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+
+
+def archived_months(dataset):
+    """Sorted list of 'YYYY-MM' months that have an archive file"""
+    directory = os.path.join(archive_dir(), dataset.name)
+    if not os.path.isdir(directory):
+        return []
+    months = set()
+    for name in os.listdir(directory):
+        for extension in EXTENSIONS.values():
+            if name.endswith(extension):
+                months.add(name[:-len(extension)])
+    return sorted(months)
+
+
+def read_month(dataset, month):
+    """Yield the archived rows of one month as dicts (string values)"""
+    seen = set()
+    for fmt in EXTENSIONS:
+        path = _path(dataset, month, fmt)
+        if not os.path.exists(path):
+            continue
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as archived:
+            rows = csv.DictReader(archived) if fmt == 'csv' else map(json.loads, archived)
+            for row in rows:
+                row_id = str(row['id'])
+                if row_id in seen:
+                    continue
+                seen.add(row_id)
+                yield row
+
+
+def query(dataset, date_from=None, date_to=None, stock_id=None):
+    """
+    Archived rows between two dates (inclusive, as `date` objects), only
+    opening the month files that can contain them.
+    """
+    first = date_from.strftime('%Y-%m') if date_from else None
+    last = date_to.strftime('%Y-%m') if date_to else None
+    for month in archived_months(dataset):
+        if (first and month < first) or (last and month > last):
+            continue
+        for row in read_month(dataset, month):
+            day = str(row[dataset.date_field])[:10]
+            if date_from and day < date_from.isoformat():
+                continue
+            if date_to and day > date_to.isoformat():
+                continue
+            if stock_id is not None and str(row['stock_id']) != str(stock_id):
+                continue
+            yield row
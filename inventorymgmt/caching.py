@@ -0,0 +1,187 @@
+"""
+Shared cache for the POS catalog, category list and supplier list.
+
+Entries live in the `default` cache, which is shared by every gunicorn worker
+(Redis when REDIS_URL is set, otherwise a file-based cache; see settings).
+All keys are stamped with a single catalog version. Any write to Stock, Sale
+or Supplier bumps the version once the transaction commits, which orphans
+every cached entry at once; stale entries simply expire. Hit/miss counts
+per entry name are Prometheus counters (inventory_cache_lookups_total), so
+a hit costs no cache write and /metrics adds up every gunicorn worker.
+
+Sales analytics are stamped with a separate sales version instead, bumped by
+the daily rollup whenever sales are added, reversed or rebuilt, so stock
+edits do not evict them and new sales do.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+
+VERSION_KEY = 'inventory:catalog:version'
+SALES_VERSION_KEY = 'inventory:sales:version'
+TIMEOUT = 60 * 60
+
+# Counter names reported by stats()
+ENTRIES = ['pos_items', 'categories', 'suppliers', 'snapshot', 'low_stock', 'valuation', 'sales_series']
+
+_MISSING = object()
+
+
+def _incr(key, initial):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, initial, timeout=None)
+        return cache.get(key, initial)
+
+
+def current_version(version_key=VERSION_KEY):
+    version = cache.get(version_key)
+    if version is None:
+        # Seed from the clock so a lost version key (eviction, cache flush)
+        # can never fall back to a number that older entries were stored under
+        version = int(time.time() * 1000)
+        cache.add(version_key, version, timeout=None)
+        version = cache.get(version_key, version)
+    return version
+
+
+def invalidate():
+    """Bump the catalog version after the current transaction commits"""
+    transaction.on_commit(lambda: _incr(VERSION_KEY, int(time.time() * 1000)))
+
+
+def invalidate_sales():
+    """Bump the sales version after the current transaction commits"""
+    transaction.on_commit(lambda: _incr(SALES_VERSION_KEY, int(time.time() * 1000)))
+
+
+def cached(name, build, *parts, version_key=VERSION_KEY):
+    """
+    Return the cached value for `name` (and any key `parts`), calling
+    `build()` and storing its result on a miss.
+    """
+    key = ':'.join(['inventory:catalog', name, *[str(part) for part in parts]])
+    version = current_version(version_key)
+    value = cache.get(key, _MISSING, version=version)
+    metrics.count_cache_lookup(name, value is not _MISSING)
+    if value is not _MISSING:
+        return value
+    value = build()
+    cache.set(key, value, TIMEOUT, version=version)
+    return value
+
+
+def stats():
+    """
+    {name: {'hits': n, 'misses': n, 'hit_ratio': float}} for every entry, as
+    counted since the workers started (all of them under
+    PROMETHEUS_MULTIPROC_DIR, else this process only)
+    """
+    counts = metrics.samples('inventory_cache_lookups_total')
+    report = {}
+    for name in ENTRIES:
+        hits = int(counts.get((('entry', name), ('result', 'hit')), 0))
+        misses = int(counts.get((('entry', name), ('result', 'miss')), 0))
+        total = hits + misses
+        report[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 3) if total else 0.0,
+        }
+    return report
+
+
+def pos_items(category=''):
+    """In-stock items for the POS grid (unsearched view), optionally by category"""
+    from .models import Stock
+    from .search import search_stock
+
+    return cached('pos_items', lambda: list(search_stock(
+        Stock.objects.filter(quantity__gt=0).select_related('supplier'),
+        category=category,
+    )), category)
+
+
+def categories():
+    """Sorted distinct categories of in-stock items"""
+    from .models import Stock
+
+    def build():
+        values = Stock.objects.filter(quantity__gt=0).values_list('category', flat=True).distinct()
+        return sorted(c for c in values if c)
+
+    return cached('categories', build)
+
+
+def suppliers():
+    """All suppliers with their brands prefetched"""
+    from suppliers.models import Supplier
+
+    return cached('suppliers', lambda: list(Supplier.objects.prefetch_related('brands')))
+
+
+def catalog_snapshot():
+    """
+    Compact catalog for POS terminals: {'etag', 'fields', 'items'} where each
+    item is a row in `fields` order. The etag is derived from the newest
+    last_updated (plus the row count, so deletions also change it).
+    """
+    from django.db.models import Count, Max
+
+    from .models import Stock
+
+    def build():
+        fields = ['id', 'item_name', 'price', 'quantity', 'category']
+        queryset = Stock.objects.all()
+        state = queryset.aggregate(latest=Max('last_updated'), rows=Count('id'))
+        latest = state['latest'].isoformat() if state['latest'] else ''
+        etag = hashlib.md5(f"{latest}:{state['rows']}".encode()).hexdigest()
+        items = [list(row) for row in queryset.order_by('item_name').values_list(*fields)]
+        return {'etag': etag, 'fields': fields, 'items': items}
+
+    return cached('snapshot', build)
+
+
+def low_stock(limit=20):
+    """
+    {'count', 'items'} for the low-stock panels: items at or below their
+    reorder level, emptiest first, read through the partial index.
+    """
+    from .models import Stock
+
+    def build():
+        queryset = Stock.objects.filter(low_stock=True)
+        items = list(queryset.order_by('quantity', 'item_name').values(
+            'id', 'item_name', 'brand', 'category', 'quantity', 'reorder_level',
+        )[:limit])
+        return {'count': queryset.count(), 'items': items}
+
+    return cached('low_stock', build, limit)
+
+
+def valuation():
+    """Stock value by category, brand and supplier (reports.valuation)"""
+    from .reports import valuation as build
+
+    return cached('valuation', build)
+
+
+def sales_series(bucket, date_from, date_to, dimension=None, top=10):
+    """Chart series from reports.sales_series, until the next sale"""
+    from .reports import sales_series as build
+
+    return cached(
+        'sales_series', lambda: build(bucket, date_from, date_to, dimension, top),
+        bucket, date_from, date_to, dimension or 'total', top,
+        version_key=SALES_VERSION_KEY,
+    )
+
+
+def invalidate_on_change(sender, **kwargs):
+    """post_save / post_delete / m2m_changed receiver"""
+    invalidate()
@@ -0,0 +1,257 @@
+"""
+Constant-memory CSV/XLSX exports.
+
+Rows are read with `values_list(...).iterator(chunk_size=...)`, so no model
+instances are built and the queryset result cache is never filled. Both
+formats go out through StreamingHttpResponse as rows are read: CSV line by
+line, XLSX as a zip written straight into the response. The sheet uses
+inline strings, so nothing grows with the row count (openpyxl's write-only
+mode still keeps a shared-strings table in memory and needs the whole file
+built before the first byte is sent). Rows past Excel's limit of 1,048,576
+per sheet continue on further sheets, and sheets are written as ZIP64
+entries so they may pass 2 GiB.
+"""
+import csv
+import re
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+
+from .filters import history_queryset, sales_queryset, stock_queryset
+from .models import StockMovement
+
+CHUNK_SIZE = 2000
+
+
+def _text(value):
+    return value if value not in (None, '') else 'N/A'
+
+
+def _datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M') if value else 'N/A'
+
+
+class Export:
+    """One exportable dataset: its columns, projection and row formatter."""
+
+    def __init__(self, name, build_queryset, ordering, columns):
+        self.name = name
+        self.build_queryset = build_queryset
+        self.ordering = ordering
+        # [(header, lookup, formatter)]
+        self.columns = columns
+
+    @property
+    def headers(self):
+        return [header for header, _, _ in self.columns]
+
+    def rows(self, params):
+        """Yield formatted rows for the given filter parameters."""
+        lookups = [lookup for _, lookup, _ in self.columns]
+        formatters = [formatter for _, _, formatter in self.columns]
+        queryset = self.build_queryset(params)
+        if self.ordering:
+            queryset = queryset.order_by(*self.ordering)
+        queryset = queryset.values_list(*lookups)
+        for values in queryset.iterator(chunk_size=CHUNK_SIZE):
+            yield [fmt(value) if fmt else value for fmt, value in zip(formatters, values)]
+
+
+EXPORTS = {
+    # Stock keeps the relevance ordering applied by the search filters
+    'stock': Export('inventory', stock_queryset, None, [
+        ('ID', 'id', None),
+        ('Item Name', 'item_name', None),
+        ('Quantity', 'quantity', None),
+        ('Category', 'category', _text),
+        ('Brand', 'brand', _text),
+        ('Price (रु)', 'price', lambda v: v or '0'),
+        ('Reorder Level', 'reorder_level', lambda v: v or '0'),
+        ('Supplier', 'supplier__name', _text),
+        ('Supplier Contact', 'supplier__phone_number', _text),
+        ('Created By', 'created_by', _text),
+        ('Created Date', 'timestamp', _datetime),
+        ('Last Updated', 'last_updated', _datetime),
+    ]),
+    'history': Export('history', history_queryset, ['-created_at', '-id'], [
+        ('ID', 'id', None),
+        ('Stock ID', 'stock_id', None),
+        ('Item Name', 'stock__item_name', _text),
+        ('Category', 'stock__category', _text),
+        ('Brand', 'stock__brand', _text),
+        ('Movement', 'kind', lambda v: StockMovement.Kind(v).label),
+        ('Change', 'delta', None),
+        ('Quantity After', 'balance', _text),
+        ('Issued To', 'party', _text),
+        ('By', 'actor__username', _text),
+        ('Supplier', 'supplier__name', _text),
+        ('Date', 'created_at', _datetime),
+    ]),
+    'sales': Export('sales', sales_queryset, ['-sale_date', '-id'], [
+        ('ID', 'id', None),
+        ('Date', 'sale_date', _datetime),
+        ('Item Name', 'stock__item_name', _text),
+        ('Brand', 'stock__brand', _text),
+        ('Category', 'stock__category', _text),
+        ('Quantity', 'quantity_sold', None),
+        ('Selling Price (रु)', 'selling_price', None),
+        ('Subtotal (रु)', 'subtotal', None),
+        ('Sold By', 'sold_by', _text),
+    ]),
+}
+
+
+class _Echo:
+    """File-like object whose write() just hands the line back to csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _filename(export, extension):
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"{export.name}_export_{timestamp}.{extension}"
+
+
+def csv_response(export, params):
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow(export.headers)
+        for row in export.rows(params):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{_filename(export, "csv")}"'
+    return response
+
+
+# Rows per sheet Excel can open (header included); longer exports continue
+# on further sheets
+SHEET_ROWS = 1048576
+
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+_RELS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml'
+
+
+def _package_parts(title, sheets):
+    """The workbook parts around `sheets` worksheets, {name: xml}"""
+    names = [title[:31]] + [f"{title[:25]} ({n})" for n in range(2, sheets + 1)]
+    numbers = range(1, sheets + 1)
+    return {
+        '[Content_Types].xml': (
+            f'{_XML}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{_CONTENT_TYPE}.sheet.main+xml"/>'
+            + ''.join(
+                f'<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="{_CONTENT_TYPE}.worksheet+xml"/>'
+                for n in numbers
+            )
+            + '</Types>'
+        ),
+        '_rels/.rels': (
+            f'{_XML}<Relationships xmlns="{_RELS}">'
+            f'<Relationship Id="rId1" Target="xl/workbook.xml" Type="{_REL_TYPE}/officeDocument"/>'
+            '</Relationships>'
+        ),
+        'xl/_rels/workbook.xml.rels': (
+            f'{_XML}<Relationships xmlns="{_RELS}">'
+            + ''.join(
+                f'<Relationship Id="rId{n}" Target="worksheets/sheet{n}.xml" Type="{_REL_TYPE}/worksheet"/>'
+                for n in numbers
+            )
+            + '</Relationships>'
+        ),
+        'xl/workbook.xml': (
+            f'{_XML}<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'xmlns:r="{_REL_TYPE}"><sheets>'
+            + ''.join(
+                f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{n}" r:id="rId{n}"/>'
+                for n, name in zip(numbers, names)
+            )
+            + '</sheets></workbook>'
+        ),
+    }
+
+
+# Characters XML 1.0 cannot carry at all
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _Chunks:
+    """Unseekable file whose writes are collected until the generator yields them"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        # The deflater often hands back nothing; don't yield empty chunks
+        if data:
+            self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def _cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(values):
+    return ('<row>' + ''.join(_cell(value) for value in values) + '</row>').encode()
+
+
+def _xlsx_chunks(export, params):
+    """Yield the bytes of the workbook as the rows are read"""
+    out = _Chunks()
+    rows = export.rows(params)
+    row = next(rows, None)
+    sheets = 0
+    # zipfile falls back to data descriptors on an unseekable file, so each
+    # entry is written once, front to back, and nothing is rewound. The
+    # sheets go first; the parts listing them follow once their count is known
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as package:
+        while sheets == 0 or row is not None:
+            sheets += 1
+            # Sizes are unknown up front; ZIP64 headers let a sheet pass 2 GiB
+            with package.open(f'xl/worksheets/sheet{sheets}.xml', 'w', force_zip64=True) as sheet:
+                sheet.write(
+                    _XML.encode() + b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                    b'<sheetData>' + _row(export.headers)
+                )
+                for _ in range(SHEET_ROWS - 1):
+                    if row is None:
+                        break
+                    sheet.write(_row(row))
+                    row = next(rows, None)
+                    if out.parts:
+                        yield out.take()
+                sheet.write(b'</sheetData></worksheet>')
+        for name, xml in _package_parts(export.name.title(), sheets).items():
+            package.writestr(name, xml)
+    yield out.take()
+
+
+def xlsx_response(export, params):
+    response = StreamingHttpResponse(
+        _xlsx_chunks(export, params),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{_filename(export, "xlsx")}"'
+    return response
@@ -0,0 +1,120 @@
+"""
+Shared queryset filters for the list views and exports.
+
+Keeping them in one place means an export always contains exactly the rows
+the user was looking at in the corresponding list.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Stock, StockMovement, Sale, DailySalesSummary
+from .search import search_stock
+
+
+def day_start(day):
+    """Aware datetime for local midnight at the start of `day`"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_range(day):
+    """Half-open [start, end) datetimes covering the local day `day`"""
+    return day_start(day), day_start(day + timedelta(days=1))
+
+
+def filter_dates(queryset, field, date_from=None, date_to=None):
+    """
+    Restrict a datetime `field` to the local days date_from..date_to
+    (inclusive) as a half-open range on the raw column, so indexes on it
+    stay usable; `field__date` would wrap the column in a cast.
+    """
+    if date_from:
+        queryset = queryset.filter(**{f'{field}__gte': day_start(date_from)})
+    if date_to:
+        queryset = queryset.filter(**{f'{field}__lt': day_start(date_to + timedelta(days=1))})
+    return queryset
+
+
+def filter_stock(queryset, item_name=None, brand=None, category=None):
+    """Filters used by list_items and the stock export, ordered by relevance"""
+    return search_stock(queryset, item_name=item_name, brand=brand, category=category)
+
+
+def filter_history(queryset, item_name=None, brand=None, category=None, date_from=None, date_to=None):
+    """Filters used by list_history and the history export (StockMovement)"""
+    if item_name:
+        queryset = queryset.filter(stock__item_name__icontains=item_name)
+    if brand:
+        queryset = queryset.filter(stock__brand__icontains=brand)
+    if category:
+        queryset = queryset.filter(stock__category__icontains=category)
+    return filter_dates(queryset, 'created_at', date_from, date_to)
+
+
+def filter_sales(queryset, item_name=None, date_from=None, date_to=None):
+    """Filters used by sales_list and the sales export"""
+    if item_name:
+        queryset = queryset.filter(stock__item_name__icontains=item_name)
+    return filter_dates(queryset, 'sale_date', date_from, date_to)
+
+
+def filter_sales_summary(queryset, item_name=None, date_from=None, date_to=None):
+    """The sales filters applied to the DailySalesSummary rollup"""
+    if item_name:
+        queryset = queryset.filter(stock__item_name__icontains=item_name)
+    if date_from:
+        queryset = queryset.filter(day__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(day__lte=date_to)
+    return queryset
+
+
+def _date(value):
+    """Parse a YYYY-MM-DD query parameter, ignoring anything malformed"""
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def _text(params, key):
+    return (params.get(key) or '').strip()
+
+
+def stock_queryset(params):
+    return filter_stock(
+        Stock.objects.all(),
+        _text(params, 'item_name'),
+        _text(params, 'brand'),
+        _text(params, 'category'),
+    )
+
+
+def history_queryset(params):
+    return filter_history(
+        StockMovement.objects.all(),
+        _text(params, 'item_name'),
+        _text(params, 'brand'),
+        _text(params, 'category'),
+        _date(params.get('date_from')),
+        _date(params.get('date_to')),
+    )
+
+
+def sales_queryset(params):
+    return filter_sales(
+        Sale.objects.all(),
+        _text(params, 'item_name'),
+        _date(params.get('date_from')),
+        _date(params.get('date_to')),
+    )
+
+
+def summary_queryset(params):
+    return filter_sales_summary(
+        DailySalesSummary.objects.all(),
+        _text(params, 'item_name'),
+        _date(params.get('date_from')),
+        _date(params.get('date_to')),
+    )
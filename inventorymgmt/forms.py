@@ -1,15 +1,9 @@
 from django import forms
+from django.core.validators import MinValueValidator
 from .models import Stock, Sale
 from suppliers.models import Supplier
-import uuid
 import logging
 
-# Conditional import to avoid errors if supabase not installed
-try:
-    from .supabase_storage import SupabaseStorage
-except ImportError:
-    SupabaseStorage = None
-
 logger = logging.getLogger(__name__)
 
 
@@ -58,35 +52,10 @@ class StockCreateForm(forms.ModelForm):
         # Save without image first (since it's not in fields)
         stock = super().save(commit=False)
         supplier_name = self.cleaned_data.get('supplier_name')
-        image_file = self.cleaned_data.get('image')
         
-        # Handle Supabase image upload
-        if image_file:
-            try:
-                print(f"\n🔄 Processing image upload in form...")
-                supabase = SupabaseStorage()
-                
-                # Generate unique filename
-                filename = f"product_{uuid.uuid4()}_{image_file.name}"
-                print(f"  Generated filename: {filename}")
-                
-                # Upload to Supabase and get public URL
-                image_url = supabase.upload_image(image_file, filename)
-                
-                if image_url:
-                    stock.image = image_url
-                    print(f"  ✅ Image URL saved to model: {image_url}\n")
-                else:
-                    print(f"  ❌ Upload returned None\n")
-                    raise forms.ValidationError("Failed to upload image to Supabase. Please try again.")
-            except forms.ValidationError:
-                raise
-            except Exception as e:
-                print(f"  ❌ Exception during upload: {str(e)}\n")
-                raise forms.ValidationError(f"Error uploading image: {str(e)}")
-        else:
-            print(f"  ℹ️ No image provided")
-            stock.image = None
+        # The image is uploaded by the storage worker once the stock row
+        # exists; until then the item has no image
+        stock.image = None
         
         if supplier_name:
             supplier, created = Supplier.objects.get_or_create(name=supplier_name)
@@ -96,9 +65,39 @@ class StockCreateForm(forms.ModelForm):
             
         if commit:
             stock.save()
-            print(f"  ✅ Stock saved to database with image URL\n")
+            self.queue_image(stock)
+        else:
+            # Like m2m data, the upload job needs the saved row
+            save_m2m = self.save_m2m
+
+            def save_m2m_and_queue_image():
+                save_m2m()
+                self.queue_image(stock)
+
+            self.save_m2m = save_m2m_and_queue_image
         return stock
 
+    def queue_image(self, stock):
+        """Enqueue the uploaded image for upload to Supabase"""
+        image_file = self.cleaned_data.get('image')
+        if image_file:
+            from .jobs import enqueue_upload
+            enqueue_upload(stock, image_file)
+
+
+class StockImportForm(forms.Form):
+    file = forms.FileField(widget=forms.FileInput(attrs={
+        'class': 'form-control',
+        'accept': '.csv,.xlsx'
+    }))
+
+    def clean_file(self):
+        """Only CSV and XLSX catalogs are supported"""
+        upload = self.cleaned_data.get('file')
+        if upload and not upload.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError("Please upload a .csv or .xlsx file.")
+        return upload
+
 
 class StockSearchForm(forms.ModelForm):
     item_name = forms.CharField(required=False)
@@ -120,16 +119,23 @@ class StockSearchForm(forms.ModelForm):
         self.fields['date_to'].widget.attrs.update({'class': 'form-control'})
 
 class StockUpdateForm(forms.ModelForm):
+    # Saved as an ADJUST movement (services.save_edited_stock)
+    quantity = forms.IntegerField(min_value=0)
+
     class Meta:
         model = Stock
         fields = ['category', 'item_name', 'quantity']
 
 class IssueForm(forms.ModelForm):
+    issue_quantity = forms.IntegerField(min_value=1)
+
     class Meta:
         model=Stock
         fields=['issue_quantity']
 
 class ReceiveForm(forms.ModelForm):
+    receive_quantity = forms.IntegerField(min_value=1)
+
     class Meta:
         model = Stock
         fields = ['receive_quantity', 'supplier']
@@ -172,6 +178,7 @@ class SaleForm(forms.ModelForm):
 		self.fields['stock'].queryset = Stock.objects.filter(quantity__gt=0).order_by('item_name')
 		self.fields['stock'].label = 'Product'
 		self.fields['quantity_sold'].label = 'Quantity'
+		self.fields['quantity_sold'].validators.append(MinValueValidator(1))
 		self.fields['selling_price'].label = 'Selling Price'
 	
 	def clean(self):
@@ -185,6 +192,13 @@ class SaleForm(forms.ModelForm):
 		return cleaned_data
 
 
+class CartLineForm(forms.Form):
+	"""One line of a POS cart submitted to the checkout endpoint"""
+	stock = forms.IntegerField(min_value=1)
+	quantity = forms.IntegerField(min_value=1)
+	selling_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+
 class SaleFilterForm(forms.Form):
 	"""Form to filter sales by date and item"""
 	item_name = forms.CharField(required=False, widget=forms.TextInput(attrs={
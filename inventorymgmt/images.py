@@ -0,0 +1,67 @@
+"""
+Image derivative pipeline.
+
+One upload becomes thumb/medium/large renditions in JPEG and WebP (see
+utils.build_derivatives). Resizing and encoding are CPU bound, so they run
+in a process pool shared by the worker process; uploading the results is
+I/O and stays on the calling thread. The public URLs end up in
+Stock.image_variants, from which templates build `srcset`.
+"""
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+
+from .utils import build_derivatives
+
+_pool = None
+
+
+def pool_size():
+    return getattr(settings, 'IMAGE_PROCESS_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_pool():
+    """Process pool for Pillow work, created on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=pool_size())
+        atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+    return _pool
+
+
+def render(data):
+    """Build the derivatives of one image in the pool and wait for them"""
+    return get_pool().submit(build_derivatives, data).result()
+
+
+def render_many(blobs):
+    """
+    Build derivatives for several images in parallel. Yields
+    (index, derivatives or exception) as each image finishes.
+    """
+    futures = {get_pool().submit(build_derivatives, data): index for index, data in enumerate(blobs)}
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result()
+        except Exception as e:
+            yield futures[future], e
+
+
+def upload_derivatives(storage, stem, derivatives):
+    """
+    Upload every rendition as `<stem>_<name>.<ext>` and return the value
+    stored in Stock.image_variants: {name: {'width', 'jpeg', 'webp'}} with
+    URLs in place of bytes. Raises RuntimeError if any upload fails.
+    """
+    variants = {}
+    for name, rendition in derivatives.items():
+        urls = {}
+        for fmt, extension in (('jpeg', 'jpg'), ('webp', 'webp')):
+            url = storage.upload_bytes(rendition[fmt], f"{stem}_{name}.{extension}")
+            if not url:
+                raise RuntimeError(f"Storage rejected the {name} {fmt} rendition")
+            urls[fmt] = url
+        variants[name] = {'width': rendition['width'], **urls}
+    return variants
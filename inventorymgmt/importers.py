@@ -0,0 +1,336 @@
+"""
+Streaming bulk import of stock catalogs from CSV and XLSX files.
+
+Rows are read one at a time (csv reader / openpyxl read-only mode), validated,
+and flushed in chunks: suppliers are resolved with one query per chunk, stock
+rows are upserted with a single `bulk_create(update_conflicts=True)` on the
+`unique_stock` constraint, and the matching StockMovement ledger rows are
+written with one more `bulk_create`. Memory use depends on the chunk size, not the file.
+
+Only the cells a row actually fills are written to an existing item: a file
+with just item_name and quantity updates quantities and leaves prices,
+reorder levels and suppliers alone, and a blank cell never clears a value.
+"""
+import csv
+import io
+import logging
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+
+from suppliers.models import Supplier
+from .caching import invalidate
+from .metrics import count_movements
+from .models import Stock, StockMovement
+from .services import sync_low_stock
+
+logger = logging.getLogger(__name__)
+
+# Header aliases accepted in the first row of the file
+COLUMN_ALIASES = {
+    'item_name': 'item_name',
+    'item': 'item_name',
+    'name': 'item_name',
+    'quantity': 'quantity',
+    'qty': 'quantity',
+    'category': 'category',
+    'brand': 'brand',
+    'price': 'price',
+    'reorder_level': 'reorder_level',
+    'supplier': 'supplier',
+    'supplier_name': 'supplier',
+}
+
+# Columns an import may overwrite on an existing item, when the row fills them
+UPSERT_FIELDS = ['quantity', 'price', 'reorder_level', 'supplier']
+# Largest value of the IntegerField columns (quantity, reorder_level)
+MAX_INT = 2147483647
+# Largest value of Stock.price (max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal('99999999.99')
+
+
+class ImportReport:
+    """Running totals and per-row errors for one import."""
+
+    def __init__(self, max_errors=1000):
+        self.rows = 0
+        self.imported = 0
+        self.errors = []
+        self.error_count = 0
+        self.max_errors = max_errors
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def add_error(self, row_number, message, rows=1):
+        self.error_count += rows
+        # Keep the first few errors for display; the count stays exact
+        if len(self.errors) < self.max_errors:
+            self.errors.append((row_number, message))
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.started
+        return self
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def _normalize_header(header):
+    key = str(header or '').strip().lower().replace(' ', '_')
+    return COLUMN_ALIASES.get(key)
+
+
+def _iter_csv(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        # Don't let the wrapper close the caller's file
+        text.detach()
+
+
+def _iter_xlsx(fileobj):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_rows(fileobj, filename):
+    """
+    Yield (row_number, {column: value}) for each data row of a CSV or XLSX
+    file, using the first row as the header.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        raw_rows = _iter_csv(fileobj)
+    elif extension in ('.xlsx', '.xlsm'):
+        raw_rows = _iter_xlsx(fileobj)
+    else:
+        raise ValueError(f"Unsupported file type '{extension}'. Use .csv or .xlsx")
+
+    header = next(raw_rows, None)
+    if header is None:
+        return
+    columns = [_normalize_header(h) for h in header]
+    if 'item_name' not in columns:
+        raise ValueError("The first row must contain an 'item_name' column")
+
+    for row_number, values in enumerate(raw_rows, start=2):
+        if not any(v not in (None, '') for v in values):
+            continue
+        yield row_number, {
+            column: value
+            for column, value in zip(columns, values)
+            if column
+        }
+
+
+def _clean_text(value, field, max_length=50, required=False):
+    text = '' if value is None else str(value).strip()
+    if required and not text:
+        raise ValueError(f"{field} is required")
+    if len(text) > max_length:
+        raise ValueError(f"{field} is longer than {max_length} characters")
+    return text
+
+
+def _clean_int(value, field):
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{field} must be a whole number")
+    if number != number.to_integral_value() or number < 0:
+        raise ValueError(f"{field} must be a whole number")
+    if number > MAX_INT:
+        raise ValueError(f"{field} is too large")
+    return int(number)
+
+
+def _clean_price(value):
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError("price must be a number")
+    if not price.is_finite() or price < 0:
+        raise ValueError("price must be a number")
+    price = price.quantize(Decimal('0.01'))
+    if price > MAX_PRICE:
+        raise ValueError("price is too large")
+    return price
+
+
+def _filled(value):
+    return value is not None and str(value).strip() != ''
+
+
+def clean_row(values):
+    """
+    Validate one row and return a dict of Stock field values. Missing or
+    blank quantity/price/reorder_level/supplier cells are left out, so the
+    upsert keeps what the item already has.
+    """
+    data = {
+        'item_name': _clean_text(values.get('item_name'), 'item_name', required=True),
+        # Blank brand/category are stored as '' (not NULL) so re-importing the
+        # same file matches the unique_stock constraint instead of duplicating
+        'brand': _clean_text(values.get('brand'), 'brand'),
+        'category': _clean_text(values.get('category'), 'category'),
+    }
+    if _filled(values.get('quantity')):
+        data['quantity'] = _clean_int(values['quantity'], 'quantity')
+    if _filled(values.get('reorder_level')):
+        data['reorder_level'] = _clean_int(values['reorder_level'], 'reorder_level')
+    if _filled(values.get('price')):
+        data['price'] = _clean_price(values['price'])
+    if _filled(values.get('supplier')):
+        data['supplier'] = _clean_text(values['supplier'], 'supplier', max_length=100)
+    return data
+
+
+def _resolve_suppliers(names):
+    """Map supplier names to Supplier rows, creating the missing ones."""
+    if not names:
+        return {}
+    suppliers = {s.name: s for s in Supplier.objects.filter(name__in=names)}
+    missing = names - suppliers.keys()
+    if missing:
+        Supplier.objects.bulk_create([Supplier(name=name) for name in missing], ignore_conflicts=True)
+        suppliers.update((s.name, s) for s in Supplier.objects.filter(name__in=missing))
+    return suppliers
+
+
+def blank_null_keys(item_names=None):
+    """
+    Rewrite NULL brand/category as '' for `item_names` (default: every item),
+    so rows saved before blanks were normalised match the upsert. A row whose
+    '' twin already exists is left as it is. Returns (updated, duplicates).
+    """
+    rows = Stock.objects.filter(Q(brand__isnull=True) | Q(category__isnull=True))
+    if item_names is not None:
+        rows = rows.filter(item_name__in=item_names)
+    updated = duplicates = 0
+    for pk in rows.values_list('pk', flat=True):
+        try:
+            with transaction.atomic():
+                Stock.objects.filter(pk=pk).update(
+                    brand=Coalesce('brand', Value('')), category=Coalesce('category', Value(''))
+                )
+            updated += 1
+        except IntegrityError:
+            duplicates += 1
+    return updated, duplicates
+
+
+def _flush(chunk, username, actor=None):
+    """Upsert one chunk of cleaned rows and log the changes to the ledger."""
+    # Later rows for the same item win; an upsert can't touch a row twice
+    latest = {}
+    for data in chunk:
+        latest[(data['item_name'], data['brand'], data['category'])] = data
+
+    suppliers = _resolve_suppliers({d['supplier'] for d in latest.values() if 'supplier' in d})
+
+    with transaction.atomic():
+        blank_null_keys({key[0] for key in latest})
+        # Current quantities, so the ledger records the change, not the total
+        before = {
+            (item_name, brand, category): quantity
+            for item_name, brand, category, quantity in Stock.objects.filter(
+                item_name__in={key[0] for key in latest}
+            ).values_list('item_name', 'brand', 'category', 'quantity')
+        }
+        # One upsert per set of filled columns (a uniform file has one), so
+        # each statement only overwrites the columns its rows provide
+        groups = {}
+        for key, data in latest.items():
+            fields = tuple(field for field in UPSERT_FIELDS if field in data)
+            groups.setdefault(fields, []).append(Stock(
+                item_name=data['item_name'],
+                brand=data['brand'],
+                category=data['category'],
+                # Unchanged for existing items; kept for the ledger balance
+                quantity=data.get('quantity', before.get(key, 0)),
+                reorder_level=data.get('reorder_level', 0),
+                price=data.get('price'),
+                supplier=suppliers.get(data.get('supplier')),
+                created_by=username,
+            ))
+        stocks = []
+        for fields, group in groups.items():
+            stocks += Stock.objects.bulk_create(
+                group,
+                update_conflicts=True,
+                unique_fields=['item_name', 'brand', 'category'],
+                update_fields=[*fields, 'last_updated'],
+            )
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                stock_id=stock.pk,
+                kind=StockMovement.Kind.IMPORT,
+                delta=stock.quantity - before.get((stock.item_name, stock.brand, stock.category), 0),
+                balance=stock.quantity,
+                actor=actor,
+                supplier=stock.supplier,
+            )
+            for stock in stocks
+        ])
+        count_movements([StockMovement.Kind.IMPORT] * len(stocks))
+        sync_low_stock([stock.pk for stock in stocks])
+        invalidate()
+    return len(stocks)
+
+
+def import_stock(fileobj, filename, username=None, chunk_size=1000):
+    """
+    Import a CSV/XLSX catalog, upserting on (item_name, brand, category).
+
+    Each chunk is committed on its own, so a bad row only shows up in the
+    report and never aborts the rest of the file; a chunk the database
+    rejects is rolled back and reported as a whole. Returns an ImportReport.
+    """
+    report = ImportReport()
+    rows = iter_rows(fileobj, filename)
+    actor = User.objects.filter(username=username).first() if username else None
+
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            break
+
+        chunk = []
+        for row_number, values in batch:
+            report.rows += 1
+            try:
+                chunk.append(clean_row(values))
+            except ValueError as e:
+                report.add_error(row_number, str(e))
+
+        if chunk:
+            try:
+                report.imported += _flush(chunk, username, actor)
+            except DatabaseError as e:
+                logger.warning("Import chunk from row %d rejected: %s", batch[0][0], e)
+                report.add_error(
+                    batch[0][0],
+                    f"rows {batch[0][0]}-{batch[-1][0]} not imported: the database rejected them ({e})",
+                    rows=len(chunk),
+                )
+
+    report.finish()
+    logger.info(
+        "Imported %s: %d rows, %d upserted, %d errors in %.2fs (%.0f rows/sec)",
+        filename, report.rows, report.imported, report.error_count,
+        report.elapsed, report.rows_per_sec,
+    )
+    return report
@@ -0,0 +1,186 @@
+"""
+Database-backed queue for object-storage work.
+
+Web requests never talk to Supabase directly: an uploaded image is stored
+in the payload of a new StorageJob row, and the request returns. The
+payload lives in the database rather than on local disk because the worker
+usually runs in another container (a separate Render worker service or
+Procfile process) and can't see the web container's files.
+`manage.py run_storage_worker` claims due jobs, renders the image
+derivatives, uploads them, stores their URLs on the Stock row and clears the
+payload. Failures are retried with exponential backoff until
+STORAGE_JOB_MAX_ATTEMPTS is reached, after which the job is marked failed
+and its payload is kept for inspection.
+
+Objects orphaned by deleted or replaced images are queued as one DELETE job
+per object once the deleting transaction commits (never on rollback), and
+the worker removes them in batches with a single multi-object request.
+"""
+import logging
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import images
+from .caching import invalidate
+from .models import Stock, StorageJob
+
+logger = logging.getLogger(__name__)
+
+# Workers that die mid-job leave rows in RUNNING; reclaim them after this long
+LOCK_TIMEOUT = timedelta(minutes=10)
+BACKOFF_CAP = timedelta(hours=1)
+
+
+def max_attempts():
+    return getattr(settings, 'STORAGE_JOB_MAX_ATTEMPTS', 5)
+
+
+def backoff(attempts):
+    """Delay before retry number `attempts` (1-based): base * 2^(n-1), capped"""
+    base = getattr(settings, 'STORAGE_JOB_BACKOFF_SECONDS', 30)
+    return min(timedelta(seconds=base * 2 ** (attempts - 1)), BACKOFF_CAP)
+
+
+def enqueue_upload(stock, image_file):
+    """Queue the upload of `image_file` for `stock`, carrying its bytes in the job"""
+    filename = f"product_{uuid.uuid4()}_{os.path.basename(image_file.name)}"
+    payload = b''.join(image_file.chunks())
+    return StorageJob.objects.create(kind=StorageJob.UPLOAD, stock=stock, payload=payload, filename=filename)
+
+
+def _read_payload(job):
+    if job.payload is not None:
+        return bytes(job.payload)
+    # Jobs queued before payloads moved into the database
+    with open(job.path, 'rb') as image_file:
+        return image_file.read()
+
+
+def image_object_names(image, variants=None):
+    """Bucket object names behind an image URL and its derivative URLs"""
+    urls = [image] if image else []
+    for rendition in (variants or {}).values():
+        urls += [rendition.get('jpeg'), rendition.get('webp')]
+    return sorted({url.rstrip('/').split('/')[-1] for url in urls if url})
+
+
+def queue_deletes(names):
+    """
+    Queue storage objects for deletion once the current transaction
+    commits; if it rolls back the objects are kept.
+    """
+    names = list(names)
+    if names:
+        transaction.on_commit(lambda: StorageJob.objects.bulk_create([
+            StorageJob(kind=StorageJob.DELETE, filename=name) for name in names
+        ]))
+
+
+def claim_jobs(limit=10, kind=StorageJob.UPLOAD):
+    """
+    Mark up to `limit` due jobs of `kind` as RUNNING and return them. On
+    PostgreSQL rows are locked with SKIP LOCKED so several workers can poll
+    at once.
+    """
+    now = timezone.now()
+    due = (
+        StorageJob.objects.filter(status=StorageJob.PENDING, run_after__lte=now)
+        | StorageJob.objects.filter(status=StorageJob.RUNNING, locked_at__lt=now - LOCK_TIMEOUT)
+    ).filter(kind=kind).order_by('run_after', 'id')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        jobs = list(due[:limit])
+        StorageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=StorageJob.RUNNING, locked_at=now
+        )
+    return jobs
+
+
+def _upload(job, storage):
+    if job.stock_id is None:
+        # The item was deleted before its image went out; nothing to attach to
+        return
+    derivatives = images.render(_read_payload(job))
+    variants = images.upload_derivatives(storage, os.path.splitext(job.filename)[0], derivatives)
+    with transaction.atomic():
+        previous = Stock.objects.filter(pk=job.stock_id).values('image', 'image_variants').first()
+        # The sanitised large JPEG stands in for the full-resolution original
+        Stock.objects.filter(pk=job.stock_id).update(image=variants['large']['jpeg'], image_variants=variants)
+        if previous:
+            queue_deletes(image_object_names(previous['image'], previous['image_variants']))
+    invalidate()
+
+
+def _fail(job, error):
+    """Schedule a retry with backoff, or give up after max_attempts()"""
+    job.attempts += 1
+    job.last_error = str(error)[:2000]
+    job.locked_at = None
+    if job.attempts >= max_attempts():
+        job.status = StorageJob.FAILED
+        logger.error("Storage job %s failed for good: %s", job.pk, error)
+    else:
+        job.status = StorageJob.PENDING
+        job.run_after = timezone.now() + backoff(job.attempts)
+        logger.warning("Storage job %s failed (attempt %s), retrying: %s", job.pk, job.attempts, error)
+    job.save(update_fields=['attempts', 'last_error', 'locked_at', 'status', 'run_after', 'updated_at'])
+
+
+def _done(jobs):
+    StorageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+        status=StorageJob.DONE, locked_at=None, last_error='', updated_at=timezone.now()
+    )
+
+
+def run_job(job, storage):
+    """Run one claimed upload job, recording success or scheduling a retry"""
+    try:
+        _upload(job, storage)
+    except Exception as e:
+        _fail(job, e)
+        return False
+
+    if job.path and os.path.exists(job.path):
+        os.remove(job.path)
+    # The image is in the bucket now; don't keep a second copy in the table
+    StorageJob.objects.filter(pk=job.pk).update(payload=None)
+    _done([job])
+    return True
+
+
+def run_deletes(jobs, storage):
+    """Remove the objects of claimed DELETE jobs with one storage request"""
+    if not jobs:
+        return 0, 0
+    if storage.remove_objects([job.filename for job in jobs]):
+        _done(jobs)
+        return len(jobs), 0
+    for job in jobs:
+        _fail(job, "Storage rejected the batch delete")
+    return 0, len(jobs)
+
+
+def run_pending(storage=None, limit=10, delete_limit=100):
+    """
+    Claim and run one batch of due uploads and one batch of deletes;
+    returns (succeeded, failed)
+    """
+    if storage is None:
+        from .supabase_storage import get_supabase_storage
+        storage = get_supabase_storage()
+
+    succeeded = failed = 0
+    for job in claim_jobs(limit):
+        if run_job(job, storage):
+            succeeded += 1
+        else:
+            failed += 1
+
+    deleted, not_deleted = run_deletes(claim_jobs(delete_limit, kind=StorageJob.DELETE), storage)
+    return succeeded + deleted, failed + not_deleted
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventorymgmt.archive import DATASETS, EXTENSIONS, archive, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Move stock movements and sales older than the retention horizon into "
+        "compressed month-partitioned archive files"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=[*DATASETS, 'all'], default='all')
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help="Retention horizon (default: ARCHIVE_RETENTION_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows written and deleted per batch")
+        parser.add_argument('--format', choices=list(EXTENSIONS), default='jsonl')
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows that would be archived")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+        cutoff = retention_cutoff(options['older_than_days'])
+        names = list(DATASETS) if options['dataset'] == 'all' else [options['dataset']]
+        for name in names:
+            count = archive(
+                DATASETS[name], cutoff,
+                batch_size=options['batch_size'],
+                fmt=options['format'],
+                dry_run=options['dry_run'],
+            )
+            verb = "Would archive" if options['dry_run'] else "Archived"
+            self.stdout.write(self.style.SUCCESS(f"{verb} {count} {name} rows older than {cutoff:%Y-%m-%d}"))
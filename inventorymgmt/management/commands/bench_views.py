@@ -0,0 +1,95 @@
+import json
+import platform
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from inventorymgmt import perf
+from inventorymgmt.models import Stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main views through the test client: p50/p95 latency, "
+        "SQL queries and peak memory per view. With --sizes, generated data is "
+        "flushed and reseeded at each size first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='',
+                            help="Comma-separated stock counts to seed and benchmark, e.g. 100,1000,10000")
+        parser.add_argument('--views', default='', help=f"Comma-separated subset of: {', '.join(perf.VIEWS)}")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per view")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests per view")
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--compare', help="JSON file from an earlier run to compare against")
+
+    def _list(self, value, cast=str):
+        try:
+            return [cast(part) for part in value.split(',') if part.strip()]
+        except ValueError:
+            raise CommandError(f"Invalid list '{value}'")
+
+    def handle(self, *args, **options):
+        sizes = self._list(options['sizes'], int)
+        views = self._list(options['views'])
+        unknown = set(views) - set(perf.VIEWS)
+        if unknown:
+            raise CommandError(f"Unknown views: {', '.join(sorted(unknown))}")
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be positive")
+        try:
+            perf.check_database()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as fileobj:
+                    baseline = json.load(fileobj)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        results = {}
+        # The test client sends Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for size in sizes or [None]:
+                if size is not None:
+                    perf.flush()
+                    perf.seed(size)
+                label = str(size if size is not None else Stock.objects.count())
+                self.stdout.write(f"Benchmarking {label} stock items...")
+                results[label] = perf.bench(views, options['repeat'], options['warmup'])
+                self._report(results[label])
+
+        document = {
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fileobj:
+                json.dump(document, fileobj, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        if baseline is not None:
+            self.stdout.write("Change against baseline:")
+            for size, view, metric, before, after, change in perf.compare(baseline, document):
+                line = f"  {size:>8} {view:<14} {metric:<9} {before:>10} -> {after:<10} {change:+.1f}%"
+                self.stdout.write(self.style.WARNING(line) if change > 10 else line)
+
+    def _report(self, views):
+        for view, metrics in views.items():
+            if 'skipped' in metrics:
+                self.stdout.write(f"  {view:<14} skipped: {metrics['skipped']}")
+                continue
+            self.stdout.write(
+                f"  {view:<14} p50 {metrics['p50_ms']:>8.2f}ms  p95 {metrics['p95_ms']:>8.2f}ms  "
+                f"{metrics['queries']:>3} queries  peak {metrics['peak_kib']:>9.1f}KiB  [{metrics['status']}]"
+            )
@@ -0,0 +1,64 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand
+
+from inventorymgmt import images
+from inventorymgmt.caching import invalidate
+from inventorymgmt.models import Stock
+from inventorymgmt.supabase_storage import get_supabase_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Build thumbnail/medium/large JPEG+WebP derivatives for stock images "
+        "that do not have them yet. Safe to interrupt and re-run: finished "
+        "items are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help="Images fetched and rendered per batch")
+        parser.add_argument('--download-workers', type=int, default=8, help="Parallel downloads per batch")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many items")
+
+    def handle(self, *args, **options):
+        storage = get_supabase_storage()
+        pending = Stock.objects.exclude(image__isnull=True).exclude(image='').filter(image_variants={})
+        done = failed = 0
+        last_pk = 0
+
+        with ThreadPoolExecutor(max_workers=options['download_workers']) as downloads:
+            while options['limit'] is None or done + failed < options['limit']:
+                size = options['batch_size']
+                if options['limit'] is not None:
+                    size = min(size, options['limit'] - done - failed)
+                batch = list(pending.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'image')[:size])
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+
+                blobs = list(downloads.map(storage.download, [url for _, url in batch]))
+                fetched = [(pk, url, data) for (pk, url), data in zip(batch, blobs) if data]
+                failed += len(batch) - len(fetched)
+
+                for index, result in images.render_many([data for _, _, data in fetched]):
+                    pk, url, _ = fetched[index]
+                    if isinstance(result, Exception):
+                        self.stderr.write(f"#{pk}: cannot process {url}: {result}")
+                        failed += 1
+                        continue
+                    stem = os.path.splitext(os.path.basename(urlparse(url).path))[0]
+                    try:
+                        variants = images.upload_derivatives(storage, stem, result)
+                    except RuntimeError as e:
+                        self.stderr.write(f"#{pk}: {e}")
+                        failed += 1
+                        continue
+                    Stock.objects.filter(pk=pk).update(image_variants=variants)
+                    done += 1
+
+                self.stdout.write(f"Processed up to #{last_pk}: {done} done, {failed} failed")
+
+        invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Built derivatives for {done} items ({failed} failed)"))
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from inventorymgmt import caching
+
+
+class Command(BaseCommand):
+    help = (
+        "Show hit/miss counters for the shared POS catalog cache. Counts come "
+        "from the Prometheus counters: run with the gunicorn "
+        "PROMETHEUS_MULTIPROC_DIR to see every worker, or read "
+        "inventory_cache_lookups_total from /metrics."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Print the counters as JSON")
+
+    def handle(self, *args, **options):
+        report = caching.stats()
+        if options['json']:
+            self.stdout.write(json.dumps({'version': caching.current_version(), 'entries': report}))
+        else:
+            self.stdout.write(f"Catalog cache version {caching.current_version()}")
+            for name, counters in report.items():
+                self.stdout.write(
+                    f"  {name:<12} hits={counters['hits']:<8} misses={counters['misses']:<8} "
+                    f"hit ratio={counters['hit_ratio']:.1%}"
+                )
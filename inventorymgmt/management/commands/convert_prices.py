@@ -0,0 +1,104 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+
+from inventorymgmt.importers import MAX_PRICE
+from inventorymgmt.models import Stock, StockHistory
+
+# Legacy text columns converted to DecimalField(max_digits=10, decimal_places=2)
+PRICE_COLUMNS = [(Stock, 'price'), (StockHistory, 'price')]
+
+# Currency markers and separators people typed into the old text field
+_NOISE = re.compile(r'(?i)rs\.?|npr|रु\.?|/-|[,\s]')
+
+
+def clean_price(text):
+    """Decimal value of a legacy price string, or None when it holds none"""
+    if text is None:
+        return None
+    text = _NOISE.sub('', str(text))
+    if not text:
+        return None
+    try:
+        price = Decimal(text)
+    except InvalidOperation:
+        return None
+    if not price.is_finite() or price < 0 or price > MAX_PRICE:
+        return None
+    return price.quantize(Decimal('0.01'))
+
+
+def is_numeric(model, field):
+    """Whether the database column of `field` is already a decimal column"""
+    with connection.cursor() as cursor:
+        description = connection.introspection.get_table_description(cursor, model._meta.db_table)
+    for column in description:
+        if column.name == field.column:
+            return connection.introspection.get_field_type(column.type_code, column) == 'DecimalField'
+    return False
+
+
+def legacy_field(model, field):
+    """The CharField the column was declared as before the conversion"""
+    old = models.CharField(max_length=10, blank=field.blank, null=True)
+    old.set_attributes_from_name(field.name)
+    old.model = model
+    return old
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the text price columns of Stock and StockHistory to decimals. "
+        "Values are cleaned first (currency markers and thousands separators "
+        "stripped, unparseable values cleared), then the column type is altered. "
+        "Columns that are already numeric are skipped, so it can be re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows rewritten per statement batch")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing")
+
+    def handle(self, *args, **options):
+        for model, name in PRICE_COLUMNS:
+            field = model._meta.get_field(name)
+            label = f"{model.__name__}.{name}"
+            if is_numeric(model, field):
+                self.stdout.write(f"{label} is already numeric")
+                continue
+
+            table = connection.ops.quote_name(model._meta.db_table)
+            column = connection.ops.quote_name(field.column)
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL")
+                rows = cursor.fetchall()
+
+            updates, cleared = [], []
+            for pk, text in rows:
+                price = clean_price(text)
+                if price is None:
+                    cleared.append(text)
+                if price is None or str(price) != text:
+                    updates.append((None if price is None else str(price), pk))
+
+            self.stdout.write(
+                f"{label}: {len(rows)} priced rows, {len(updates) - len(cleared)} normalised, "
+                f"{len(cleared)} unparseable cleared"
+            )
+            for text in cleared[:10]:
+                self.stdout.write(f"  cleared {text!r}")
+            if options['dry_run']:
+                continue
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                for start in range(0, len(updates), options['batch_size']):
+                    cursor.executemany(
+                        f"UPDATE {table} SET {column} = %s WHERE id = %s",
+                        updates[start:start + options['batch_size']],
+                    )
+            # The text now casts cleanly; the schema editor adds the USING
+            # cast on PostgreSQL and rebuilds the table on SQLite
+            with connection.schema_editor() as editor:
+                editor.alter_field(model, legacy_field(model, field), field)
+            self.stdout.write(self.style.SUCCESS(f"{label} converted to decimal"))
@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventorymgmt.models import StockHistory, StockMovement
+
+
+def to_movement(row, users):
+    """Translate one legacy StockHistory snapshot into a ledger row"""
+    if row.issue_quantity:
+        kind, delta, username = StockMovement.Kind.ISSUE, -row.issue_quantity, row.issue_by
+    elif row.receive_quantity:
+        kind, delta, username = StockMovement.Kind.RECEIVE, row.receive_quantity, row.receive_by
+    else:
+        # Creation / import snapshots: the whole quantity appeared at once
+        kind, delta, username = StockMovement.Kind.CREATE, row.quantity or 0, row.created_by
+    return StockMovement(
+        stock_id=row.stock_id,
+        kind=kind,
+        delta=delta,
+        balance=row.quantity,
+        actor_id=users.get(username),
+        supplier_id=row.supplier_id,
+        party=(row.issue_to or '')[:50],
+        created_at=row.last_updated or row.timestamp,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Move legacy StockHistory rows into the StockMovement ledger. Each "
+        "batch is inserted and deleted in one transaction, so the command can "
+        "be interrupted and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows converted per transaction")
+
+    def handle(self, *args, **options):
+        users = dict(User.objects.values_list('username', 'id'))
+        converted = skipped = 0
+        while True:
+            with transaction.atomic():
+                batch = list(StockHistory.objects.order_by('id')[:options['batch_size']])
+                if not batch:
+                    break
+                # Rows without a stock id or a date cannot be placed in the ledger
+                movements = [to_movement(row, users) for row in batch if row.stock_id and (row.last_updated or row.timestamp)]
+                StockMovement.objects.bulk_create(movements)
+                StockHistory.objects.filter(id__in=[row.id for row in batch]).delete()
+            converted += len(movements)
+            skipped += len(batch) - len(movements)
+            self.stdout.write(f"Converted {converted} rows so far")
+
+        self.stdout.write(self.style.SUCCESS(f"Converted {converted} history rows ({skipped} without stock or date dropped)"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventorymgmt.importers import import_stock
+
+
+class Command(BaseCommand):
+    help = "Bulk import (upsert) stock items from a CSV or XLSX file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to a .csv or .xlsx file")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows per database batch")
+        parser.add_argument('--user', default=None, help="Username recorded as created_by in history")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, 'rb') as fileobj:
+                report = import_stock(fileobj, path, username=options['user'], chunk_size=options['chunk_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for row_number, message in report.errors:
+            self.stderr.write(f"Row {row_number}: {message}")
+        if report.error_count > len(report.errors):
+            self.stderr.write(f"... and {report.error_count - len(report.errors)} more errors")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{report.rows} rows read, {report.imported} items upserted, {report.error_count} errors "
+            f"in {report.elapsed:.2f}s ({report.rows_per_sec:.0f} rows/sec)"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from inventorymgmt.importers import blank_null_keys
+
+
+class Command(BaseCommand):
+    help = (
+        "Store blank brand/category of existing items as '' instead of NULL, so "
+        "imports upsert onto them instead of creating duplicates"
+    )
+
+    def handle(self, *args, **options):
+        updated, duplicates = blank_null_keys()
+        self.stdout.write(self.style.SUCCESS(f"{updated} items normalised"))
+        if duplicates:
+            self.stdout.write(self.style.WARNING(
+                f"{duplicates} items left as they are: an item with the same name and blank "
+                f"brand/category already exists; merge them by hand"
+            ))
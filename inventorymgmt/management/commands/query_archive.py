@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from inventorymgmt.archive import DATASETS, archived_months, query
+
+
+class Command(BaseCommand):
+    help = "Print archived movements or sales (JSON lines), or list archived months"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(DATASETS))
+        parser.add_argument('--from', dest='date_from', help="First day (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='date_to', help="Last day (YYYY-MM-DD)")
+        parser.add_argument('--stock', type=int, default=None, help="Only rows for this stock id")
+        parser.add_argument('--months', action='store_true', help="List the archived months and exit")
+
+    def _parse(self, value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+        return day
+
+    def handle(self, *args, **options):
+        dataset = DATASETS[options['dataset']]
+        if options['months']:
+            for month in archived_months(dataset):
+                self.stdout.write(month)
+            return
+        rows = query(dataset, self._parse(options['date_from']), self._parse(options['date_to']), options['stock'])
+        for row in rows:
+            self.stdout.write(json.dumps(row, ensure_ascii=False))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from inventorymgmt.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill or rebuild the DailySalesSummary rollup from the Sale table. "
+        "Days before the oldest remaining sale are never touched: their sales "
+        "may have been archived (archive_data), and the rollup is then their "
+        "only record."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='date_to', help="Last day to rebuild (YYYY-MM-DD)")
+
+    def _parse(self, value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+        return day
+
+    def handle(self, *args, **options):
+        date_from = self._parse(options['date_from'])
+        date_to = self._parse(options['date_to'])
+        count = rebuild(date_from, date_to)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} daily summary rows"))
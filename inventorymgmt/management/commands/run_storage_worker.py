@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventorymgmt import metrics
+from inventorymgmt.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = "Process queued Supabase storage jobs (image uploads and batched deletes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the due jobs once and exit")
+        parser.add_argument('--batch-size', type=int, default=10, help="Uploads claimed per poll")
+        parser.add_argument('--delete-batch-size', type=int, default=100, help="Objects removed per delete request")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--metrics-port', type=int, default=0,
+                            help="Serve Prometheus metrics (storage latency/failures) on this port; 0 disables")
+
+    def handle(self, *args, **options):
+        server = metrics.serve(options['metrics_port']) if options['metrics_port'] else None
+        try:
+            while True:
+                succeeded, failed = run_pending(limit=options['batch_size'], delete_limit=options['delete_batch_size'])
+                if succeeded or failed:
+                    self.stdout.write(f"Processed {succeeded + failed} jobs: {succeeded} ok, {failed} failed")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            metrics.process_exited()
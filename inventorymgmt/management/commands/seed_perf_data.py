@@ -0,0 +1,44 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from inventorymgmt import perf
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate skewed synthetic stocks, suppliers, brands, movements and sales "
+        f"for benchmarking (rows are tagged '{perf.PERF_PREFIX}' and removed by --flush)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stocks', type=int, default=1000, help="Number of stock items")
+        parser.add_argument('--suppliers', type=int, default=None, help="Default: stocks / 50")
+        parser.add_argument('--brands', type=int, default=None, help="Default: stocks / 20")
+        parser.add_argument('--movements', type=int, default=None, help="Default: stocks * 10")
+        parser.add_argument('--sales', type=int, default=None, help="Default: stocks * 5")
+        parser.add_argument('--days', type=int, default=180, help="Spread movements and sales over this many days")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for repeatable data")
+        parser.add_argument('--flush', action='store_true', help="Remove previously generated rows first")
+
+    def handle(self, *args, **options):
+        if options['stocks'] < 1:
+            raise CommandError("--stocks must be positive")
+        try:
+            perf.check_database()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        if options['flush']:
+            removed = perf.flush()
+            self.stdout.write(f"Removed {removed} generated stock items and their data")
+        counts = perf.seed(
+            options['stocks'],
+            suppliers=options['suppliers'],
+            brands=options['brands'],
+            movements=options['movements'],
+            sales=options['sales'],
+            days=options['days'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Created " + ", ".join(f"{count} {name}" for name, count in counts.items())
+        ))
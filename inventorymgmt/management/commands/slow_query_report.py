@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from inventorymgmt.models import SlowQuery
+from inventorymgmt.slowlog import capture_plan
+
+ORDERINGS = {
+    'total': '-total_ms',
+    'max': '-max_ms',
+    'calls': '-calls',
+    'avg': '-avg',
+}
+
+
+class Command(BaseCommand):
+    help = "Report the slow-query log, worst fingerprints first"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--order', choices=list(ORDERINGS), default='total',
+                            help="Rank by total, max or average time, or by call count")
+        parser.add_argument('--explain', action='store_true',
+                            help="Capture plans for listed fingerprints that have none yet")
+        parser.add_argument('--plans', action='store_true', help="Print each plan under its query")
+        parser.add_argument('--reset', action='store_true', help="Delete the whole log and exit")
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted = SlowQuery.objects.all().delete()[0]
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} slow query fingerprints"))
+            return
+        if options['limit'] < 1:
+            raise CommandError("--limit must be positive")
+
+        queries = SlowQuery.objects.annotate(
+            avg=F('total_ms') / Cast(F('calls'), FloatField())
+        ).order_by(ORDERINGS[options['order']])[:options['limit']]
+        if not queries:
+            self.stdout.write("No slow queries recorded")
+            return
+
+        for rank, query in enumerate(queries, 1):
+            if options['explain'] and not query.plan:
+                capture_plan(query)
+            self.stdout.write(self.style.WARNING(
+                f"#{rank} {query.fingerprint[:12]}  calls {query.calls}  total {query.total_ms:.0f}ms  "
+                f"avg {query.avg_ms:.1f}ms  max {query.max_ms:.1f}ms"
+            ))
+            self.stdout.write(f"  view: {query.view or '-'}   at: {query.call_site or '-'}")
+            self.stdout.write(f"  {query.statement[:400]}")
+            if options['plans'] and query.plan:
+                for line in query.plan.splitlines():
+                    self.stdout.write(f"    {line}")
+            self.stdout.write("")
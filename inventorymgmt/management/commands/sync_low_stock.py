@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventorymgmt.models import LowStockEvent
+from inventorymgmt.services import sync_low_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Stock.low_stock for every item (backfill after deploying, or "
+        "after bulk edits that bypass the stock services)"
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            events = sync_low_stock()
+        low = sum(1 for event in events if event.kind == LowStockEvent.Kind.LOW)
+        self.stdout.write(self.style.SUCCESS(
+            f"{low} items now flagged low, {len(events) - low} recovered"
+        ))
@@ -0,0 +1,139 @@
+"""
+Prometheus metrics.
+
+Request latency and DB time are observed by RequestTimingMiddleware,
+Supabase call latency/failures by the storage client's CallMetrics, and
+sales/movements where they are written (counted when the transaction
+commits). Rates such as sales per minute are derived at query time, e.g.
+`rate(inventory_sales_total[1m]) * 60`.
+
+Under gunicorn every worker is a separate process. When
+PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it up) the client
+library keeps each worker's values in memory-mapped files in that
+directory and `/metrics` adds them up, so any worker can answer a scrape.
+Without it, values are those of the current process (runserver, tests).
+
+Storage calls mostly happen in `run_storage_worker`, which runs outside
+gunicorn (its own Procfile process, often its own container). It serves
+its metrics on `--metrics-port` through `serve()`; scrape that port next to
+`/metrics`. When it shares a host and PROMETHEUS_MULTIPROC_DIR with the web
+workers, its values are also summed into `/metrics`, and it marks itself
+dead on exit like a gunicorn worker.
+"""
+import collections
+import os
+
+from django.db import transaction
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+    start_http_server,
+)
+
+REQUEST_LATENCY = Histogram(
+    'django_request_duration_seconds', "Request latency by URL name",
+    ['view', 'method'],
+)
+REQUESTS = Counter(
+    'django_requests_total', "Responses by URL name and status code",
+    ['view', 'method', 'status'],
+)
+IN_FLIGHT = Gauge(
+    'django_requests_in_flight', "Requests being handled right now",
+    multiprocess_mode='livesum',
+)
+DB_TIME = Histogram(
+    'django_request_db_seconds', "Time spent in SQL per request",
+    ['view'], buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+DB_QUERIES = Counter('django_db_queries_total', "SQL statements executed by requests", ['view'])
+
+STORAGE_LATENCY = Histogram(
+    'supabase_storage_call_seconds', "Supabase storage call latency",
+    ['operation'],
+)
+STORAGE_FAILURES = Counter(
+    'supabase_storage_failures_total', "Failed or refused Supabase storage calls",
+    ['operation'],
+)
+
+SALES = Counter('inventory_sales_total', "Sales recorded")
+SALES_REVENUE = Counter('inventory_sales_revenue_total', "Revenue of recorded sales")
+MOVEMENTS = Counter('inventory_stock_movements_total', "Stock ledger movements recorded", ['kind'])
+CACHE_LOOKUPS = Counter('inventory_cache_lookups_total', "Catalog cache lookups by entry", ['entry', 'result'])
+
+
+def observe_request(view, method, status, seconds, db_seconds, queries):
+    view = view or '<unresolved>'
+    REQUEST_LATENCY.labels(view, method).observe(seconds)
+    REQUESTS.labels(view, method, str(status)).inc()
+    DB_TIME.labels(view).observe(db_seconds)
+    DB_QUERIES.labels(view).inc(queries)
+
+
+def observe_storage(operation, seconds, ok):
+    STORAGE_LATENCY.labels(operation).observe(seconds)
+    if not ok:
+        STORAGE_FAILURES.labels(operation).inc()
+
+
+def count_cache_lookup(entry, hit):
+    CACHE_LOOKUPS.labels(entry, 'hit' if hit else 'miss').inc()
+
+
+def count_sales(sales):
+    """Count sales once the current transaction commits"""
+    count = len(sales)
+    revenue = float(sum(sale.subtotal for sale in sales))
+
+    def inc():
+        SALES.inc(count)
+        SALES_REVENUE.inc(revenue)
+
+    transaction.on_commit(inc)
+
+
+def count_movements(kinds):
+    """Count movements (an iterable of StockMovement kinds) on commit"""
+    from .models import StockMovement
+    counts = collections.Counter(StockMovement.Kind(kind).label for kind in kinds)
+
+    def inc():
+        for label, count in counts.items():
+            MOVEMENTS.labels(label).inc(count)
+
+    transaction.on_commit(inc)
+
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def samples(name):
+    """{labels: value} for the samples called `name`, summed across workers"""
+    return {
+        tuple(sorted(sample.labels.items())): sample.value
+        for family in _registry().collect()
+        for sample in family.samples
+        if sample.name == name
+    }
+
+
+def exposition():
+    """(body, content type) for a scrape, summed across worker processes"""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def serve(port, addr='0.0.0.0'):
+    """Serve metrics over HTTP from a process outside gunicorn; returns the server"""
+    server, _ = start_http_server(port, addr, registry=_registry())
+    return server
+
+
+def process_exited(pid=None):
+    """Drop an exited process's live gauges from the multiprocess files"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid or os.getpid())
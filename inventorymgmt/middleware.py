@@ -0,0 +1,172 @@
+"""
+Per-request SQL and timing instrumentation.
+
+RequestTimingMiddleware wraps every query of the request with
+`connection.execute_wrapper` and records how many queries ran, how long
+they took and which ones repeated. The totals go out as a `Server-Timing`
+header (visible in the browser's network panel) and as one JSON log line
+on the `inventorymgmt.requests` logger, and are fed to the Prometheus
+metrics (latency per URL name, in-flight requests, DB time).
+
+Statements slower than SLOW_QUERY_MS go to the slow-query log
+(slowlog.py).
+
+The same SQL issued QUERY_REPEAT_THRESHOLD times or more in one request is
+almost always a loop doing one query per row (N+1); such requests are
+logged at WARNING with the offending statement.
+
+Queries made while a streaming response is consumed happen after the
+middleware returns and are not counted.
+
+ProfilingMiddleware (opt-in, see profiling.py) keeps cProfile or sampled
+stack profiles of a fraction of requests and of every slow one.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, profiling, slowlog
+
+logger = logging.getLogger('inventorymgmt.requests')
+
+
+class QueryRecorder:
+    """execute_wrapper callable that times and remembers each statement"""
+
+    def __init__(self, slow_seconds=None):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.exact = Counter()
+        self.slow_seconds = slow_seconds
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.seconds += elapsed
+            self.count += 1
+            if self.slow_seconds is not None and elapsed >= self.slow_seconds:
+                self.slow.append(slowlog.capture(sql, params, elapsed))
+            # `sql` still has placeholders, so it identifies the statement
+            # shape; with the parameters it identifies an exact repeat
+            self.statements[sql] += 1
+            self.exact[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        """Queries that repeated an earlier one with identical parameters"""
+        return sum(count - 1 for count in self.exact.values())
+
+    def most_repeated(self):
+        """(sql, count) of the statement issued most often, or (None, 0)"""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+def repeat_threshold():
+    return getattr(settings, 'QUERY_REPEAT_THRESHOLD', 10)
+
+
+class RequestTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder(slowlog.threshold_seconds())
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            stack.enter_context(metrics.IN_FLIGHT.track_inprogress())
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        view = getattr(request.resolver_match, 'view_name', None)
+        metrics.observe_request(view, request.method, response.status_code, total, recorder.seconds, recorder.count)
+        if recorder.slow:
+            try:
+                slowlog.submit(recorder.slow, view)
+            except Exception:
+                logger.exception("Could not queue slow queries")
+
+        sql, repeats = recorder.most_repeated()
+        n_plus_one = repeats >= repeat_threshold()
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"',
+                f'app;dur={(total - recorder.seconds) * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(recorder.seconds * 1000, 1),
+            'queries': recorder.count,
+            'duplicate_queries': recorder.duplicates,
+            'max_repeats': repeats,
+        }
+        if n_plus_one:
+            record['repeated_sql'] = sql[:500]
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+        return response
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0.01)
+        self.slow_seconds = getattr(settings, 'PROFILE_SLOW_MS', 1000) / 1000
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        if random.random() < self.sample_rate:
+            response, profiler = profiling.profiled_call(self.get_response, request)
+            duration = time.perf_counter() - started
+            if profiler is None:
+                return response
+            kind, functions = 'cprofile', profiling.summarize_cprofile(profiler)
+        else:
+            sampler = profiling.get_sampler()
+            ident = threading.get_ident()
+            sampler.start(ident)
+            try:
+                response = self.get_response(request)
+            finally:
+                stacks = sampler.stop(ident)
+            duration = time.perf_counter() - started
+            if duration < self.slow_seconds or not stacks:
+                return response
+            kind, functions = 'sampled', profiling.summarize_samples(stacks, sampler.interval)
+
+        profiling.save({
+            'kind': kind,
+            'method': request.method,
+            'path': request.get_full_path()[:300],
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'created': time.time(),
+            'functions': functions,
+        })
+        return response
@@ -1,22 +1,103 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+import copy
 import os
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from suppliers.models import Supplier
-from .utils import compress_image
 
-# Supabase import (conditional to avoid import errors during development)
-try:
-    from .supabase_storage import SupabaseStorage
-except ImportError:
-    SupabaseStorage = None
+class DirtyFieldsMixin:
+	"""
+	Remember each concrete field's value as loaded from the database, so
+	changes can be detected without re-reading the row.
+	
+	`save()` on a loaded instance writes only the changed columns (plus any
+	auto_now fields, and fields deferred at load time but assigned since)
+	through `update_fields`. If that UPDATE matches no row and the row is
+	gone (deleted meanwhile), `_do_update` reports it instead of letting
+	Django raise, and save() follows up with an insert, as a plain save()
+	would. Callers that pass their own `update_fields` are left alone.
+	"""
+	
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		instance._snapshot_fields()
+		return instance
+	
+	def _snapshot_fields(self, fields=None):
+		loaded = self.__dict__
+		if fields is None or not hasattr(self, '_loaded_values'):
+			self._loaded_values = {}
+		else:
+			fields = {self._meta.get_field(name).attname for name in fields}
+		for field in self._meta.concrete_fields:
+			if field.attname in loaded and (fields is None or field.attname in fields):
+				value = loaded[field.attname]
+				# Only containers (JSONField) can be mutated in place
+				self._loaded_values[field.attname] = copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+	
+	@property
+	def is_tracked(self):
+		return hasattr(self, '_loaded_values')
+	
+	def loaded_value(self, attname):
+		"""Value of `attname` when the row was loaded (KeyError if unknown)"""
+		return self._loaded_values[attname]
+	
+	def get_dirty_fields(self):
+		"""{attname: loaded value} for every loaded field that has changed"""
+		if not self.is_tracked:
+			return {}
+		return {
+			attname: old for attname, old in self._loaded_values.items()
+			if attname in self.__dict__ and self.__dict__[attname] != old
+		}
+	
+	def save(self, *args, **kwargs):
+		partial = self.is_tracked and self.pk is not None and not self._state.adding \
+			and kwargs.get('update_fields') is None and not kwargs.get('force_insert')
+		if partial:
+			fields = {self._meta.get_field(attname).name for attname in self.get_dirty_fields()}
+			for field in self._meta.concrete_fields:
+				if getattr(field, 'auto_now', False):
+					fields.add(field.name)
+				# Deferred by only()/defer() and assigned afterwards: not tracked, still written
+				elif field.attname in self.__dict__ and field.attname not in self._loaded_values:
+					fields.add(field.name)
+			kwargs['update_fields'] = fields
+		self._partial_save, self._row_missing = partial, False
+		try:
+			super().save(*args, **kwargs)
+		finally:
+			self._partial_save = False
+		if self._row_missing:
+			self._row_missing = False
+			kwargs.pop('update_fields')
+			super().save(*args, force_insert=True, **kwargs)
+		self._snapshot_fields()
+	
+	def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update, *args, **kwargs):
+		updated = super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update, *args, **kwargs)
+		if not updated and getattr(self, '_partial_save', False) and not base_qs.filter(pk=pk_val).exists():
+			# Nothing to update: count it as done and let save() insert the row
+			self._row_missing = True
+			return True
+		return updated
+	
+	def refresh_from_db(self, using=None, fields=None, **kwargs):
+		super().refresh_from_db(using=using, fields=fields, **kwargs)
+		self._snapshot_fields(fields)
+
 
-class Stock(models.Model):
+class Stock(DirtyFieldsMixin, models.Model):
 	item_name = models.CharField(max_length=50, blank=False, null=False, db_index=True)
 	quantity = models.IntegerField(default='0', blank=False, null=False)
 	category = models.CharField(max_length=50, blank=True, null=True, db_index=True)
 	brand = models.CharField(max_length=50,  blank=True, null=True, db_index=True)
-	price = models.CharField(max_length=10, blank=False, null=True)
+	price = models.DecimalField(max_digits=10, decimal_places=2, blank=False, null=True)
 	receive_quantity = models.IntegerField(default='0', blank=True, null=True)
 	receive_by = models.CharField(max_length=50, blank=True, null=True)
 	issue_quantity = models.IntegerField(default='0', blank=True, null=True)
@@ -27,9 +108,13 @@ class Stock(models.Model):
 	timestamp = models.DateTimeField(auto_now_add=True, auto_now=False)
 	last_updated = models.DateTimeField(auto_now_add=False, auto_now=True)
 	image = models.URLField(max_length=500, blank=True, null=True, help_text="Supabase CDN URL for product image")
+	# {'thumb'|'medium'|'large': {'width': px, 'jpeg': url, 'webp': url}}
+	image_variants = models.JSONField(default=dict, blank=True)
 	export_to_CSV = models.BooleanField(default=False)
 	supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, blank=True, null=True, related_name='stocks')
 	added_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='added_stocks', help_text="User who added this stock item")
+	# quantity <= reorder_level, kept in step by services.sync_low_stock
+	low_stock = models.BooleanField(default=False, editable=False)
 	
 	class Meta: 
 		constraints = [
@@ -38,18 +123,52 @@ class Stock(models.Model):
 				name='unique_stock'
 			)
 		]
+		indexes = [
+			# Only the few low items are indexed; serves the low-stock feed
+			models.Index(fields=['quantity'], condition=models.Q(low_stock=True), name='stock_low_stock_idx'),
+		]
 	
 	def __str__(self):
 		return self.item_name
+	
+	def save(self, *args, **kwargs):
+		# Blank brand/category are '' on every path (forms, admin, import), so
+		# the importer's upsert on unique_stock matches rows created here
+		self.brand = self.brand or ''
+		self.category = self.category or ''
+		super().save(*args, **kwargs)
+	
+	def _srcset(self, fmt):
+		variants = sorted(self.image_variants.values(), key=lambda v: v['width'])
+		return ', '.join(f"{v[fmt]} {v['width']}w" for v in variants)
+	
+	@property
+	def image_srcset(self):
+		"""JPEG `srcset` over all derivatives, '' until they are built"""
+		return self._srcset('jpeg') if self.image_variants else ''
+	
+	@property
+	def image_webp_srcset(self):
+		return self._srcset('webp') if self.image_variants else ''
+	
+	@property
+	def thumbnail_url(self):
+		"""Smallest rendition, falling back to the original image"""
+		return self.image_variants.get('thumb', {}).get('jpeg') or self.image
 
 
 class StockHistory(models.Model):
+    """
+    Legacy denormalised history (a copy of the Stock row per change).
+    Superseded by StockMovement; `manage.py convert_stock_history` moves the
+    remaining rows over.
+    """
     stock_id = models.IntegerField(blank=True, null=True)  
     item_name = models.CharField(max_length=50,blank=True, null=True)
     quantity = models.IntegerField(default='0', blank=True, null=True)
     category = models.CharField(max_length=50, blank=True, null=True)
     brand = models.CharField(max_length=50, blank=True, null=True)
-    price = models.CharField(max_length=10, blank=True, null=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     receive_quantity = models.IntegerField(blank=True, null=True)
     receive_by = models.CharField(max_length=50, blank=True, null=True)
     issue_quantity = models.IntegerField(blank=True, null=True)
@@ -61,23 +180,72 @@ class StockHistory(models.Model):
     last_updated = models.DateTimeField(blank=True, null=True)
     supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, blank=True, null=True, related_name='stock_histories')
 
+    class Meta:
+        indexes = [
+            # Keyset pagination in list_history
+            models.Index(fields=['-last_updated', '-id']),
+            models.Index(fields=['stock_id', '-last_updated']),
+        ]
 
 
 
 
+
+class StockMovement(models.Model):
+	"""
+	Append-only stock ledger: one narrow row per quantity change. Item
+	names, brands etc. are joined from Stock rather than copied.
+	"""
+	class Kind(models.IntegerChoices):
+		CREATE = 1, 'Created'
+		RECEIVE = 2, 'Received'
+		ISSUE = 3, 'Issued'
+		SALE = 4, 'Sold'
+		SALE_REVERSAL = 5, 'Sale reversed'
+		IMPORT = 6, 'Imported'
+		ADJUST = 7, 'Adjusted'
+	
+	# No FK constraint: the ledger outlives deleted stock, like StockHistory did
+	stock = models.ForeignKey(Stock, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='movements')
+	kind = models.PositiveSmallIntegerField(choices=Kind.choices)
+	# Signed change in units; `balance` is the quantity after it, when known
+	delta = models.IntegerField()
+	balance = models.IntegerField(null=True, blank=True)
+	actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+	supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+	sale = models.ForeignKey('Sale', on_delete=models.SET_NULL, null=True, blank=True, related_name='movements')
+	# Who the goods were issued to
+	party = models.CharField(max_length=50, blank=True, default='')
+	created_at = models.DateTimeField(default=timezone.now)
+	
+	class Meta:
+		indexes = [
+			# Keyset pagination in list_history
+			models.Index(fields=['-created_at', '-id']),
+			# Per-item history
+			models.Index(fields=['stock', '-created_at']),
+		]
+	
+	def __str__(self):
+		return f"{self.get_kind_display()} {self.delta:+d} #{self.stock_id}"
+	
+	@property
+	def received(self):
+		return self.delta if self.delta > 0 else 0
+	
+	@property
+	def issued(self):
+		return -self.delta if self.delta < 0 else 0
+
+
 def auto_delete_file_on_delete(sender, instance, **kwargs):
     """
-    Deletes image from Supabase when corresponding `Stock` object is deleted.
+    Queues the Supabase image (and its derivatives) of a deleted `Stock`
+    for removal once the delete commits.
     """
-    if instance.image and SupabaseStorage:
-        # Extract filename from Supabase URL
-        try:
-            supabase = SupabaseStorage()
-            # Get filename from URL (last part after /)
-            filename = instance.image.split('/')[-1]
-            supabase.delete_image(filename)
-        except Exception as e:
-            print(f"Error deleting image from Supabase: {e}")
+    if instance.image:
+        from .jobs import image_object_names, queue_deletes
+        queue_deletes(image_object_names(instance.image, instance.image_variants))
 
 # Connect the function to post_delete signal
 @receiver(models.signals.post_delete, sender=Stock)
@@ -88,26 +256,31 @@ def auto_delete_file_on_delete_handler(sender, instance, **kwargs):
 @receiver(models.signals.pre_save, sender=Stock)
 def auto_delete_file_on_change(sender, instance, **kwargs):
     """
-    Deletes old file from Supabase when `Stock` object is updated with new file.
+    Queues the old Supabase file for removal when `Stock` is saved with a
+    new one. Nothing is deleted unless the save commits.
     """
-    if not instance.pk or not SupabaseStorage:
+    if not instance.pk:
         return False
 
-    try:
-        old_instance = Stock.objects.get(pk=instance.pk)
-        old_image = old_instance.image
-    except Stock.DoesNotExist:
-        return False
+    if instance.is_tracked:
+        # Loaded from the database: compare against the load-time snapshot
+        if 'image' not in instance.get_dirty_fields():
+            return False
+        old_image = instance.loaded_value('image')
+        old_variants = instance.loaded_value('image_variants')
+    else:
+        # Built by hand with a pk; only the database knows the old value
+        old = Stock.objects.filter(pk=instance.pk).values('image', 'image_variants').first()
+        if old is None:
+            return False
+        old_image, old_variants = old['image'], old['image_variants']
 
-    new_image = instance.image
-    if old_image and old_image != new_image:
-        try:
-            supabase = SupabaseStorage()
-            # Get filename from Supabase URL
-            filename = old_image.split('/')[-1]
-            supabase.delete_image(filename)
-        except Exception as e:
-            print(f"Error deleting old image from Supabase: {e}")
+    if old_image and old_image != instance.image:
+        from .jobs import image_object_names, queue_deletes
+        names = set(image_object_names(old_image, old_variants))
+        # Keep anything the new image still points at
+        names -= set(image_object_names(instance.image, instance.image_variants))
+        queue_deletes(sorted(names))
 
 class Sale(models.Model):
 	"""Model to track individual sales transactions"""
@@ -123,7 +296,10 @@ class Sale(models.Model):
 		ordering = ['-sale_date']
 		indexes = [
 			models.Index(fields=['-sale_date']),
-			models.Index(fields=['stock']),
+			# Keyset pagination in sales_list
+			models.Index(fields=['-sale_date', '-id']),
+			# An item's recent sales (stock_details); also serves stock_id lookups
+			models.Index(fields=['stock', '-sale_date']),
 		]
 	
 	def __str__(self):
@@ -134,10 +310,153 @@ class Sale(models.Model):
 		if not self.subtotal:
 			self.subtotal = self.quantity_sold * self.selling_price
 		
-		# Check if this is a new sale (not updating existing)
-		if not self.pk:
-			# Auto-update stock when sale is created
-			self.stock.quantity -= self.quantity_sold
-			self.stock.save()
+		# Existing sales are plain updates; stock only moves on creation
+		if self.pk:
+			return super().save(*args, **kwargs)
 		
-		super().save(*args, **kwargs)
\ No newline at end of file
+		from .services import sell_stock
+		from .rollups import add_sales
+		from .metrics import count_movements, count_sales
+		with transaction.atomic():
+			balance = sell_stock(self.stock_id, self.quantity_sold)
+			super().save(*args, **kwargs)
+			StockMovement.objects.create(
+				stock_id=self.stock_id,
+				kind=StockMovement.Kind.SALE,
+				delta=-self.quantity_sold,
+				# Sales only carry the cashier's username
+				actor=User.objects.filter(username=self.sold_by).first() if self.sold_by else None,
+				balance=balance,
+				sale=self,
+			)
+			add_sales([self])
+			count_sales([self])
+			count_movements([StockMovement.Kind.SALE])
+
+
+class DailySalesSummary(models.Model):
+	"""Per day, per item, per cashier sales totals, maintained as sales are made"""
+	day = models.DateField()
+	# No FK constraint; rows of deleted stock are folded into the NULL rows
+	# by rollups.fold_deleted_stock, matching Sale.stock being set to NULL
+	stock = models.ForeignKey(Stock, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+	sold_by = models.CharField(max_length=50, blank=True, default='')
+	quantity = models.IntegerField(default=0)
+	revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+	sales_count = models.IntegerField(default=0)
+	
+	class Meta:
+		constraints = [
+			# COALESCE so sales of deleted items (stock NULL) share one row per
+			# day and cashier; rollups._upsert names the same conflict target
+			models.UniqueConstraint(
+				F('day'), Coalesce('stock', Value(0)), F('sold_by'),
+				name='unique_daily_sales_summary'
+			)
+		]
+		indexes = [
+			models.Index(fields=['day']),
+		]
+	
+	def __str__(self):
+		return f"{self.day} #{self.stock_id} {self.sold_by}: {self.quantity}"
+
+
+class StorageJob(models.Model):
+	"""Queued object-storage work, run by `manage.py run_storage_worker`"""
+	UPLOAD = 'upload'
+	DELETE = 'delete'
+	KIND_CHOICES = [
+		(UPLOAD, 'Upload image'),
+		(DELETE, 'Delete object'),
+	]
+	PENDING = 'pending'
+	RUNNING = 'running'
+	DONE = 'done'
+	FAILED = 'failed'
+	STATUS_CHOICES = [
+		(PENDING, 'Pending'),
+		(RUNNING, 'Running'),
+		(DONE, 'Done'),
+		(FAILED, 'Failed'),
+	]
+	
+	kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=UPLOAD)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+	stock = models.ForeignKey(Stock, on_delete=models.SET_NULL, null=True, blank=True, related_name='storage_jobs')
+	# Image bytes waiting to be uploaded (cleared once sent), and the name in
+	# the bucket; `path` is only set on jobs queued from a local stash file
+	payload = models.BinaryField(null=True, blank=True)
+	path = models.CharField(max_length=500, blank=True, default='')
+	filename = models.CharField(max_length=300)
+	attempts = models.IntegerField(default=0)
+	last_error = models.TextField(blank=True, default='')
+	run_after = models.DateTimeField(default=timezone.now)
+	locked_at = models.DateTimeField(null=True, blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	
+	class Meta:
+		indexes = [
+			# Worker polling: next due pending jobs
+			models.Index(fields=['status', 'run_after']),
+		]
+	
+	def __str__(self):
+		return f"{self.kind} {self.filename} ({self.status})"
+
+
+class SlowQuery(models.Model):
+	"""
+	SQL statements slower than SLOW_QUERY_MS, aggregated by fingerprint
+	(see slowlog.py). Read with `manage.py slow_query_report`.
+	"""
+	fingerprint = models.CharField(max_length=40, unique=True)
+	# Normalised statement; literals and placeholders replaced by '?'
+	statement = models.TextField()
+	# Last SQL seen (quoted literals masked) and the JSON list of its
+	# parameter types; values are never stored (see slowlog.py)
+	example_sql = models.TextField()
+	example_params = models.TextField(blank=True, default='[]')
+	view = models.CharField(max_length=200, blank=True, default='')
+	call_site = models.CharField(max_length=300, blank=True, default='')
+	calls = models.PositiveIntegerField(default=0)
+	total_ms = models.FloatField(default=0)
+	max_ms = models.FloatField(default=0)
+	last_ms = models.FloatField(default=0)
+	plan = models.TextField(blank=True, default='')
+	plan_captured_at = models.DateTimeField(null=True, blank=True)
+	first_seen = models.DateTimeField(default=timezone.now)
+	last_seen = models.DateTimeField(default=timezone.now)
+	
+	class Meta:
+		indexes = [
+			models.Index(fields=['-total_ms']),
+		]
+	
+	@property
+	def avg_ms(self):
+		return self.total_ms / self.calls if self.calls else 0.0
+	
+	def __str__(self):
+		return f"{self.fingerprint[:12]} x{self.calls} ({self.total_ms:.0f} ms)"
+
+
+class LowStockEvent(models.Model):
+	"""
+	An item crossing its reorder level, in either direction. Written only
+	when Stock.low_stock flips, so consumers read new events by id instead
+	of rescanning the catalog.
+	"""
+	class Kind(models.IntegerChoices):
+		LOW = 1, 'Fell to reorder level'
+		RECOVERED = 2, 'Back above reorder level'
+	
+	stock = models.ForeignKey(Stock, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='low_stock_events')
+	kind = models.PositiveSmallIntegerField(choices=Kind.choices)
+	quantity = models.IntegerField()
+	reorder_level = models.IntegerField(null=True)
+	created_at = models.DateTimeField(default=timezone.now)
+	
+	def __str__(self):
+		return f"{self.get_kind_display()}: stock {self.stock_id} at {self.quantity}"
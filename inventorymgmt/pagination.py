@@ -0,0 +1,150 @@
+"""
+Keyset (cursor) pagination.
+
+Django's Paginator needs a COUNT(*) over the whole filtered table and an
+OFFSET scan that grows with the page number. CursorPaginator instead seeks
+directly past the last row shown using an index-friendly WHERE clause on
+(key, id), so every page costs the same however deep you go. Page positions
+are carried in opaque URL-safe tokens.
+"""
+import base64
+import json
+
+from django.db import connection
+from django.db.models import F
+from django.db.models.fields.tuple_lookups import TupleGreaterThan, TupleLessThan
+from django.utils.dateparse import parse_datetime
+
+
+def _encode(direction, key_value, pk):
+    payload = json.dumps([direction, key_value.isoformat() if key_value else None, pk])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _decode(token):
+    """Return (direction, key_value, pk) or None for a missing/garbled token"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, key_value, pk = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev') or not isinstance(pk, int):
+            return None
+        if key_value is not None:
+            key_value = parse_datetime(key_value)
+            if key_value is None:
+                return None
+        return direction, key_value, pk
+    except (ValueError, TypeError):
+        return None
+
+
+def estimate_count(queryset):
+    """
+    Row count estimate from the query planner (PostgreSQL), which costs a
+    plan rather than a scan. Other databases fall back to an exact count.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CursorPage:
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_cursor(self):
+        if self.has_next:
+            last = self.object_list[-1]
+            return _encode('next', getattr(last, self.paginator.key), last.pk)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous:
+            first = self.object_list[0]
+            return _encode('prev', getattr(first, self.paginator.key), first.pk)
+        return None
+
+
+class CursorPaginator:
+    """
+    Paginate `queryset` newest-first on (`key`, id).
+
+    `key` must be a NOT NULL column with an index on (key DESC, id DESC), so
+    both the ORDER BY and the row-value seek `(key, id) < (value, pk)` are
+    answered by walking that index.
+
+    `count_mode` controls the total shown alongside the page: None skips it,
+    'estimate' asks the planner (see estimate_count) and 'exact' runs COUNT(*).
+    """
+
+    def __init__(self, queryset, per_page, key, count_mode=None):
+        if queryset.model._meta.get_field(key).null:
+            raise ValueError(f"CursorPaginator key {key!r} must be NOT NULL")
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key = key
+        self.count_mode = count_mode
+        self._count = None
+
+    @property
+    def count(self):
+        if self.count_mode is None:
+            return None
+        if self._count is None:
+            if self.count_mode == 'estimate':
+                self._count = estimate_count(self.queryset)
+            else:
+                self._count = self.queryset.count()
+        return self._count
+
+    def _columns(self):
+        return (F(self.key), F('pk'))
+
+    def get_page(self, token):
+        cursor = _decode(token)
+        if cursor is None or cursor[1] is None:
+            rows = list(self.queryset.order_by(f'-{self.key}', '-pk')[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            return CursorPage(rows[:self.per_page], self, has_next, False)
+
+        direction, key_value, pk = cursor
+        page = self._seek(direction, key_value, pk)
+        if not page.object_list:
+            # Stale cursor (rows deleted since); start over from the top
+            return self.get_page(None)
+        return page
+
+    def _seek(self, direction, key_value, pk):
+        if direction == 'next':
+            after = TupleLessThan(self._columns(), (key_value, pk))
+            rows = list(self.queryset.filter(after).order_by(f'-{self.key}', '-pk')[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            return CursorPage(rows[:self.per_page], self, has_next, True)
+
+        before = TupleGreaterThan(self._columns(), (key_value, pk))
+        rows = list(self.queryset.filter(before).order_by(self.key, 'pk')[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return CursorPage(rows, self, True, has_previous)
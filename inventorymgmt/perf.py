@@ -0,0 +1,281 @@
+"""
+Synthetic data and view benchmarks.
+
+`manage.py seed_perf_data` fills the database with stocks, suppliers,
+brands, movements and sales whose popularity follows a Zipf-like skew (a
+few items get most of the traffic, as in a real shop). Every generated
+row is tagged with PERF_PREFIX so `flush()` can remove exactly those rows
+again, and the daily sales rollup is only touched for those rows (days
+whose sales were archived keep their totals). Both refuse to run unless
+DEBUG or PERF_ALLOW_DATABASE is on.
+
+`manage.py bench_views` drives the main views through the Django test
+client and reports p50/p95 latency, SQL query count and peak Python memory
+per view, optionally at several data sizes, as JSON that later runs can be
+compared against.
+"""
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from suppliers.models import Brand, Supplier
+
+from . import caching
+from .models import DailySalesSummary, LowStockEvent, Sale, Stock, StockMovement
+from .rollups import add_sales
+from .services import sync_low_stock
+
+PERF_PREFIX = 'perf-'
+BENCH_USER = f'{PERF_PREFIX}bench'
+
+CATEGORIES = [
+    'Cables', 'Chargers', 'Storage', 'Peripherals', 'Audio', 'Networking',
+    'Stationery', 'Lighting', 'Tools', 'Batteries', 'Displays', 'Cleaning',
+]
+CASHIERS = [f'{PERF_PREFIX}cashier-{n}' for n in range(1, 6)]
+BATCH = 1000
+
+
+def _zipf_weights(count, exponent=1.1):
+    """Cumulative weights where rank r is picked with probability ~ 1/r^s"""
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def _pick(rng, population, cum_weights, k):
+    return rng.choices(population, cum_weights=cum_weights, k=k)
+
+
+def check_database():
+    """Refuse to write generated data outside development or a bench database"""
+    if not (settings.DEBUG or getattr(settings, 'PERF_ALLOW_DATABASE', False)):
+        raise ImproperlyConfigured(
+            "Generated benchmark data is only written with DEBUG on or PERF_ALLOW_DATABASE=true "
+            "(a dedicated benchmark database)"
+        )
+
+
+def flush():
+    """Delete every row created by seed(); returns the number of stocks removed"""
+    check_database()
+    stocks = Stock.objects.filter(item_name__startswith=PERF_PREFIX)
+    stock_ids = list(stocks.values_list('id', flat=True))
+    with transaction.atomic():
+        Sale.objects.filter(sold_by__startswith=PERF_PREFIX).delete()
+        # Generated sales (and bench add_sale requests) are all by perf- users
+        DailySalesSummary.objects.filter(sold_by__startswith=PERF_PREFIX).delete()
+        for start in range(0, len(stock_ids), BATCH):
+            StockMovement.objects.filter(stock_id__in=stock_ids[start:start + BATCH]).delete()
+            LowStockEvent.objects.filter(stock_id__in=stock_ids[start:start + BATCH]).delete()
+        stocks.delete()
+        Supplier.objects.filter(name__startswith=PERF_PREFIX).delete()
+        Brand.objects.filter(name__startswith=PERF_PREFIX).delete()
+        User.objects.filter(username=BENCH_USER).delete()
+    caching.invalidate()
+    return len(stock_ids)
+
+
+def seed(stocks, suppliers=None, brands=None, movements=None, sales=None, days=180, seed=0):
+    """
+    Create `stocks` items plus suppliers, brands, movements and sales (by
+    default scaled from `stocks`). Items are ranked by popularity so
+    movements and sales concentrate on the first few. Returns the counts
+    created.
+    """
+    check_database()
+    rng = random.Random(seed)
+    suppliers = suppliers if suppliers is not None else max(stocks // 50, 5)
+    brands = brands if brands is not None else max(stocks // 20, 5)
+    movements = movements if movements is not None else stocks * 10
+    sales = sales if sales is not None else stocks * 5
+    now = timezone.now()
+
+    def moment():
+        # Recent days are busier than old ones
+        return now - timedelta(days=days * rng.random() ** 2, seconds=rng.randrange(86400))
+
+    brand_rows = Brand.objects.bulk_create(
+        [Brand(name=f'{PERF_PREFIX}brand-{n}') for n in range(brands)], batch_size=BATCH
+    )
+    supplier_rows = Supplier.objects.bulk_create([
+        Supplier(name=f'{PERF_PREFIX}supplier-{n}', phone_number=f'98{n:08d}')
+        for n in range(suppliers)
+    ], batch_size=BATCH)
+    Supplier.brands.through.objects.bulk_create([
+        Supplier.brands.through(supplier_id=supplier.id, brand_id=brand.id)
+        for supplier in supplier_rows
+        for brand in rng.sample(brand_rows, min(3, len(brand_rows)))
+    ], batch_size=BATCH)
+
+    brand_weights = _zipf_weights(len(brand_rows))
+    stock_rows = Stock.objects.bulk_create([
+        Stock(
+            item_name=f'{PERF_PREFIX}{CATEGORIES[n % len(CATEGORIES)].lower()}-{n}',
+            category=CATEGORIES[n % len(CATEGORIES)],
+            brand=_pick(rng, brand_rows, brand_weights, 1)[0].name,
+            quantity=rng.randint(1000, 100000),
+            price=Decimal(rng.choice([5, 20, 49, 120, 350, 999, 2500])),
+            reorder_level=rng.choice([0, 5, 10, 25]),
+            supplier=rng.choice(supplier_rows),
+        )
+        for n in range(stocks)
+    ], batch_size=BATCH)
+    stock_weights = _zipf_weights(len(stock_rows))
+
+    history = [
+        StockMovement(stock_id=stock.id, kind=StockMovement.Kind.CREATE, delta=stock.quantity,
+                      balance=stock.quantity, created_at=now - timedelta(days=days + 1))
+        for stock in stock_rows
+    ]
+    for stock in _pick(rng, stock_rows, stock_weights, movements):
+        if rng.random() < 0.6:
+            history.append(StockMovement(stock_id=stock.id, kind=StockMovement.Kind.ISSUE,
+                                         delta=-rng.randint(1, 20), party=rng.choice(['Lab', 'Office', 'Store']),
+                                         created_at=moment()))
+        else:
+            history.append(StockMovement(stock_id=stock.id, kind=StockMovement.Kind.RECEIVE,
+                                         delta=rng.randint(10, 200), supplier_id=stock.supplier_id,
+                                         created_at=moment()))
+    StockMovement.objects.bulk_create(history, batch_size=BATCH)
+
+    sale_rows = []
+    for stock in _pick(rng, stock_rows, stock_weights, sales):
+        quantity = rng.choice([1, 1, 1, 2, 2, 3, 5])
+        price = stock.price
+        sale_rows.append(Sale(stock_id=stock.id, quantity_sold=quantity, selling_price=price,
+                              subtotal=price * quantity, sold_by=rng.choice(CASHIERS)))
+    # bulk_create bypasses Sale.save (no stock/ledger side effects) but
+    # stamps auto_now_add, so the spread of dates is applied afterwards
+    sale_rows = Sale.objects.bulk_create(sale_rows, batch_size=BATCH)
+    for sale in sale_rows:
+        sale.sale_date = moment()
+    Sale.objects.bulk_update(sale_rows, ['sale_date'], batch_size=BATCH)
+    # Count only the generated sales into the rollup
+    for start in range(0, len(sale_rows), BATCH):
+        add_sales(sale_rows[start:start + BATCH])
+
+    sync_low_stock()
+    caching.invalidate()
+    return {
+        'stocks': len(stock_rows), 'suppliers': len(supplier_rows), 'brands': len(brand_rows),
+        'movements': len(history), 'sales': len(sale_rows),
+    }
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, round(percent / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _consume(response):
+    """Read the whole body so streamed exports are timed end to end"""
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+
+
+def _sale_payload():
+    stock = Stock.objects.filter(item_name__startswith=PERF_PREFIX).order_by('id').first()
+    if stock is None:
+        return None
+    return {'stock': stock.id, 'quantity_sold': 1, 'selling_price': stock.price}
+
+
+# name -> (method, url name, payload factory or None)
+VIEWS = {
+    'list_items': ('get', 'list_items', None),
+    'list_history': ('get', 'list_history', None),
+    'pos_page': ('get', 'pos_page', None),
+    'sales_list': ('get', 'sales_list', None),
+    'export_to_csv': ('get', 'export_to_csv', None),
+    'add_sale': ('post', 'add_sale', _sale_payload),
+}
+
+
+def bench_view(client, name, repeat=20, warmup=2):
+    """
+    Time `repeat` requests to one view after `warmup` untimed ones. Query
+    count comes from the last timed request and peak memory from one extra
+    traced request, so tracing does not skew the latencies.
+    """
+    method, url_name, payload = VIEWS[name]
+    data = payload() if payload else None
+    if payload and data is None:
+        return {'skipped': 'no generated stock to sell'}
+    request = getattr(client, method)
+    url = reverse(url_name)
+
+    for _ in range(warmup):
+        _consume(request(url, data))
+
+    timings = []
+    for _ in range(repeat):
+        # The query log is a bounded deque; start empty so counts stay exact
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request(url, data)
+            _consume(response)
+            timings.append((time.perf_counter() - started) * 1000)
+    # Read now: the next request resets the query log
+    query_count = len(queries)
+
+    tracemalloc.start()
+    try:
+        _consume(request(url, data))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'requests': repeat,
+        'p50_ms': round(_percentile(timings, 50), 2),
+        'p95_ms': round(_percentile(timings, 95), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'queries': query_count,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def bench(views=None, repeat=20, warmup=2):
+    """Benchmark `views` (default: all) against the current data"""
+    # add_sale records real sales
+    check_database()
+    user, created = User.objects.get_or_create(username=BENCH_USER)
+    if created:
+        user.set_unusable_password()
+        user.save()
+    client = Client()
+    client.force_login(user)
+    return {name: bench_view(client, name, repeat, warmup) for name in (views or VIEWS)}
+
+
+def compare(baseline, current):
+    """
+    Yield (size, view, metric, before, after, change %) for every metric
+    present in both result documents.
+    """
+    for size, views in current['results'].items():
+        for view, metrics in views.items():
+            before_metrics = baseline.get('results', {}).get(size, {}).get(view, {})
+            for metric in ('p50_ms', 'p95_ms', 'queries', 'peak_kib'):
+                before, after = before_metrics.get(metric), metrics.get(metric)
+                if before is None or after is None:
+                    continue
+                change = (after - before) / before * 100 if before else 0.0
+                yield size, view, metric, before, after, round(change, 1)
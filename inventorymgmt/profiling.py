@@ -0,0 +1,216 @@
+"""
+Opt-in request profiling (PROFILING_ENABLED).
+
+ProfilingMiddleware runs a PROFILE_SAMPLE_RATE fraction of requests under
+cProfile. Every other request is watched by a shared background stack
+sampler that looks at the request thread every
+PROFILE_SAMPLE_INTERVAL_MS, so a request that turns out slower than
+PROFILE_SLOW_MS can still be explained after the fact.
+
+Profiles are reduced to their top functions and written as small JSON
+files to PROFILE_DIR. The directory is a ring buffer: only the newest
+PROFILE_MAX_FILES are kept. The staff-only `profiles` views list and
+render them.
+"""
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+TOP_FUNCTIONS = 60
+MAX_STACK_DEPTH = 100
+
+
+def profile_dir():
+    return str(getattr(settings, 'PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+def max_files():
+    return getattr(settings, 'PROFILE_MAX_FILES', 200)
+
+
+def _short_path(path):
+    """Trim a source path to something readable in a table"""
+    base = str(settings.BASE_DIR)
+    if path.startswith(base):
+        return os.path.relpath(path, base)
+    marker = 'site-packages' + os.sep
+    if marker in path:
+        return path.split(marker, 1)[1]
+    return path
+
+
+def _label(path, line, function):
+    return f"{function} ({_short_path(path)}:{line})"
+
+
+class StackSampler:
+    """
+    One daemon thread per process that periodically records the stack of
+    every thread registered with start(), as counts per distinct stack.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, ident):
+        with self._lock:
+            self._active[ident] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, ident):
+        """Stop sampling `ident`; returns its Counter of stacks"""
+        with self._lock:
+            return self._active.pop(ident, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[self._stack(frame)] += 1
+
+    @staticmethod
+    def _stack(frame):
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                interval = getattr(settings, 'PROFILE_SAMPLE_INTERVAL_MS', 5) / 1000
+                _sampler = StackSampler(interval)
+    return _sampler
+
+
+def summarize_cprofile(profiler):
+    """Top functions by cumulative time from a cProfile.Profile"""
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (path, line, function), (_, calls, self_time, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': _label(path, line, function),
+            'calls': calls,
+            'self': round(self_time, 6),
+            'cumulative': round(cumulative, 6),
+        })
+    rows.sort(key=lambda row: row['cumulative'], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+
+def summarize_samples(stacks, interval):
+    """
+    Top functions by cumulative time from sampled stacks: a function's
+    cumulative time counts every sample it was on the stack for, its self
+    time only the samples where it was the innermost frame.
+    """
+    self_samples, cumulative = Counter(), Counter()
+    for stack, count in stacks.items():
+        # A recursive function counts once per sample
+        for frame in set(stack):
+            cumulative[frame] += count
+        self_samples[stack[-1]] += count
+
+    rows = [{
+        'function': _label(*frame),
+        'calls': None,
+        'self': round(self_samples[frame] * interval, 6),
+        'cumulative': round(count * interval, 6),
+    } for frame, count in cumulative.items()]
+    rows.sort(key=lambda row: row['cumulative'], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+
+def save(record):
+    """Write one profile and drop the oldest beyond max_files()"""
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    record['id'] = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(directory, f"{record['id']}.json")
+    with open(path + '.tmp', 'w') as out:
+        json.dump(record, out)
+    os.replace(path + '.tmp', path)
+
+    # Ids start with a timestamp, so name order is age order
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in names[:-max_files()]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass  # another worker pruned it first
+    return record['id']
+
+
+def load(profile_id):
+    """The saved profile with this id, or None"""
+    if not profile_id.replace('-', '').isalnum():
+        return None
+    try:
+        with open(os.path.join(profile_dir(), f"{profile_id}.json")) as fileobj:
+            record = json.load(fileobj)
+    except (OSError, ValueError):
+        return None
+    record['captured'] = datetime.fromtimestamp(record['created'], tz=dt_timezone.utc)
+    return record
+
+
+def recent(limit=None, order='slowest'):
+    """Saved profiles without their function tables, slowest (or newest) first"""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    records = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            record = load(name[:-len('.json')])
+            if record:
+                record.pop('functions', None)
+                records.append(record)
+    key = 'duration_ms' if order == 'slowest' else 'id'
+    records.sort(key=lambda record: record[key], reverse=True)
+    return records[:limit]
+
+
+def profiled_call(func, *args):
+    """
+    Run func under cProfile; returns (result, profiler). The profiler is
+    None when another profiler already owns this thread.
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return func(*args), None
+    try:
+        return func(*args), profiler
+    finally:
+        profiler.disable()
@@ -0,0 +1,206 @@
+"""
+Reports computed in SQL.
+
+`valuation()` totals the stock on hand (items, units and value, i.e.
+quantity x price) per category, brand and supplier plus an overall row.
+Each breakdown is one grouped SELECT and the four are sent as a single
+UNION ALL statement, so the database does the arithmetic and only the
+group rows come back. It is served through the catalog cache
+(caching.valuation), which any stock or supplier write invalidates.
+
+`sales_series()` returns revenue and units per hour, day, week or month,
+optionally split by category, cashier or item, for charts. Day, week and
+month buckets are truncated from the daily rollup (DailySalesSummary), so a
+year costs at most 366 rows per series whatever the sales volume; hour
+buckets truncate Sale.sale_date in the local time zone. Either way the
+grouping is one query (date_trunc on PostgreSQL) and buckets without sales
+are filled with zeros here, so every series has one value per bucket.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Trunc, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .filters import day_start
+from .models import DailySalesSummary, Sale, Stock
+
+# Report section -> column it is grouped by
+DIMENSIONS = {
+    'category': 'category',
+    'brand': 'brand',
+    'supplier': 'supplier__name',
+}
+
+MONEY = DecimalField(max_digits=16, decimal_places=2)
+STOCK_VALUE = ExpressionWrapper(F('quantity') * F('price'), output_field=MONEY)
+
+
+def _grouped(dimension, key):
+    """One breakdown: a row per distinct `key` (blank and NULL together)"""
+    return (
+        Stock.objects
+        .annotate(dimension=Value(dimension), key=Coalesce(key, Value('')))
+        .values('dimension', 'key')
+        .annotate(
+            items=Count('id'),
+            units=Coalesce(Sum('quantity'), 0),
+            value=Coalesce(Sum(STOCK_VALUE), Value(Decimal('0')), output_field=MONEY),
+            unpriced=Count('id', filter=Q(price__isnull=True)),
+            low=Count('id', filter=Q(low_stock=True)),
+        )
+        .order_by()
+    )
+
+
+def valuation():
+    """
+    {'totals': row, 'category': [rows], 'brand': [rows], 'supplier': [rows]}
+    where a row is {'key', 'items', 'units', 'value', 'unpriced', 'low'}.
+    Breakdowns are ordered by value, highest first; `key` is '' for items
+    without a category, brand or supplier.
+    """
+    # A constant key groups the whole table into the single totals row
+    queries = [_grouped(dimension, F(column)) for dimension, column in DIMENSIONS.items()]
+    rows = _grouped('total', Value('')).union(*queries, all=True)
+
+    report = {dimension: [] for dimension in DIMENSIONS}
+    report['totals'] = {'key': '', 'items': 0, 'units': 0, 'value': Decimal('0'), 'unpriced': 0, 'low': 0}
+    for row in rows:
+        dimension = row.pop('dimension')
+        if dimension == 'total':
+            report['totals'] = row
+        else:
+            report[dimension].append(row)
+    for dimension in DIMENSIONS:
+        report[dimension].sort(key=lambda row: (-row['value'], row['key']))
+    return report
+
+
+BUCKETS = ('hour', 'day', 'week', 'month')
+# Series dimension -> (key column, label column), valid on Sale and the rollup
+SERIES = {
+    'category': ('stock__category', 'stock__category'),
+    'cashier': ('sold_by', 'sold_by'),
+    'item': ('stock_id', 'stock__item_name'),
+}
+# Largest number of buckets one request may span
+MAX_BUCKETS = 10000
+OTHER = '__other__'
+
+
+def periods(bucket, date_from, date_to):
+    """Start of every bucket touching the local days date_from..date_to"""
+    if bucket == 'hour':
+        # Step in UTC: wall-clock arithmetic would skip or repeat DST hours
+        moment, end = day_start(date_from), day_start(date_to + timedelta(days=1))
+        while moment < end:
+            yield timezone.localtime(moment)
+            moment += timedelta(hours=1)
+        return
+    if bucket == 'day':
+        day, step = date_from, timedelta(days=1)
+    elif bucket == 'week':
+        day, step = date_from - timedelta(days=date_from.weekday()), timedelta(days=7)
+    else:
+        day = date_from.replace(day=1)
+    while day <= date_to:
+        yield day
+        if bucket == 'month':
+            day = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+        else:
+            day += step
+
+
+def _period_key(value):
+    if hasattr(value, 'tzinfo'):
+        value = timezone.localtime(value)
+    return value.isoformat()
+
+
+def _grouped_sales(bucket, date_from, date_to, dimension):
+    """One row per (bucket, series key) with units and revenue"""
+    if bucket == 'hour':
+        rows = Sale.objects.filter(
+            sale_date__gte=day_start(date_from), sale_date__lt=day_start(date_to + timedelta(days=1))
+        )
+        period = Trunc('sale_date', 'hour', tzinfo=timezone.get_current_timezone())
+        units, revenue = Sum('quantity_sold'), Sum('subtotal')
+    else:
+        rows = DailySalesSummary.objects.filter(day__gte=date_from, day__lte=date_to)
+        period = {'day': F('day'), 'week': TruncWeek('day'), 'month': TruncMonth('day')}[bucket]
+        units, revenue = Sum('quantity'), Sum('revenue')
+
+    group = {'period': period}
+    if dimension:
+        key, label = SERIES[dimension]
+        if key == label:
+            group['key'] = Coalesce(key, Value(''))
+        else:
+            group['key'], group['label'] = F(key), Coalesce(label, Value(''))
+    return rows.annotate(**group).values(*group).annotate(units=units, revenue=revenue).order_by()
+
+
+def sales_series(bucket, date_from, date_to, dimension=None, top=10):
+    """
+    Revenue and units per bucket over the local days date_from..date_to:
+    {'bucket', 'from', 'to', 'dimension', 'buckets': [ISO starts],
+    'series': [{'key', 'label', 'units': [...], 'revenue': [...],
+    'total_units', 'total_revenue'}]}. With a `dimension` the `top` series
+    by revenue are returned and the rest are summed into one 'Other'
+    series. Raises ValueError for an unknown bucket or dimension or a
+    range of more than MAX_BUCKETS buckets.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    if dimension and dimension not in SERIES:
+        raise ValueError(f"dimension must be one of {', '.join(SERIES)}")
+    if date_from > date_to:
+        raise ValueError("from must not be after to")
+    starts = []
+    for start in periods(bucket, date_from, date_to):
+        starts.append(_period_key(start))
+        if len(starts) > MAX_BUCKETS:
+            raise ValueError(f"range spans more than {MAX_BUCKETS} {bucket} buckets")
+    index = {start: position for position, start in enumerate(starts)}
+
+    series = {}
+    for row in _grouped_sales(bucket, date_from, date_to, dimension):
+        position = index.get(_period_key(row['period']))
+        if position is None:
+            continue
+        key = row.get('key', 'total')
+        if key not in series:
+            series[key] = {
+                'key': key,
+                'label': row.get('label', key if dimension else 'All sales'),
+                'units': [0] * len(starts),
+                'revenue': [Decimal('0')] * len(starts),
+            }
+        series[key]['units'][position] += row['units'] or 0
+        series[key]['revenue'][position] += row['revenue'] or 0
+
+    ranked = sorted(series.values(), key=lambda item: sum(item['revenue']), reverse=True)
+    if dimension and len(ranked) > top:
+        other = {'key': OTHER, 'label': 'Other', 'units': [0] * len(starts), 'revenue': [Decimal('0')] * len(starts)}
+        for item in ranked[top:]:
+            other['units'] = [a + b for a, b in zip(other['units'], item['units'])]
+            other['revenue'] = [a + b for a, b in zip(other['revenue'], item['revenue'])]
+        ranked = ranked[:top] + [other]
+    if not dimension and not ranked:
+        ranked = [{'key': 'total', 'label': 'All sales', 'units': [0] * len(starts), 'revenue': [Decimal('0')] * len(starts)}]
+
+    for item in ranked:
+        item['total_units'] = sum(item['units'])
+        item['total_revenue'] = float(sum(item['revenue']))
+        # Charts want numbers, not the strings JSON gives Decimals
+        item['revenue'] = [float(value) for value in item['revenue']]
+    return {
+        'bucket': bucket,
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'dimension': dimension or 'total',
+        'buckets': starts,
+        'series': ranked,
+    }
@@ -0,0 +1,163 @@
+"""
+Daily sales rollup (DailySalesSummary).
+
+Totals are bumped in the same transaction that creates or reverses a sale,
+so reading POS and sales-list totals costs one row per (day, item, cashier)
+instead of a scan over every sale. `rebuild` recomputes a date range from
+the Sale table (used by the rebuild_sales_summary command); it never
+touches days before the oldest remaining sale, whose sales may have been
+archived (archive.py) and whose rollup rows are then the only totals left.
+
+Deleting a Stock sets Sale.stock to NULL, so `fold_deleted_stock` moves the
+item's rollup rows onto stock NULL in the same transaction; the unique index
+uses COALESCE(stock_id, 0) so those rows upsert like any other.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .caching import invalidate_sales
+from .models import DailySalesSummary, Sale
+
+
+def _upsert(rows):
+    """
+    Add (day, stock_id, sold_by) -> (quantity, revenue, count) deltas with one
+    INSERT ... ON CONFLICT DO UPDATE (supported by PostgreSQL and SQLite).
+    The conflict target matches the unique_daily_sales_summary expression
+    index, so a NULL stock_id conflicts instead of adding a duplicate row.
+    """
+    if not rows:
+        return
+    table = connection.ops.quote_name(DailySalesSummary._meta.db_table)
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+    params = []
+    for (day, stock_id, sold_by), (quantity, revenue, count) in rows.items():
+        params.extend([day, stock_id, sold_by, quantity, revenue, count])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (day, stock_id, sold_by, quantity, revenue, sales_count) "
+            f"VALUES {placeholders} "
+            f"ON CONFLICT (day, (COALESCE(stock_id, 0)), sold_by) DO UPDATE SET "
+            f"quantity = {table}.quantity + EXCLUDED.quantity, "
+            f"revenue = {table}.revenue + EXCLUDED.revenue, "
+            f"sales_count = {table}.sales_count + EXCLUDED.sales_count",
+            params,
+        )
+
+
+def _key(sale):
+    return (timezone.localdate(sale.sale_date), sale.stock_id, sale.sold_by or '')
+
+
+def add_sales(sales):
+    """Count newly created sales into the rollup."""
+    rows = defaultdict(lambda: [0, Decimal('0.00'), 0])
+    for sale in sales:
+        row = rows[_key(sale)]
+        row[0] += sale.quantity_sold
+        row[1] += sale.subtotal
+        row[2] += 1
+    _upsert(rows)
+    invalidate_sales()
+
+
+def remove_sale(sale):
+    """Take a deleted sale back out of the rollup."""
+    day, stock_id, sold_by = _key(sale)
+    DailySalesSummary.objects.filter(day=day, stock_id=stock_id, sold_by=sold_by).update(
+        quantity=F('quantity') - sale.quantity_sold,
+        revenue=F('revenue') - sale.subtotal,
+        sales_count=F('sales_count') - 1,
+    )
+    invalidate_sales()
+
+
+def fold_deleted_stock(sender, instance, **kwargs):
+    """
+    post_delete receiver for Stock: the item's sales now have stock NULL, so
+    merge its rollup rows into the stock NULL rows for the same day/cashier
+    (remove_sale of those sales then finds them). Runs inside the delete's
+    transaction.
+    """
+    with transaction.atomic():
+        rows = DailySalesSummary.objects.select_for_update().filter(stock_id=instance.pk)
+        merged = {
+            (row.day, None, row.sold_by): (row.quantity, row.revenue, row.sales_count)
+            for row in rows
+        }
+        if not merged:
+            return
+        rows.delete()
+        _upsert(merged)
+    invalidate_sales()
+
+
+def totals(queryset):
+    """Sum revenue, quantity and number of sales over a summary queryset."""
+    result = queryset.aggregate(
+        total=Sum('revenue'),
+        qty=Sum('quantity'),
+        count=Sum('sales_count'),
+    )
+    return {
+        'total': result['total'] or Decimal('0.00'),
+        'qty': result['qty'] or 0,
+        'count': result['count'] or 0,
+    }
+
+
+def rebuild(date_from=None, date_to=None):
+    """
+    Recompute the rollup for [date_from, date_to] (inclusive, either end
+    optional) from the Sale table. Days before the oldest remaining sale are
+    kept as they are, whatever the range. Returns the number of summary rows
+    written.
+    """
+    oldest = Sale.objects.order_by('sale_date').values_list('sale_date', flat=True).first()
+    if oldest is None:
+        # No sales left to rebuild from; every rollup row may be archived history
+        return 0
+    floor = timezone.localdate(oldest)
+    date_from = max(date_from, floor) if date_from else floor
+    if date_to and date_to < date_from:
+        return 0
+
+    summaries = DailySalesSummary.objects.all()
+    sales = Sale.objects.annotate(day=TruncDate('sale_date'))
+    summaries = summaries.filter(day__gte=date_from)
+    sales = sales.filter(day__gte=date_from)
+    if date_to:
+        summaries = summaries.filter(day__lte=date_to)
+        sales = sales.filter(day__lte=date_to)
+
+    grouped = sales.annotate(
+        cashier=Coalesce('sold_by', Value('')),
+    ).values('day', 'stock_id', 'cashier').annotate(
+        quantity=Sum('quantity_sold'),
+        revenue=Sum('subtotal'),
+        sales_count=Count('id'),
+    ).order_by()
+
+    with transaction.atomic():
+        summaries.delete()
+        created = DailySalesSummary.objects.bulk_create(
+            (
+                DailySalesSummary(
+                    day=row['day'],
+                    stock_id=row['stock_id'],
+                    sold_by=row['cashier'],
+                    quantity=row['quantity'],
+                    revenue=row['revenue'],
+                    sales_count=row['sales_count'],
+                )
+                for row in grouped.iterator()
+            ),
+            batch_size=1000,
+        )
+    invalidate_sales()
+    return len(created)
@@ -0,0 +1,134 @@
+"""
+Catalog search used by list_items, pos_page and the stock export.
+
+On PostgreSQL, matching runs against pg_trgm GIN indexes (created by
+`ensure_search_indexes` after migrate), so `icontains` and typo-tolerant
+trigram matches are index scans instead of sequential scans, and results are
+ordered by similarity. Setting INVENTORY_SEARCH_MODE=fulltext switches free
+text queries to a weighted SearchVector/SearchRank over an expression GIN
+index. Other databases (SQLite in dev) fall back to `icontains` with a
+simple prefix/exact-match ranking.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+SEARCH_FIELDS = ['item_name', 'brand', 'category']
+
+# Raw SQL so it can be applied idempotently without a migrations package.
+# The tsvector expression must match what SearchVector() below compiles to,
+# otherwise the planner won't use the index.
+TSVECTOR_SQL = (
+    "(setweight(to_tsvector('simple'::regconfig, COALESCE(item_name, '')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, COALESCE(brand, '')), 'B')) || "
+    "setweight(to_tsvector('simple'::regconfig, COALESCE(category, '')), 'C')"
+)
+INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+] + [
+    # Serves the trigram similarity operator (%>) on the raw column
+    f"CREATE INDEX IF NOT EXISTS inventorymgmt_stock_{field}_trgm "
+    f"ON inventorymgmt_stock USING gin ({field} gin_trgm_ops)"
+    for field in SEARCH_FIELDS
+] + [
+    # Serves icontains, which Django compiles to UPPER(col::text) LIKE UPPER(%x%)
+    f"CREATE INDEX IF NOT EXISTS inventorymgmt_stock_{field}_upper_trgm "
+    f"ON inventorymgmt_stock USING gin ((UPPER({field}::text)) gin_trgm_ops)"
+    for field in SEARCH_FIELDS
+] + [
+    f"CREATE INDEX IF NOT EXISTS inventorymgmt_stock_search_tsv "
+    f"ON inventorymgmt_stock USING gin (({TSVECTOR_SQL}))",
+]
+
+
+def ensure_search_indexes(using='default', **kwargs):
+    """post_migrate hook: create the pg_trgm extension and search indexes"""
+    from django.db import connections
+
+    conn = connections[using]
+    if conn.vendor != 'postgresql':
+        return
+    with conn.cursor() as cursor:
+        for statement in INDEX_SQL:
+            cursor.execute(statement)
+
+
+def _use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def _field_filter(field, term):
+    """Match one field; on postgres also accept close (typo) matches"""
+    q = Q(**{f'{field}__icontains': term})
+    if _use_postgres():
+        q |= Q(**{f'{field}__trigram_word_similar': term})
+    return q
+
+
+def _trigram_rank(terms):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    scores = [TrigramWordSimilarity(term, field) for field, term in terms]
+    return scores[0] if len(scores) == 1 else Greatest(*scores, output_field=FloatField())
+
+
+def _fallback_rank(terms):
+    """Exact match > prefix match > substring match, on the first term"""
+    field, term = terms[0]
+    return Case(
+        When(**{f'{field}__iexact': term}, then=Value(3)),
+        When(**{f'{field}__istartswith': term}, then=Value(2)),
+        When(**{f'{field}__icontains': term}, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _fulltext(queryset, query):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    vector = (
+        SearchVector('item_name', weight='A', config='simple')
+        + SearchVector('brand', weight='B', config='simple')
+        + SearchVector('category', weight='C', config='simple')
+    )
+    search_query = SearchQuery(query, config='simple', search_type='websearch')
+    # Filtering on the vector itself compiles to `<tsvector expr> @@ query`,
+    # which is what the expression index can serve
+    return queryset.annotate(search=vector).filter(search=search_query).annotate(
+        search_rank=SearchRank(vector, search_query)
+    )
+
+
+def search_stock(queryset, query=None, item_name=None, brand=None, category=None):
+    """
+    Filter a Stock queryset and order it by relevance.
+
+    `query` is free text matched against item name and brand (the POS search
+    box); `item_name`, `brand` and `category` match their own column. With no
+    search terms the queryset is simply ordered by item name.
+    """
+    query = (query or '').strip()
+    field_terms = [
+        (field, value.strip())
+        for field, value in zip(SEARCH_FIELDS, (item_name, brand, category))
+        if value and value.strip()
+    ]
+
+    for field, term in field_terms:
+        queryset = queryset.filter(_field_filter(field, term))
+
+    rank_terms = list(field_terms)
+    if query:
+        if _use_postgres() and getattr(settings, 'INVENTORY_SEARCH_MODE', 'trigram') == 'fulltext':
+            queryset = _fulltext(queryset, query)
+            return queryset.order_by('-search_rank', 'item_name')
+        queryset = queryset.filter(_field_filter('item_name', query) | _field_filter('brand', query))
+        rank_terms = [('item_name', query), ('brand', query)] + rank_terms
+
+    if not rank_terms:
+        return queryset.order_by('item_name')
+
+    rank = _trigram_rank(rank_terms) if _use_postgres() else _fallback_rank(rank_terms)
+    return queryset.annotate(search_rank=rank).order_by('-search_rank', 'item_name')
@@ -0,0 +1,344 @@
+"""
+Stock movement service.
+
+Every change to `Stock.quantity` goes through here; item edits (the update
+form, the admin) save through `save_edited_stock`, which turns a typed-in
+quantity into an ADJUST movement. Quantities are adjusted
+with a single conditional UPDATE (`quantity = quantity - n WHERE quantity >= n`)
+so concurrent sales of the same item can never overwrite each other or drive
+the stock negative, and the matching StockMovement ledger row is written in
+the same transaction.
+
+Every path that changes quantity or reorder level also calls
+`sync_low_stock` for the items it touched, which flips Stock.low_stock and
+writes a LowStockEvent only for items that crossed their reorder level.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .caching import invalidate
+from .metrics import count_movements, count_sales
+from .models import LowStockEvent, Stock, StockMovement, Sale
+from .rollups import add_sales, remove_sale
+
+
+class InsufficientStock(Exception):
+    """Raised when a movement would take an item's quantity below zero."""
+
+    def __init__(self, stock_id, requested):
+        self.stock_id = stock_id
+        self.requested = requested
+        super().__init__(f"Not enough stock for item {stock_id} (requested {requested})")
+
+
+class InvalidQuantity(ValueError):
+    """Raised when a movement is asked to move zero or fewer units."""
+
+    def __init__(self, quantity):
+        self.quantity = quantity
+        super().__init__(f"Quantity must be a positive whole number (got {quantity!r})")
+
+
+def _check_quantity(quantity):
+    # A negative issue would otherwise add stock (and a negative receipt remove it)
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+        raise InvalidQuantity(quantity)
+
+
+class CartError(Exception):
+    """Raised when one or more cart lines cannot be fulfilled."""
+
+    def __init__(self, errors):
+        # {stock_id: message}
+        self.errors = errors
+        super().__init__("; ".join(errors.values()))
+
+
+def _apply_delta(stock_id, delta, **extra):
+    """
+    Add `delta` to the stock quantity in one UPDATE statement.
+
+    Negative deltas only match rows that still hold enough units; if no row
+    was updated the item either does not exist or is short, and
+    InsufficientStock is raised. `extra` holds additional columns to set in
+    the same statement.
+    """
+    queryset = Stock.objects.filter(pk=stock_id)
+    if delta < 0:
+        queryset = queryset.filter(quantity__gte=-delta)
+
+    updated = queryset.update(
+        quantity=F('quantity') + delta,
+        last_updated=timezone.now(),
+        **extra
+    )
+    if not updated:
+        raise InsufficientStock(stock_id, -delta)
+    sync_low_stock([stock_id])
+    # queryset.update() sends no signals, so drop the cached catalog here
+    invalidate()
+
+
+LOW = Q(quantity__lte=F('reorder_level'))
+
+
+def sync_low_stock(stock_ids=None):
+    """
+    Bring Stock.low_stock in line with quantity <= reorder_level for
+    `stock_ids` (or, for a backfill, every item) and record one
+    LowStockEvent per item whose flag flipped. Returns the events.
+
+    Each flip is a conditional UPDATE on the old flag value, so when two
+    transactions race over the same item only one of them records the
+    crossing.
+    """
+    items = Stock.objects.all() if stock_ids is None else Stock.objects.filter(pk__in=list(stock_ids))
+    crossing = [
+        (LowStockEvent.Kind.LOW, True, items.filter(LOW, low_stock=False)),
+        (LowStockEvent.Kind.RECOVERED, False, items.filter(low_stock=True).exclude(LOW)),
+    ]
+    events = []
+    for kind, flag, queryset in crossing:
+        for row in queryset.values('id', 'quantity', 'reorder_level').iterator():
+            if Stock.objects.filter(pk=row['id'], low_stock=not flag).update(low_stock=flag):
+                events.append(LowStockEvent(
+                    stock_id=row['id'], kind=kind, quantity=row['quantity'], reorder_level=row['reorder_level']
+                ))
+    if events:
+        LowStockEvent.objects.bulk_create(events)
+        invalidate()
+    return events
+
+
+def sync_low_stock_on_save(sender, instance, update_fields=None, **kwargs):
+    """post_save receiver for Stock (forms, admin, reorder level edits)"""
+    if update_fields is not None and not {'quantity', 'reorder_level'} & set(update_fields):
+        return
+    quantity, reorder_level = instance.quantity, instance.reorder_level
+    if isinstance(quantity, int) and isinstance(reorder_level, int):
+        # The saved values agree with the flag: no crossing, no queries
+        if (quantity <= reorder_level) == instance.low_stock:
+            return
+    sync_low_stock([instance.pk])
+
+
+def record_movement(stock_id, kind, delta, actor=None, balance=None, **fields):
+    """Append one StockMovement row to the ledger."""
+    movement = StockMovement.objects.create(
+        stock_id=stock_id,
+        kind=kind,
+        delta=delta,
+        actor=actor,
+        balance=balance,
+        **fields
+    )
+    count_movements([kind])
+    return movement
+
+
+def _username(user):
+    return user.username if user is not None else None
+
+
+def issue_stock(stock_id, quantity, user=None, issue_to=None):
+    """Take `quantity` units out of the store and log the issue."""
+    _check_quantity(quantity)
+    with transaction.atomic():
+        _apply_delta(
+            stock_id, -quantity,
+            issue_quantity=quantity,
+            receive_quantity=0,
+            issue_by=_username(user),
+            issue_to=issue_to,
+        )
+        stock = Stock.objects.get(pk=stock_id)
+        record_movement(
+            stock_id, StockMovement.Kind.ISSUE, -quantity,
+            actor=user,
+            balance=stock.quantity,
+            party=issue_to or '',
+        )
+    return stock
+
+
+def receive_stock(stock_id, quantity, user=None, supplier=None):
+    """Add `quantity` units to the store and log the receipt."""
+    _check_quantity(quantity)
+    extra = {
+        'receive_quantity': quantity,
+        'issue_quantity': 0,
+        'receive_by': _username(user),
+    }
+    if supplier is not None:
+        extra['supplier'] = supplier
+
+    with transaction.atomic():
+        _apply_delta(stock_id, quantity, **extra)
+        stock = Stock.objects.get(pk=stock_id)
+        record_movement(
+            stock_id, StockMovement.Kind.RECEIVE, quantity,
+            actor=user,
+            balance=stock.quantity,
+            supplier=supplier,
+        )
+    return stock
+
+
+def sell_stock(stock_id, quantity):
+    """
+    Deduct sold units. Called from `Sale.save()` inside the transaction that
+    inserts the sale, so a failed insert also restores the stock. The
+    ledger row is written by `Sale.save()` once the sale has an id.
+    Returns the quantity left, for that row's balance.
+    """
+    _check_quantity(quantity)
+    _apply_delta(stock_id, -quantity)
+    return _balance(stock_id)
+
+
+def _balance(stock_id):
+    """Quantity on hand, read inside the transaction that just changed it"""
+    return Stock.objects.filter(pk=stock_id).values_list('quantity', flat=True).get()
+
+
+def adjust_stock(stock_id, quantity, user=None):
+    """
+    Set an item's quantity to a counted value and log the difference as an
+    ADJUST movement; returns the delta.
+    """
+    if not isinstance(quantity, int) or quantity < 0:
+        raise InvalidQuantity(quantity)
+    with transaction.atomic():
+        current = Stock.objects.select_for_update().filter(pk=stock_id).values_list('quantity', flat=True).get()
+        delta = quantity - current
+        if delta:
+            _apply_delta(stock_id, delta)
+            record_movement(stock_id, StockMovement.Kind.ADJUST, delta, actor=user, balance=quantity)
+    return delta
+
+
+def save_edited_stock(stock, user=None):
+    """
+    Save a Stock edited through a form or the admin. A new item is logged
+    as CREATE; a changed quantity on an existing one is written by
+    `adjust_stock` so the ledger balance stays in step.
+    """
+    with transaction.atomic():
+        if stock.pk is None:
+            stock.save()
+            record_movement(
+                stock.pk, StockMovement.Kind.CREATE, stock.quantity,
+                actor=user, balance=stock.quantity, supplier=stock.supplier,
+            )
+            return stock
+        quantity = stock.quantity
+        if stock.is_tracked:
+            stock.quantity = stock.loaded_value('quantity')
+        stock.save()
+        adjust_stock(stock.pk, quantity, user)
+        stock.quantity = quantity
+    return stock
+
+
+def reverse_sale(sale, user=None):
+    """Delete a sale and put its units back on the shelf atomically."""
+    with transaction.atomic():
+        if sale.stock_id:
+            _apply_delta(sale.stock_id, sale.quantity_sold)
+            # The sale row goes away, so the reversal is not linked to it
+            record_movement(
+                sale.stock_id, StockMovement.Kind.SALE_REVERSAL, sale.quantity_sold,
+                actor=user,
+                balance=_balance(sale.stock_id),
+            )
+        remove_sale(sale)
+        sale.delete()
+
+
+def sell_cart(lines, user=None):
+    """
+    Sell a whole cart in one transaction.
+
+    `lines` is a list of (stock_id, quantity, selling_price) tuples. All lines
+    are validated with one SELECT, every stock row is decremented by a single
+    conditional UPDATE using CASE on the id, and the Sale rows are inserted
+    with one bulk_create. Either the entire cart is sold or nothing is.
+
+    Returns (sales, stocks) where `stocks` maps stock_id to the values read
+    during validation (id, item_name, quantity before the sale).
+    """
+    needed = defaultdict(int)
+    for stock_id, quantity, _ in lines:
+        _check_quantity(quantity)
+        needed[stock_id] += quantity
+
+    with transaction.atomic():
+        stocks = {
+            row['id']: row
+            for row in Stock.objects.filter(pk__in=needed).values('id', 'item_name', 'quantity')
+        }
+
+        errors = {}
+        for stock_id, quantity in needed.items():
+            stock = stocks.get(stock_id)
+            if stock is None:
+                errors[stock_id] = f"Product {stock_id} not found"
+            elif stock['quantity'] < quantity:
+                errors[stock_id] = f"Only {stock['quantity']} {stock['item_name']} in stock!"
+        if errors:
+            raise CartError(errors)
+
+        amount = Case(
+            *[When(pk=stock_id, then=Value(quantity)) for stock_id, quantity in needed.items()],
+            output_field=IntegerField(),
+        )
+        updated = Stock.objects.filter(pk__in=needed, quantity__gte=amount).update(
+            quantity=F('quantity') - amount,
+            last_updated=timezone.now(),
+        )
+        if updated != len(needed):
+            # Another terminal sold the same items between our read and write
+            raise CartError({
+                stock_id: f"Stock for {stocks[stock_id]['item_name']} changed, please retry"
+                for stock_id in needed
+            })
+        sync_low_stock(needed)
+
+        # Ledger balance after each line: the stock left once this line and
+        # the cart's earlier lines for the same item are sold
+        left = dict(Stock.objects.filter(pk__in=needed).values_list('id', 'quantity'))
+        balances = []
+        for stock_id, quantity, _ in reversed(lines):
+            balances.append(left[stock_id])
+            left[stock_id] += quantity
+        balances.reverse()
+
+        sales = Sale.objects.bulk_create([
+            Sale(
+                stock_id=stock_id,
+                quantity_sold=quantity,
+                selling_price=price,
+                subtotal=quantity * price,
+                sold_by=_username(user),
+            )
+            for stock_id, quantity, price in lines
+        ])
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                stock_id=sale.stock_id,
+                kind=StockMovement.Kind.SALE,
+                delta=-sale.quantity_sold,
+                actor=user,
+                balance=balance,
+                sale=sale,
+            )
+            for sale, balance in zip(sales, balances)
+        ])
+        add_sales(sales)
+        count_sales(sales)
+        count_movements([StockMovement.Kind.SALE] * len(sales))
+        invalidate()
+    return sales, stocks
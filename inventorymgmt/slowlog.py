@@ -0,0 +1,255 @@
+"""
+Slow-query log.
+
+RequestTimingMiddleware's QueryRecorder hands every statement slower than
+SLOW_QUERY_MS to `capture()`, together with the project frame that issued
+it. After the response is built, `submit()` queues them for a daemon thread
+that folds them into SlowQuery rows keyed by a fingerprint of the
+normalised SQL, so one bad query shape shows up as one row with call counts
+and timings however many times it ran, and the request never waits on the
+log. With SLOW_QUERY_BACKGROUND off nothing is written until `drain()`.
+
+Bind parameters are never stored: they can hold session keys, password
+hashes or customer data, and the admin shows every column. A row keeps the
+parameter types, and quoted literals in its example SQL are masked.
+
+Plans are captured out of band by the same thread (SLOW_QUERY_EXPLAIN),
+which replays the statement with its live parameters, held only in memory,
+under EXPLAIN on its own connection once per fingerprint per
+EXPLAIN_INTERVAL. `slow_query_report --explain` fills in any that are
+missing using neutral stand-in values of the stored types. On PostgreSQL
+SELECTs get `EXPLAIN (ANALYZE, BUFFERS)`; anything that writes is explained
+without ANALYZE so it is never executed again.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_INTERVAL = 3600
+# Frames from these files are instrumentation, never the call site
+_SKIP_FILES = ('middleware.py', 'slowlog.py')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def threshold_seconds():
+    return getattr(settings, 'SLOW_QUERY_MS', 200) / 1000
+
+
+def normalize(sql):
+    """SQL with literals, placeholders and IN lists collapsed to '?'"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(statement):
+    return hashlib.sha1(statement.encode()).hexdigest()
+
+
+def call_site():
+    """'path:line in function' of the innermost project frame on the stack"""
+    base = str(settings.BASE_DIR) + os.sep
+    frame = sys._getframe(1)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if path.startswith(base) and 'site-packages' not in path and not path.endswith(_SKIP_FILES):
+            return f"{os.path.relpath(path, base)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ''
+
+
+def capture(sql, params, seconds):
+    """One slow statement, as seen inside the execute wrapper"""
+    return {'sql': sql, 'params': params, 'seconds': seconds, 'call_site': call_site()}
+
+
+def redact_sql(sql):
+    """Raw SQL with quoted literals masked; still valid for EXPLAIN"""
+    return _STRING.sub("'?'", sql)
+
+
+def redact_params(params):
+    """JSON list of the parameters' type names; the values are dropped"""
+    params = list(params or [])
+    if any(isinstance(param, (list, tuple)) for param in params):
+        # executemany passes a sequence of parameter lists
+        return '[]'
+    return json.dumps([type(param).__name__ for param in params])
+
+
+def _stand_ins(example_params):
+    """Neutral values of the stored parameter types, to EXPLAIN without the originals"""
+    values = {
+        'int': 0, 'float': 0.0, 'Decimal': Decimal('0'), 'str': '', 'bool': False,
+        'datetime': timezone.now(), 'date': timezone.localdate(),
+    }
+    return [values.get(name) for name in json.loads(example_params or '[]')]
+
+
+def record(captured, view=''):
+    """Fold statements from capture() into their SlowQuery rows"""
+    from .models import SlowQuery
+
+    now = timezone.now()
+    for item in captured:
+        statement = normalize(item['sql'])
+        key = fingerprint(statement)
+        ms = item['seconds'] * 1000
+        fields = {
+            'example_sql': redact_sql(item['sql']),
+            'example_params': redact_params(item['params']),
+            'view': view or '',
+            'call_site': item['call_site'][:300],
+            'last_ms': ms,
+            'last_seen': now,
+        }
+        updated = SlowQuery.objects.filter(fingerprint=key).update(
+            calls=F('calls') + 1, total_ms=F('total_ms') + ms, **fields
+        )
+        if updated:
+            SlowQuery.objects.filter(fingerprint=key, max_ms__lt=ms).update(max_ms=ms)
+        else:
+            try:
+                with transaction.atomic():
+                    SlowQuery.objects.create(
+                        fingerprint=key, statement=statement, calls=1, total_ms=ms, max_ms=ms, first_seen=now, **fields
+                    )
+            except IntegrityError:
+                # Another worker inserted it first; count this one on its row
+                SlowQuery.objects.filter(fingerprint=key).update(calls=F('calls') + 1, total_ms=F('total_ms') + ms)
+        schedule_explain(key, item['sql'], item['params'])
+
+
+def _writes(sql):
+    return not sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def explain(sql, params):
+    """Plan text for one statement on the current connection"""
+    analyze = connection.vendor == 'postgresql' and not _writes(sql)
+    options = {'analyze': True, 'buffers': True} if analyze else {}
+    prefix = connection.ops.explain_query_prefix(**options)
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}", params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def capture_plan(slow_query, sql=None, params=None):
+    """
+    EXPLAIN `sql` with `params` (a live statement of this fingerprint), or
+    the stored example with stand-in values, and save the plan
+    """
+    if sql is None:
+        sql, params = slow_query.example_sql, _stand_ins(slow_query.example_params)
+    try:
+        with transaction.atomic():
+            plan = explain(sql, params)
+            # Nothing the EXPLAIN touched is kept
+            transaction.set_rollback(True)
+    except Exception as e:
+        plan = f"EXPLAIN failed: {e}"
+    slow_query.plan = plan
+    slow_query.plan_captured_at = timezone.now()
+    type(slow_query).objects.filter(pk=slow_query.pk).update(plan=plan, plan_captured_at=slow_query.plan_captured_at)
+    return plan
+
+
+# ('record', captured, view) and ('explain', key, sql, params) jobs
+_queue = queue.Queue(maxsize=500)
+_explained = {}
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _put(job):
+    try:
+        _queue.put_nowait(job)
+    except queue.Full:
+        # The log is best effort; never hold up a request for it
+        logger.debug("Slow query queue full, dropping a %s job", job[0])
+        return
+    if getattr(settings, 'SLOW_QUERY_BACKGROUND', True):
+        _ensure_worker()
+
+
+def submit(captured, view=''):
+    """Queue statements from capture() for `record()` off the request path"""
+    _put(('record', captured, view or ''))
+
+
+def schedule_explain(key, sql, params):
+    """Ask the background explainer for a plan of `key`, at most hourly"""
+    if not getattr(settings, 'SLOW_QUERY_EXPLAIN', True):
+        return
+    if time.monotonic() - _explained.get(key, -EXPLAIN_INTERVAL) < EXPLAIN_INTERVAL:
+        return
+    _explained[key] = time.monotonic()
+    _put(('explain', key, sql, params))
+
+
+def _run(job):
+    from .models import SlowQuery
+
+    if job[0] == 'record':
+        record(job[1], job[2])
+        return
+    _, key, sql, params = job
+    slow_query = SlowQuery.objects.filter(fingerprint=key).first()
+    if slow_query is not None:
+        capture_plan(slow_query, sql, params)
+
+
+def drain():
+    """Run queued jobs in this thread; returns how many ran"""
+    ran = 0
+    while True:
+        try:
+            job = _queue.get_nowait()
+        except queue.Empty:
+            return ran
+        try:
+            _run(job)
+        finally:
+            _queue.task_done()
+        ran += 1
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name='slow-query-log', daemon=True)
+            _worker.start()
+
+
+def _worker_loop():
+    while True:
+        job = _queue.get()
+        try:
+            _run(job)
+        except Exception:
+            logger.exception("Slow query %s job failed", job[0])
+        finally:
+            _queue.task_done()
+            connection.close()
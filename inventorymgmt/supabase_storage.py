@@ -1,168 +1,314 @@
-import os
 import logging
-from io import BytesIO
+import mimetypes
+import random
+import threading
+import time
+from urllib.parse import urlsplit
 from django.conf import settings
-from urllib.parse import quote
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 import requests
+from requests.adapters import HTTPAdapter
 
-# Conditional imports for optional dependencies
-try:
-    from PIL import Image
-    HAS_PIL = True
-except ImportError:
-    HAS_PIL = False
-
-try:
-    from supabase import create_client, Client
-    HAS_SUPABASE = True
-except ImportError:
-    HAS_SUPABASE = False
-    Client = None
+from .metrics import observe_storage
 
 logger = logging.getLogger(__name__)
 
+
+class StorageUnavailable(Exception):
+    """Raised internally when the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Fail fast while storage is down.
+
+    After `threshold` consecutive failures the breaker opens and every call
+    is refused for `reset_timeout` seconds. The first call after that is let
+    through as a probe (half-open): success closes the breaker, failure
+    opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'half-open':
+                # Let exactly one probe through; the rest wait for its result
+                self.opened_at = time.monotonic()
+                return True
+            return state == 'closed'
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.error("Supabase storage circuit opened after %s failures", self.failures)
+                self.opened_at = time.monotonic()
+
+
+class CallMetrics:
+    """
+    Per-operation call counts, failures and latency, for this process.
+    Every call is also exported to Prometheus (see metrics.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def record(self, operation, seconds, ok):
+        with self._lock:
+            op = self._ops.setdefault(operation, {
+                'calls': 0, 'failures': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            })
+            op['calls'] += 1
+            op['failures'] += 0 if ok else 1
+            op['total_seconds'] += seconds
+            op['max_seconds'] = max(op['max_seconds'], seconds)
+        observe_storage(operation, seconds, ok)
+
+    def snapshot(self):
+        with self._lock:
+            report = {}
+            for operation, op in self._ops.items():
+                report[operation] = dict(op, avg_seconds=op['total_seconds'] / op['calls'])
+            return report
+
+
 class SupabaseStorage:
-    """Handle image uploads to Supabase cloud storage using REST API"""
-    
+    """
+    Image uploads/deletes against the Supabase storage REST API.
+
+    One instance is shared per process (see get_supabase_storage): it keeps
+    a pooled keep-alive requests.Session, bounds every call with connect/read
+    timeouts, retries transient failures with jittered exponential backoff
+    and stops calling storage altogether while its circuit breaker is open.
+    Failed or refused calls return None/False so callers degrade gracefully.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
     def __init__(self):
         # Get credentials from Django settings
         self.supabase_url = settings.SUPABASE_URL
         # Use Service Role Key for uploads (has full permissions)
         self.supabase_key = settings.SUPABASE_SERVICE_ROLE_KEY or settings.SUPABASE_ANON_KEY
         self.bucket_name = settings.SUPABASE_BUCKET_NAME
-        
-        print(f"\n🔧 Supabase Configuration:")
-        print(f"  URL: {self.supabase_url}")
-        print(f"  Bucket: {self.bucket_name}")
-        print(f"  Using: {'Service Role Key' if settings.SUPABASE_SERVICE_ROLE_KEY else 'Anon Key'}")
-        print(f"  Key configured: {'✓' if self.supabase_key else '✗'}\n")
-        
+        self.timeout = (
+            getattr(settings, 'SUPABASE_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'SUPABASE_READ_TIMEOUT', 30),
+        )
+        self.retries = getattr(settings, 'SUPABASE_RETRIES', 2)
+        self.breaker = CircuitBreaker(
+            threshold=getattr(settings, 'SUPABASE_BREAKER_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'SUPABASE_BREAKER_RESET_SECONDS', 30),
+        )
+        self.metrics = CallMetrics()
+
         if not self.supabase_url or not self.supabase_key:
             logger.warning("Supabase credentials not configured in Django settings")
             self.client = None
         else:
-            # We'll use REST API directly instead of SDK
-            self.client = True  # Flag to indicate we're ready to use REST API
-            print("✅ Supabase REST API ready\n")
-    
+            self.client = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            self.client.mount('http://', adapter)
+            self.client.mount('https://', adapter)
+            self.client.headers['Authorization'] = f"Bearer {self.supabase_key}"
+            logger.info("Supabase storage ready (bucket %s)", self.bucket_name)
+
+    def _request(self, operation, method, url, **kwargs):
+        """
+        Send one request with timeouts, retries and the circuit breaker.
+        Returns the final response, or raises StorageUnavailable /
+        requests.RequestException.
+        """
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                self.metrics.record(operation, 0.0, False)
+                raise StorageUnavailable(f"Supabase storage circuit is {self.breaker.state}")
+
+            started = time.monotonic()
+            try:
+                response = self.client.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                response, error = None, e
+            else:
+                error = None
+            elapsed = time.monotonic() - started
+
+            transient = error is not None or response.status_code in self.RETRY_STATUSES
+            self.metrics.record(operation, elapsed, not transient)
+            if not transient:
+                self.breaker.record_success()
+                return response
+
+            self.breaker.record_failure()
+            if attempt == self.retries:
+                if error is not None:
+                    raise error
+                return response
+            # Full jitter: sleep a random time up to the exponential step
+            time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+
     def upload_image(self, image_file, filename):
         """
         Upload image to Supabase using REST API and return public URL
-        
+
         Args:
-            image_file: Django UploadedFile object
+            image_file: File-like object opened in binary mode
             filename: Desired filename in Supabase
-            
+
         Returns:
             Public URL of the uploaded image or None if failed
         """
+        image_file.seek(0)
+        return self.upload_bytes(image_file.read(), filename)
+
+    def upload_bytes(self, data, filename):
+        """Upload raw bytes as `filename`; returns the public URL or None"""
         if not self.client:
             logger.error("Supabase not configured")
-            print("❌ Supabase not configured")
             return None
-        
+
+        # Format: https://projecturl.supabase.co/storage/v1/object/bucketname/filename
+        upload_url = f"{self.supabase_url}/storage/v1/object/{self.bucket_name}/{filename}"
+        headers = {
+            "Content-Type": mimetypes.guess_type(filename)[0] or "image/jpeg",
+            # Makes a retried upload idempotent instead of a 409 duplicate
+            "x-upsert": "true",
+        }
+
         try:
-            # Reset file pointer to beginning
-            image_file.seek(0)
-            
-            # Read image file data
-            image_data = image_file.read()
-            print(f"\n📤 Uploading image to Supabase:")
-            print(f"  Filename: {filename}")
-            print(f"  Bucket: {self.bucket_name}")
-            print(f"  File size: {len(image_data)} bytes")
-            
-            # Build the correct REST API endpoint for file upload
-            # Format: https://projecturl.supabase.co/storage/v1/object/bucketname/filename
-            upload_url = f"{self.supabase_url}/storage/v1/object/{self.bucket_name}/{filename}"
-            
-            # Prepare headers with authorization
-            headers = {
-                "Authorization": f"Bearer {self.supabase_key}",
-                "Content-Type": "image/jpeg"
-            }
-            
-            print(f"  Upload URL: {upload_url}")
-            print(f"  Using anon key for public upload...")
-            
-            # Upload using REST API
-            response = requests.post(
-                upload_url,
-                data=image_data,
-                headers=headers
-            )
-            
-            print(f"  Upload response status: {response.status_code}")
-            
-            if response.status_code in [200, 201]:
-                # Construct public URL
-                public_url = f"{self.supabase_url}/storage/v1/object/public/{self.bucket_name}/{filename}"
-                print(f"  ✅ Public URL: {public_url}\n")
-                logger.info(f"Image uploaded successfully: {public_url}")
-                return public_url
+            response = self._request('upload', 'POST', upload_url, data=data, headers=headers)
+        except (StorageUnavailable, requests.RequestException) as e:
+            logger.error("Error uploading image to Supabase: %s", e)
+            return None
+
+        if response.status_code in [200, 201]:
+            public_url = self.get_public_url(filename)
+            logger.info("Image uploaded successfully: %s", public_url)
+            return public_url
+
+        error_msg = response.text
+        if "row-level security" in error_msg.lower():
+            logger.error("Upload rejected by row-level security; add an insert policy to bucket %s", self.bucket_name)
+        logger.error("Upload failed: %s - %s", response.status_code, error_msg)
+        return None
+
+    def _is_storage_url(self, url):
+        """Whether `url` points into this Supabase project (same origin and path prefix)"""
+        base, target = urlsplit(self.supabase_url.rstrip('/') + '/'), urlsplit(url)
+        return (
+            (target.scheme, target.netloc.lower()) == (base.scheme, base.netloc.lower())
+            and target.path.startswith(base.path)
+        )
+
+    def download(self, url):
+        """
+        Fetch an object (e.g. a public image URL); returns bytes or None.
+        Only URLs under SUPABASE_URL go through the authenticated client;
+        anything else (an image hosted elsewhere) is fetched with a plain
+        request so the service-role key never leaves the project.
+        """
+        if not self.client:
+            return None
+        try:
+            if self._is_storage_url(url):
+                response = self._request('download', 'GET', url)
             else:
-                error_msg = response.text
-                print(f"  ❌ Upload failed: {response.status_code}")
-                print(f"  Error: {error_msg}\n")
-                
-                if "row-level security" in error_msg.lower():
-                    print("  💡 TIP: Your Supabase bucket has RLS enabled.")
-                    print("     Go to Storage → inv_management → Policies")
-                    print("     Either disable RLS or add a policy to allow public uploads.\n")
-                
-                logger.error(f"Upload failed: {response.status_code} - {error_msg}")
-                return None
-            
-        except Exception as e:
-            print(f"  ❌ Error uploading image: {str(e)}\n")
-            logger.error(f"Error uploading image to Supabase: {str(e)}")
-            import traceback
-            traceback.print_exc()
+                response = requests.get(url, timeout=self.timeout)
+        except (StorageUnavailable, requests.RequestException) as e:
+            logger.error("Error downloading %s: %s", url, e)
+            return None
+        if response.status_code != 200:
+            logger.error("Error downloading %s: %s", url, response.status_code)
             return None
-    
+        return response.content
+
     def delete_image(self, filename):
         """Delete image from Supabase using REST API"""
         if not self.client:
             return False
-        
+
+        delete_url = f"{self.supabase_url}/storage/v1/object/{self.bucket_name}/{filename}"
         try:
-            delete_url = f"{self.supabase_url}/storage/v1/object/{self.bucket_name}/{filename}"
-            headers = {
-                "Authorization": f"Bearer {self.supabase_key}"
-            }
-            
-            response = requests.delete(delete_url, headers=headers)
-            
-            if response.status_code in [200, 204]:
-                logger.info(f"Image deleted: {filename}")
-                return True
-            else:
-                logger.error(f"Error deleting image: {response.status_code}")
-                return False
-        except Exception as e:
-            logger.error(f"Error deleting image: {str(e)}")
+            response = self._request('delete', 'DELETE', delete_url)
+        except (StorageUnavailable, requests.RequestException) as e:
+            logger.error("Error deleting image: %s", e)
             return False
-    
+
+        if response.status_code in [200, 204]:
+            logger.info("Image deleted: %s", filename)
+            return True
+        logger.error("Error deleting image: %s", response.status_code)
+        return False
+
+    def remove_objects(self, filenames):
+        """
+        Delete many objects with one request to the multi-object remove
+        endpoint. Returns True when storage accepted the batch.
+        """
+        if not self.client:
+            return False
+
+        remove_url = f"{self.supabase_url}/storage/v1/object/{self.bucket_name}"
+        try:
+            response = self._request('delete', 'DELETE', remove_url, json={'prefixes': list(filenames)})
+        except (StorageUnavailable, requests.RequestException) as e:
+            logger.error("Error deleting images: %s", e)
+            return False
+
+        if response.status_code == 200:
+            logger.info("Deleted %s objects", len(filenames))
+            return True
+        logger.error("Error deleting images: %s - %s", response.status_code, response.text)
+        return False
+
     def get_public_url(self, filename):
         """Get public URL for an image"""
         if not self.client:
             return None
-        
-        try:
-            url = f"{self.supabase_url}/storage/v1/object/public/{self.bucket_name}/{filename}"
-            return url
-        except Exception as e:
-            logger.error(f"Error getting public URL: {str(e)}")
-            return None
-    
+        return f"{self.supabase_url}/storage/v1/object/public/{self.bucket_name}/{filename}"
 
 
 # Singleton instance
 _supabase_storage = None
+_supabase_storage_lock = threading.Lock()
 
 def get_supabase_storage():
-    """Get or create Supabase storage instance"""
+    """Get or create the process-wide Supabase storage instance"""
     global _supabase_storage
     if _supabase_storage is None:
-        _supabase_storage = SupabaseStorage()
-    return _supabase_storage
\ No newline at end of file
+        with _supabase_storage_lock:
+            if _supabase_storage is None:
+                _supabase_storage = SupabaseStorage()
+    return _supabase_storage
+
+
+@receiver(setting_changed)
+def _reset_supabase_storage(setting, **kwargs):
+    """Rebuild the client when SUPABASE_* settings change (tests)"""
+    global _supabase_storage
+    if setting.startswith('SUPABASE_'):
+        _supabase_storage = None
@@ -1,3 +1,993 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from PIL import Image
+from prometheus_client import REGISTRY
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from suppliers.models import Supplier
+
+from .models import DailySalesSummary, LowStockEvent, SlowQuery, Stock, StockHistory, StockMovement, Sale, StorageJob
+from .importers import import_stock
+from .jobs import run_pending
+from .middleware import ProfilingMiddleware, RequestTimingMiddleware
+from . import archive, caching, filters, perf, profiling, reports, slowlog
+from .pagination import CursorPaginator
+from .rollups import rebuild, totals
+from .search import search_stock
+from .supabase_storage import CallMetrics, SupabaseStorage
+from .services import InsufficientStock, InvalidQuantity, issue_stock, receive_stock, reverse_sale, sell_cart
+
+
+class StockMovementTests(TestCase):
+    def setUp(self):
+        self.stock = Stock.objects.create(item_name='Cable', quantity=10, price='100')
+
+    def test_issue_decrements_and_logs_movement(self):
+        alice = User.objects.create_user('alice')
+        stock = issue_stock(self.stock.id, 4, user=alice, issue_to='Lab')
+        self.assertEqual((stock.quantity, stock.issue_by), (6, 'alice'))
+        movement = StockMovement.objects.get(stock=self.stock)
+        self.assertEqual(
+            (movement.kind, movement.delta, movement.balance, movement.actor, movement.party),
+            (StockMovement.Kind.ISSUE, -4, 6, alice, 'Lab'),
+        )
+
+    def test_issue_more_than_available_is_rejected(self):
+        with self.assertRaises(InsufficientStock):
+            issue_stock(self.stock.id, 11)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 10)
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_non_positive_quantities_are_rejected(self):
+        for quantity in (0, -5):
+            with self.assertRaises(InvalidQuantity):
+                issue_stock(self.stock.id, quantity)
+            with self.assertRaises(InvalidQuantity):
+                receive_stock(self.stock.id, quantity)
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        response = self.client.post(reverse('issue_items', args=[self.stock.id]), {'issue_quantity': -5})
+        self.assertEqual(response.status_code, 200)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 10)
+        self.assertFalse(StockMovement.objects.exists())
+
+    def test_receive_increments(self):
+        stock = receive_stock(self.stock.id, 5, user=User.objects.create_user('bob'))
+        self.assertEqual(stock.quantity, 15)
+
+    def test_sale_and_reversal(self):
+        ann, bob = User.objects.create_user('ann'), User.objects.create_user('bob')
+        sale = Sale.objects.create(stock=self.stock, quantity_sold=3, selling_price=Decimal('100'), sold_by='ann')
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 7)
+        sell_cart([(self.stock.id, 1, Decimal('100')), (self.stock.id, 2, Decimal('100'))], user=bob)
+
+        reverse_sale(sale, user=bob)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantity, 7)
+        self.assertEqual(
+            list(self.stock.movements.order_by('id').values_list('kind', 'delta', 'balance', 'actor')),
+            [(StockMovement.Kind.SALE, -3, 7, ann.pk), (StockMovement.Kind.SALE, -1, 6, bob.pk),
+             (StockMovement.Kind.SALE, -2, 4, bob.pk), (StockMovement.Kind.SALE_REVERSAL, 3, 7, bob.pk)],
+        )
+
+    def test_quantity_edits_are_logged_as_adjustments(self):
+        clerk = User.objects.create_user('clerk', password='pw')
+        self.client.force_login(clerk)
+        self.client.post(reverse('update_items', args=[self.stock.id]), {
+            'item_name': 'Cable', 'category': 'Wires', 'quantity': 8,
+        })
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.quantity, self.stock.category), (8, 'Wires'))
+        self.assertEqual(
+            list(StockMovement.objects.values_list('kind', 'delta', 'balance', 'actor')),
+            [(StockMovement.Kind.ADJUST, -2, 8, clerk.pk)],
+        )
+
+    def test_history_rows_cannot_be_deleted(self):
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        receive_stock(self.stock.id, 5)
+        movement = StockMovement.objects.get()
+        self.client.post(reverse('delete_history', args=[movement.pk]))
+        self.client.post(reverse('bulk_delete_history'), {'history_ids': [movement.pk]})
+        self.assertTrue(StockMovement.objects.filter(pk=movement.pk).exists())
+
+    def test_legacy_history_is_converted_to_movements(self):
+        User.objects.create_user('carol')
+        now = timezone.now()
+        StockHistory.objects.create(stock_id=self.stock.id, item_name='Cable', quantity=10, created_by='carol', last_updated=now)
+        StockHistory.objects.create(stock_id=self.stock.id, item_name='Cable', quantity=7, issue_quantity=3, issue_to='Lab', last_updated=now)
+        call_command('convert_stock_history', batch_size=1, stdout=StringIO())
+
+        self.assertFalse(StockHistory.objects.exists())
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('kind', 'delta', 'balance', 'actor__username', 'party')),
+            [(StockMovement.Kind.CREATE, 10, 10, 'carol', ''), (StockMovement.Kind.ISSUE, -3, 7, None, 'Lab')],
+        )
+        self.assertFalse(Sale.objects.exists())
+
+    def test_oversell_does_not_create_sale(self):
+        with self.assertRaises(InsufficientStock):
+            Sale.objects.create(stock=self.stock, quantity_sold=11, selling_price=Decimal('100'))
+        self.assertFalse(Sale.objects.exists())
+
+
+class DirtyFieldTrackingTests(TestCase):
+    def test_save_writes_only_changed_columns_without_reading_first(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=5, price='5', image='https://cdn/x/old.jpg')
+        stock = Stock.objects.get(pk=pen.pk)
+        self.assertEqual(stock.get_dirty_fields(), {})
+
+        stock.quantity = 7
+        self.assertEqual(stock.get_dirty_fields(), {'quantity': 5})
+        with CaptureQueriesContext(connection) as ctx:
+            stock.save()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertTrue(sql.startswith('UPDATE'))
+        self.assertIn('"quantity"', sql)
+        self.assertNotIn('"item_name"', sql)
+        self.assertEqual(stock.get_dirty_fields(), {})
+
+        stock.image = 'https://cdn/x/new.jpg'
+        self.assertEqual(stock.get_dirty_fields(), {'image': 'https://cdn/x/old.jpg'})
+        stock.save()
+        self.assertEqual(Stock.objects.get(pk=pen.pk).image, 'https://cdn/x/new.jpg')
+
+
+    def test_deferred_fields_assigned_later_are_saved(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=1, price='5')
+        stock = Stock.objects.only('id', 'item_name').get(pk=pen.pk)
+        stock.quantity = 9
+        stock.save()
+        self.assertEqual(Stock.objects.get(pk=pen.pk).quantity, 9)
+
+    def test_save_of_a_deleted_row_inserts_it_again(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=1, price='5')
+        stock = Stock.objects.get(pk=pen.pk)
+        Stock.objects.filter(pk=pen.pk).delete()
+        stock.quantity = 3
+        stock.save()
+        self.assertEqual(Stock.objects.get(pk=pen.pk).quantity, 3)
+
+
+class CheckoutViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='pw')
+        self.client.force_login(self.user)
+        self.pen = Stock.objects.create(item_name='Pen', quantity=10, price='20')
+        self.pad = Stock.objects.create(item_name='Pad', quantity=2, price='50')
+
+    def post_cart(self, items):
+        return self.client.post(reverse('checkout'), data=json.dumps({'items': items}), content_type='application/json')
+
+    def test_checkout_sells_whole_cart(self):
+        response = self.post_cart([
+            {'stock': self.pen.id, 'quantity': 3, 'selling_price': '20.00'},
+            {'stock': self.pad.id, 'quantity': 2, 'selling_price': '45.50'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        receipt = response.json()['receipt']
+        self.assertEqual(receipt['total'], '151.00')
+        self.assertEqual(receipt['total_quantity'], 5)
+        self.assertEqual(Sale.objects.filter(sold_by='cashier').count(), 2)
+        self.pen.refresh_from_db()
+        self.pad.refresh_from_db()
+        self.assertEqual((self.pen.quantity, self.pad.quantity), (7, 0))
+
+    def test_short_line_rolls_back_entire_cart(self):
+        response = self.post_cart([
+            {'stock': self.pen.id, 'quantity': 1, 'selling_price': '20'},
+            {'stock': self.pad.id, 'quantity': 3, 'selling_price': '50'},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(str(self.pad.id), response.json()['errors'])
+        self.assertFalse(Sale.objects.exists())
+        self.pen.refresh_from_db()
+        self.assertEqual(self.pen.quantity, 10)
+
+    def test_invalid_line_is_rejected(self):
+        response = self.post_cart([{'stock': self.pen.id, 'quantity': 0, 'selling_price': '20'}])
+        self.assertEqual(response.status_code, 400)
+
+
+class StockImportTests(TestCase):
+    def test_csv_upsert_and_error_report(self):
+        Stock.objects.create(item_name='Mouse', brand='Logi', category='Peripherals', quantity=1, price='10')
+        upload = SimpleUploadedFile('catalog.csv', (
+            "Item Name,Brand,Category,Quantity,Price,Supplier\n"
+            "Mouse,Logi,Peripherals,25,12.5,Acme\n"
+            "Keyboard,Logi,Peripherals,5,30,Acme\n"
+            ",Logi,Peripherals,5,30,Acme\n"
+            "Monitor,Dell,Displays,lots,200,\n"
+        ).encode())
+
+        report = import_stock(upload, upload.name, username='importer', chunk_size=2)
+
+        self.assertEqual(report.rows, 4)
+        self.assertEqual(report.imported, 2)
+        self.assertEqual([row for row, _ in report.errors], [4, 5])
+        mouse = Stock.objects.get(item_name='Mouse')
+        self.assertEqual((mouse.quantity, mouse.price, mouse.supplier.name), (25, Decimal('12.50'), 'Acme'))
+        self.assertEqual(Stock.objects.count(), 2)
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(kind=StockMovement.Kind.IMPORT).values_list('delta', flat=True)),
+            [5, 24],
+        )
+
+    def test_import_updates_items_saved_with_blank_brand_and_category(self):
+        Stock.objects.create(item_name='Pen', quantity=1, price='2')
+        legacy = Stock.objects.create(item_name='Ink', quantity=1, price='2')
+        Stock.objects.filter(pk=legacy.pk).update(brand=None, category=None)
+        upload = SimpleUploadedFile('catalog.csv', b"item_name,quantity,price\nPen,5,2\nInk,7,2\n")
+
+        import_stock(upload, upload.name)
+        self.assertEqual(
+            sorted(Stock.objects.values_list('item_name', 'brand', 'category', 'quantity')),
+            [('Ink', '', '', 7), ('Pen', '', '', 5)],
+        )
+
+    def test_columns_missing_or_blank_in_the_file_are_kept(self):
+        acme = Supplier.objects.create(name='Acme')
+        Stock.objects.create(item_name='Widget', quantity=1, price=Decimal('12.50'), reorder_level=3, supplier=acme)
+        Stock.objects.create(item_name='Gadget', quantity=1, price=Decimal('4.00'), reorder_level=2, supplier=acme)
+        for body in (b"item_name,quantity\nWidget,7\n", b"item_name,quantity,price,reorder_level,supplier\nGadget,9,,,\n"):
+            import_stock(SimpleUploadedFile('catalog.csv', body), 'catalog.csv')
+        self.assertEqual(
+            sorted(Stock.objects.values_list('item_name', 'quantity', 'price', 'reorder_level', 'supplier__name')),
+            [('Gadget', 9, Decimal('4.00'), 2, 'Acme'), ('Widget', 7, Decimal('12.50'), 3, 'Acme')],
+        )
+
+    def test_out_of_range_and_rejected_chunks_are_reported(self):
+        from unittest import mock
+
+        upload = SimpleUploadedFile('catalog.csv', b"item_name,quantity\nPen,99999999999\nInk,4\nCap,5\n")
+        with mock.patch('inventorymgmt.importers.sync_low_stock', side_effect=[None, DatabaseError('boom')]):
+            report = import_stock(upload, upload.name, chunk_size=1)
+        self.assertEqual(report.errors[0], (2, 'quantity is too large'))
+        self.assertEqual(report.error_count, 2)
+        self.assertEqual(list(Stock.objects.values_list('item_name', flat=True)), ['Ink'])
+
+    def test_xlsx_import(self):
+        from io import BytesIO, StringIO
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        workbook.active.append(['item_name', 'quantity', 'price'])
+        workbook.active.append(['Cable', 3, 4.5])
+        buffer = BytesIO()
+        workbook.save(buffer)
+        buffer.seek(0)
+
+        report = import_stock(buffer, 'catalog.xlsx')
+        self.assertEqual(report.imported, 1)
+        self.assertEqual(Stock.objects.get(item_name='Cable').quantity, 3)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        Stock.objects.create(item_name='Laptop', brand='Dell', quantity=2, price='900')
+        Stock.objects.create(item_name='Lamp', brand='Ikea', quantity=5, price='20')
+
+    def test_stock_csv_is_streamed_with_filters(self):
+        response = self.client.get(reverse('export_to_csv'), {'brand': 'dell'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Laptop', lines[1])
+
+    def test_sales_xlsx(self):
+        from io import BytesIO, StringIO
+        from openpyxl import load_workbook
+
+        Sale.objects.create(stock=Stock.objects.get(item_name='Lamp'), quantity_sold=1, selling_price=Decimal('20'))
+        response = self.client.get(reverse('export_data', args=['sales']), {'format': 'xlsx'})
+        self.assertTrue(response.streaming)
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(workbook.sheetnames, ['Sales'])
+        rows = list(workbook.active.values)
+        self.assertEqual(rows[0][:3], ('ID', 'Date', 'Item Name'))
+        self.assertEqual((rows[1][2], rows[1][5], rows[1][7]), ('Lamp', 1, 20))
+
+    def test_xlsx_rows_past_the_sheet_limit_continue_on_a_new_sheet(self):
+        from io import BytesIO
+        from unittest import mock
+        from openpyxl import load_workbook
+        from . import exports
+
+        with mock.patch.object(exports, 'SHEET_ROWS', 2):
+            response = self.client.get(reverse('export_data', args=['stock']), {'format': 'xlsx'})
+            workbook = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(workbook.sheetnames, ['Inventory', 'Inventory (2)'])
+        self.assertEqual([ws.max_row for ws in workbook.worksheets], [2, 2])
+
+    def test_unknown_dataset(self):
+        self.assertEqual(self.client.get(reverse('export_data', args=['users'])).status_code, 404)
+
+
+class CursorPaginatorTests(TestCase):
+    def test_walks_forward_and_back_through_ties(self):
+        stock = Stock.objects.create(item_name='Pen', quantity=0, price='5')
+        now = timezone.now()
+        for i in range(7):
+            # Pairs of rows share a timestamp to exercise the id tie-breaker
+            StockMovement.objects.create(stock=stock, kind=StockMovement.Kind.RECEIVE, delta=1,
+                                         created_at=now - timedelta(minutes=i // 2))
+        expected = list(StockMovement.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        paginator = CursorPaginator(StockMovement.objects.all(), 3, 'created_at', count_mode='exact')
+        pages = [paginator.get_page(None)]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([row.id for page in pages for row in page], expected)
+        self.assertEqual(paginator.count, 7)
+
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual([row.id for row in back], [row.id for row in pages[1]])
+        self.assertTrue(back.has_previous)
+
+        with CaptureQueriesContext(connection) as ctx:
+            paginator.get_page(pages[0].next_cursor)
+        self.assertNotIn('IS NULL', ctx.captured_queries[0]['sql'])
+        self.assertNotIn('NULLS', ctx.captured_queries[0]['sql'])
+
+    def test_garbled_cursor_starts_at_first_page(self):
+        stock = Stock.objects.create(item_name='Pen', quantity=1, price='5')
+        StockMovement.objects.create(stock=stock, kind=StockMovement.Kind.CREATE, delta=1)
+        page = CursorPaginator(StockMovement.objects.all(), 3, 'created_at').get_page('not-a-token')
+        self.assertEqual(len(page), 1)
+
+    def test_nullable_key_is_rejected(self):
+        with self.assertRaises(ValueError):
+            CursorPaginator(StockHistory.objects.all(), 3, 'last_updated')
+
+
+@override_settings(TIME_ZONE='Asia/Kathmandu')
+class DateRangeFilterTests(TestCase):
+    def test_local_day_filters_are_half_open_ranges(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=50, price='5')
+        day = timezone.localdate()
+        start = filters.day_start(day)
+        edges = [start - timedelta(microseconds=1), start, start + timedelta(days=1) - timedelta(microseconds=1), start + timedelta(days=1)]
+        for moment in edges:
+            sale = Sale.objects.create(stock=pen, quantity_sold=1, selling_price=Decimal('5'))
+            Sale.objects.filter(pk=sale.pk).update(sale_date=moment)
+
+        sales = filters.filter_sales(Sale.objects.all(), date_from=day, date_to=day)
+        self.assertEqual(sorted(sales.values_list('sale_date', flat=True)), edges[1:3])
+        self.assertNotIn('django_datetime_cast_date', str(sales.query))
+
+    def test_stock_details_shows_recent_movements_and_sales(self):
+        self.client.force_login(User.objects.create_user('ann'))
+        pen = Stock.objects.create(item_name='Pen', quantity=50, price='5')
+        receive_stock(pen.id, 5)
+        Sale.objects.create(stock=pen, quantity_sold=2, selling_price=Decimal('5'), sold_by='ann')
+
+        response = self.client.get(reverse('stock_details', args=[pen.id]))
+        self.assertEqual([m.kind for m in response.context['movements']], [StockMovement.Kind.SALE, StockMovement.Kind.RECEIVE])
+        self.assertEqual([s.quantity_sold for s in response.context['sales']], [2])
+
+
+class SearchTests(TestCase):
+    def test_matches_are_ranked_by_relevance(self):
+        Stock.objects.create(item_name='USB Cable', brand='Anker', category='Cables')
+        Stock.objects.create(item_name='Cable', brand='Belkin', category='Cables')
+        Stock.objects.create(item_name='Charger', brand='Cable Co', category='Power')
+        Stock.objects.create(item_name='Mouse', brand='Logi', category='Peripherals')
+
+        names = [s.item_name for s in search_stock(Stock.objects.all(), query='cable')]
+        self.assertEqual(names[0], 'Cable')
+        self.assertEqual(set(names), {'Cable', 'USB Cable', 'Charger'})
+
+        names = [s.item_name for s in search_stock(Stock.objects.all(), category='power')]
+        self.assertEqual(names, ['Charger'])
+
+
+class DailySalesSummaryTests(TestCase):
+    def test_rollup_tracks_sales_and_matches_rebuild(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=50, price='5')
+        Sale.objects.create(stock=pen, quantity_sold=2, selling_price=Decimal('5'), sold_by='ann')
+        sell_cart([(pen.id, 3, Decimal('4.50')), (pen.id, 1, Decimal('5'))], user=User.objects.create_user('ann'))
+        refund = Sale.objects.create(stock=pen, quantity_sold=4, selling_price=Decimal('5'), sold_by='bob')
+        reverse_sale(refund)
+
+        live = totals(DailySalesSummary.objects.all())
+        self.assertEqual(live, {'total': Decimal('28.50'), 'qty': 6, 'count': 3})
+
+        rebuild()
+        self.assertEqual(totals(DailySalesSummary.objects.all()), live)
+        self.assertEqual(DailySalesSummary.objects.get().sold_by, 'ann')
+
+    def test_rebuild_keeps_days_whose_sales_were_archived(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=50, price='5')
+        Sale.objects.create(stock=pen, quantity_sold=1, selling_price=Decimal('5'), sold_by='ann')
+        archived_day = timezone.localdate() - timedelta(days=400)
+        archived = DailySalesSummary.objects.create(day=archived_day, stock=pen, sold_by='ann',
+                                                    quantity=3, revenue=Decimal('6.00'), sales_count=3)
+        rebuild()
+        rebuild(date_from=archived_day)
+        archived.refresh_from_db()
+        self.assertEqual((archived.quantity, archived.revenue), (3, Decimal('6.00')))
+        self.assertEqual(totals(DailySalesSummary.objects.all())['qty'], 4)
+
+    def test_deleted_items_fold_into_one_row_that_reversals_find(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=50, price='5')
+        ink = Stock.objects.create(item_name='Ink', quantity=50, price='9')
+        Sale.objects.create(stock=pen, quantity_sold=2, selling_price=Decimal('5'), sold_by='ann')
+        refund = Sale.objects.create(stock=ink, quantity_sold=1, selling_price=Decimal('9'), sold_by='ann')
+        Stock.objects.filter(pk__in=[pen.pk, ink.pk]).delete()
+
+        row = DailySalesSummary.objects.get()
+        self.assertEqual((row.stock_id, row.quantity, row.sales_count), (None, 3, 2))
+        refund.refresh_from_db()
+        reverse_sale(refund)
+        live = totals(DailySalesSummary.objects.all())
+        self.assertEqual(live, {'total': Decimal('10.00'), 'qty': 2, 'count': 1})
+        rebuild()
+        self.assertEqual(totals(DailySalesSummary.objects.all()), live)
+
+
+class ArchiveTests(TestCase):
+    def test_old_rows_move_to_month_files_and_stay_readable(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=50, price='5')
+        old, recent = [
+            Sale.objects.create(stock=pen, quantity_sold=qty, selling_price=Decimal('5'), sold_by='ann')
+            for qty in (2, 3)
+        ]
+        then = timezone.now() - timedelta(days=400)
+        Sale.objects.filter(pk=old.pk).update(sale_date=then)
+        StockMovement.objects.filter(sale=old).update(created_at=then)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(ARCHIVE_DIR=directory):
+            for fmt, name in (('jsonl', 'movements'), ('csv', 'sales')):
+                call_command('archive_data', dataset=name, format=fmt, batch_size=1, stdout=StringIO())
+
+            self.assertEqual(list(Sale.objects.values_list('pk', flat=True)), [recent.pk])
+            self.assertFalse(StockMovement.objects.filter(sale_id=old.pk).exists())
+            self.assertEqual(DailySalesSummary.objects.count(), 1)
+
+            sales = archive.DATASETS['sales']
+            self.assertEqual(archive.archived_months(sales), [timezone.localtime(then).strftime('%Y-%m')])
+            rows = list(archive.query(sales, date_from=timezone.localdate(then), stock_id=pen.pk))
+            self.assertEqual([(row['id'], row['quantity_sold']) for row in rows], [(str(old.pk), '2')])
+            movements = list(archive.query(archive.DATASETS['movements'], date_to=timezone.localdate(then)))
+            self.assertEqual([row['sale_id'] for row in movements], [old.pk])
+
+
+@override_settings(PERF_ALLOW_DATABASE=True)
+class PerfToolsTests(TestCase):
+    def test_seed_bench_and_flush(self):
+        # Totals of a day whose sales were archived must survive seed and flush
+        archived = DailySalesSummary.objects.create(day=timezone.localdate() - timedelta(days=900), sold_by='ann',
+                                                    quantity=3, revenue=Decimal('30'), sales_count=1)
+        call_command('seed_perf_data', stocks=20, stdout=StringIO())
+        self.assertEqual(Stock.objects.count(), 20)
+        self.assertEqual(Sale.objects.count(), 100)
+        self.assertEqual(totals(DailySalesSummary.objects.exclude(pk=archived.pk))['count'], 100)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_views', repeat=2, warmup=0, output=output, stdout=StringIO())
+            with open(output) as fileobj:
+                results = json.load(fileobj)['results']['20']
+        self.assertEqual(set(results), set(perf.VIEWS))
+        for metrics in results.values():
+            self.assertEqual(metrics['status'], 200)
+            self.assertGreater(metrics['queries'], 0)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p95_ms'])
+
+        perf.flush()
+        self.assertFalse(Stock.objects.exists() or Sale.objects.exists() or StockMovement.objects.exists())
+        self.assertEqual(list(DailySalesSummary.objects.values_list('pk', flat=True)), [archived.pk])
+
+    @override_settings(PERF_ALLOW_DATABASE=False, DEBUG=False)
+    def test_refuses_to_write_to_a_production_database(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_perf_data', stocks=5, stdout=StringIO())
+        self.assertFalse(Stock.objects.exists())
+
+
+class RequestTimingMiddlewareTests(TestCase):
+    @override_settings(QUERY_REPEAT_THRESHOLD=3)
+    def test_counts_queries_and_flags_repeated_statements(self):
+        stocks = [Stock.objects.create(item_name=f'Item {n}') for n in range(3)]
+
+        def n_plus_one(request):
+            for stock in stocks:
+                list(Sale.objects.filter(stock=stock))
+            list(Sale.objects.filter(stock=stocks[0]))
+            return HttpResponse('ok')
+
+        middleware = RequestTimingMiddleware(n_plus_one)
+        with self.assertLogs('inventorymgmt.requests', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/list/'))
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="4 queries", app;dur=[\d.]+, total;dur=[\d.]+$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(
+            (record['path'], record['queries'], record['duplicate_queries'], record['max_repeats']),
+            ('/list/', 4, 1, 4),
+        )
+        self.assertIn('inventorymgmt_sale', record['repeated_sql'])
+
+
+@override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_EXPLAIN=False, SLOW_QUERY_BACKGROUND=False)
+class SlowQueryLogTests(TestCase):
+    def test_slow_statements_are_aggregated_by_fingerprint_and_explained(self):
+        def view(request):
+            for name in ('cable', 'mouse'):
+                list(Stock.objects.filter(item_name__icontains=name)[:5])
+            return HttpResponse('ok')
+
+        RequestTimingMiddleware(view)(RequestFactory().get('/items/'))
+        # Nothing is written on the request path
+        self.assertFalse(SlowQuery.objects.exists())
+        slowlog.drain()
+
+        query = SlowQuery.objects.get()
+        self.assertEqual(query.calls, 2)
+        self.assertIn('LIKE ?', query.statement)
+        self.assertNotIn('cable', query.statement)
+        self.assertNotIn('mouse', query.example_sql + query.example_params)
+        self.assertEqual(query.example_params, '["str"]')
+        self.assertRegex(query.call_site, r'^inventorymgmt/tests.py:\d+ in view$')
+        self.assertEqual(
+            slowlog.normalize("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 10"),
+            "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+
+        out = StringIO()
+        call_command('slow_query_report', explain=True, plans=True, stdout=out)
+        query.refresh_from_db()
+        self.assertTrue(query.plan and not query.plan.startswith('EXPLAIN failed'), query.plan)
+        self.assertIn(query.fingerprint[:12], out.getvalue())
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            PROFILING_ENABLED=True, PROFILE_DIR=directory.name, PROFILE_MAX_FILES=2,
+            PROFILE_SLOW_MS=20, PROFILE_SAMPLE_INTERVAL_MS=1,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def slow_view(self, request):
+        time.sleep(0.06)
+        return HttpResponse('ok')
+
+    def test_profiles_sampled_and_slow_requests_into_ring_buffer(self):
+        with override_settings(PROFILE_SAMPLE_RATE=1.0):
+            ProfilingMiddleware(lambda request: HttpResponse('fast'))(RequestFactory().get('/fast/'))
+        with override_settings(PROFILE_SAMPLE_RATE=0.0):
+            middleware = ProfilingMiddleware(self.slow_view)
+            middleware(RequestFactory().get('/slow/'))
+            middleware(RequestFactory().get('/slow/?again=1'))
+            ProfilingMiddleware(lambda request: HttpResponse('fast'))(RequestFactory().get('/fast/'))
+
+        profiles = profiling.recent(order='recent')
+        self.assertEqual([p['path'] for p in profiles], ['/slow/?again=1', '/slow/'])
+        self.assertEqual(profiles[0]['kind'], 'sampled')
+        self.assertGreaterEqual(profiles[0]['duration_ms'], 60)
+
+        detail = profiling.load(profiles[0]['id'])
+        self.assertTrue(any('slow_view' in row['function'] for row in detail['functions']))
+
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertContains(self.client.get(reverse('profile_list')), '/slow/?again=1')
+        self.assertContains(self.client.get(reverse('profile_detail', args=[profiles[0]['id']])), 'slow_view')
+        self.assertEqual(self.client.get(reverse('profile_detail', args=['..secret'])).status_code, 404)
+
+
+class MetricsEndpointTests(TestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_exposes_request_sale_and_storage_metrics(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=50, price='5')
+        sales_before = self.sample('inventory_sales_total')
+        movements_before = self.sample('inventory_stock_movements_total', kind='Sold')
+        with self.captureOnCommitCallbacks(execute=True):
+            sell_cart([(pen.id, 1, Decimal('5')), (pen.id, 2, Decimal('5'))])
+        self.assertEqual(self.sample('inventory_sales_total') - sales_before, 2)
+        self.assertEqual(self.sample('inventory_stock_movements_total', kind='Sold') - movements_before, 2)
+
+        failures_before = self.sample('supabase_storage_failures_total', operation='upload')
+        CallMetrics().record('upload', 0.2, False)
+        self.assertEqual(self.sample('supabase_storage_failures_total', operation='upload') - failures_before, 1)
+
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create_user('ann'))
+        self.client.get(reverse('list_items'))
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('django_request_duration_seconds_count{method="GET",view="list_items"}', body)
+        self.assertIn('django_requests_in_flight', body)
+        self.assertIn('supabase_storage_call_seconds_bucket', body)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_catalog_is_served_from_cache_until_a_write_commits(self):
+        before = caching.stats()['pos_items']
+        pen = Stock.objects.create(item_name='Pen', category='Office', quantity=5, price='5')
+        self.assertEqual([s.item_name for s in caching.pos_items()], ['Pen'])
+        with self.assertNumQueries(0):
+            self.assertEqual([s.item_name for s in caching.pos_items()], ['Pen'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            issue_stock(pen.id, 5)
+        self.assertEqual(caching.pos_items(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.create(item_name='Ink', category='Refills', quantity=1, price='2')
+        self.assertEqual(caching.categories(), ['Refills'])
+        after = caching.stats()['pos_items']
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 2))
+
+    def test_catalog_snapshot_etag_and_revalidation(self):
+        user = User.objects.create_user('cashier', password='pw')
+        self.client.force_login(user)
+        pen = Stock.objects.create(item_name='Pen', category='Office', quantity=5, price='5')
+        url = reverse('catalog_snapshot')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], [[pen.id, 'Pen', '5.00', 5, 'Office']])
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            issue_stock(pen.id, 2)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['items'][0][3], 3)
+
+
+class LowStockTests(TestCase):
+    def test_crossings_flip_the_flag_and_log_one_event_each(self):
+        pen = Stock.objects.create(item_name='Pen', quantity=10, price='5', reorder_level=3)
+        self.assertFalse(pen.low_stock)
+
+        issue_stock(pen.id, 7)
+        issue_stock(pen.id, 1)
+        pen.refresh_from_db()
+        self.assertTrue(pen.low_stock)
+        receive_stock(pen.id, 20)
+        pen.refresh_from_db()
+        self.assertFalse(pen.low_stock)
+        self.assertEqual(
+            list(LowStockEvent.objects.order_by('id').values_list('kind', 'quantity')),
+            [(LowStockEvent.Kind.LOW, 3), (LowStockEvent.Kind.RECOVERED, 22)],
+        )
+
+        pen.reorder_level = 30
+        pen.save()
+        self.assertTrue(Stock.objects.get(pk=pen.pk).low_stock)
+        self.assertEqual(caching.low_stock()['count'], 1)
+
+    def test_event_feed_returns_only_newer_events(self):
+        self.client.force_login(User.objects.create_user('clerk'))
+        pen = Stock.objects.create(item_name='Pen', quantity=1, price='5', reorder_level=3)
+        first = LowStockEvent.objects.get()
+        receive_stock(pen.id, 10)
+
+        response = self.client.get(reverse('low_stock_events'), {'after': first.id}).json()
+        self.assertEqual([(e['kind'], e['item_name']) for e in response['events']], [('recovered', 'Pen')])
+        self.assertEqual(
+            self.client.get(reverse('low_stock_events'), {'after': response['last_id']}).json()['events'], []
+        )
+
+
+class ValuationReportTests(TestCase):
+    def test_totals_by_dimension_in_one_query(self):
+        acme = Supplier.objects.create(name='Acme')
+        Stock.objects.create(item_name='Pen', category='Office', brand='Bic', quantity=10, price='2.50', supplier=acme)
+        Stock.objects.create(item_name='Ink', category='Office', quantity=4, price='10', supplier=acme)
+        Stock.objects.create(item_name='Cable', category='Electrical', quantity=3, price=None)
+
+        with self.assertNumQueries(1):
+            report = reports.valuation()
+        self.assertEqual(
+            report['totals'], {'key': '', 'items': 3, 'units': 17, 'value': Decimal('65'), 'unpriced': 1, 'low': 0}
+        )
+        self.assertEqual([(r['key'], r['value']) for r in report['category']], [('Office', 65), ('Electrical', 0)])
+        self.assertEqual([(r['key'], r['items']) for r in report['supplier']], [('Acme', 2), ('', 1)])
+        self.assertEqual([r['key'] for r in report['brand']], ['', 'Bic'])
+
+
+class PriceConversionTests(TransactionTestCase):
+    def test_legacy_text_prices_are_cleaned_and_the_column_converted(self):
+        from .management.commands.convert_prices import is_numeric, legacy_field
+
+        field = Stock._meta.get_field('price')
+        with connection.schema_editor() as editor:
+            editor.alter_field(Stock, field, legacy_field(Stock, field))
+        self.assertFalse(is_numeric(Stock, field))
+        for name, price in [('Pen', 'Rs. 1,200'), ('Ink', ' 49.5 '), ('Cap', 'ask'), ('Nib', None)]:
+            Stock.objects.bulk_create([Stock(item_name=name, quantity=1)])
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE inventorymgmt_stock SET price = %s WHERE item_name = %s", [price, name])
+
+        call_command('convert_prices', stdout=StringIO())
+        self.assertTrue(is_numeric(Stock, field))
+        self.assertEqual(
+            dict(Stock.objects.values_list('item_name', 'price')),
+            {'Pen': Decimal('1200.00'), 'Ink': Decimal('49.50'), 'Cap': None, 'Nib': None},
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SalesAnalyticsTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.client.force_login(User.objects.create_user('owner'))
+        self.today = timezone.localdate()
+        pen = Stock.objects.create(item_name='Pen', category='Office', quantity=50, price=Decimal('5'))
+        ink = Stock.objects.create(item_name='Ink', category='Refills', quantity=50, price=Decimal('20'))
+        for stock, quantity, days_ago, hour, cashier in [(pen, 2, 2, 10, 'ann'), (ink, 1, 0, 9, 'bob'), (pen, 1, 0, 9, 'ann')]:
+            sale = Sale.objects.create(stock=stock, quantity_sold=quantity, selling_price=stock.price, sold_by=cashier)
+            Sale.objects.filter(pk=sale.pk).update(
+                sale_date=filters.day_start(self.today - timedelta(days=days_ago)) + timedelta(hours=hour, minutes=5)
+            )
+        rebuild()
+
+    def get(self, **params):
+        return self.client.get(reverse('sales_analytics'), params)
+
+    def test_buckets_are_gap_filled_and_split_by_dimension(self):
+        data = self.get(bucket='day', **{'from': self.today - timedelta(days=2), 'to': self.today}).json()
+        self.assertEqual(len(data['buckets']), 3)
+        self.assertEqual(data['series'][0]['revenue'], [10.0, 0.0, 25.0])
+        self.assertEqual(data['series'][0]['units'], [2, 0, 2])
+
+        data = self.get(bucket='hour', dimension='category', top=1, **{'from': self.today, 'to': self.today}).json()
+        self.assertEqual(len(data['buckets']), 24)
+        self.assertEqual([(s['label'], s['total_revenue']) for s in data['series']], [('Refills', 20.0), ('Other', 5.0)])
+        self.assertEqual(data['series'][0]['revenue'][9], 20.0)
+
+        self.assertEqual(self.get(bucket='fortnight').status_code, 400)
+
+    def test_results_are_cached_until_the_next_sale(self):
+        params = {'bucket': 'month', 'dimension': 'cashier'}
+        first = self.get(**params).json()
+        with self.assertNumQueries(2):  # session and user only
+            self.assertEqual(self.get(**params).json(), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(stock=Stock.objects.get(item_name='Ink'), quantity_sold=1, selling_price=Decimal('20'), sold_by='cy')
+        labels = [series['label'] for series in self.get(**params).json()['series']]
+        self.assertIn('cy', labels)
+
+
+class FakeStorageServer:
+    """Minimal stand-in for the Supabase storage REST API on localhost"""
+
+    def __init__(self):
+        self.objects = {}
+        self.fail_next = 0
+        self.requests = 0
+        self.removed = []
+        self.auth_seen = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.auth_seen.append(self.headers.get('Authorization'))
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b'image')
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                server.requests += 1
+                if server.fail_next:
+                    server.fail_next -= 1
+                    self.send_response(503)
+                else:
+                    server.objects[self.path] = body
+                    self.send_response(200)
+                self.end_headers()
+
+            def do_DELETE(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                server.requests += 1
+                server.removed.append(sorted(body['prefixes']))
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StorageJobTests(TestCase):
+    def setUp(self):
+        self.server = FakeStorageServer()
+        self.addCleanup(self.server.close)
+        settings = override_settings(
+            SUPABASE_URL=self.server.url,
+            SUPABASE_SERVICE_ROLE_KEY='test-key',
+            SUPABASE_BUCKET_NAME='bucket',
+            SUPABASE_RETRIES=0,
+            SUPABASE_BREAKER_THRESHOLD=2,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+
+    def test_upload_is_queued_then_retried_by_the_worker(self):
+        # 40x20 photo whose EXIF says "rotate 90°"
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        photo = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(photo, format='JPEG', exif=exif)
+        image = SimpleUploadedFile('pen.jpg', photo.getvalue(), content_type='image/jpeg')
+        response = self.client.post(reverse('add_items'), {
+            'item_name': 'Pen', 'quantity': 5, 'category': 'Office', 'brand': 'Bic',
+            'price': '5', 'reorder_level': 1, 'image': image,
+        })
+        self.assertEqual(response.status_code, 302)
+        stock = Stock.objects.get(item_name='Pen')
+        job = StorageJob.objects.get()
+        self.assertIsNone(stock.image)
+        self.assertEqual(bytes(job.payload), photo.getvalue())
+        self.assertEqual(self.server.objects, {})
+
+        storage = SupabaseStorage()
+        self.server.fail_next = 1
+        self.assertEqual(run_pending(storage), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (StorageJob.PENDING, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(run_pending(storage), (0, 0))  # backing off
+
+        StorageJob.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(run_pending(storage), (1, 0))
+        job.refresh_from_db()
+        self.assertIsNone(job.payload)
+
+        stock.refresh_from_db()
+        stem = job.filename.rsplit('.', 1)[0]
+        self.assertEqual(stock.image, f'{self.server.url}/storage/v1/object/public/bucket/{stem}_large.jpg')
+        self.assertEqual(sorted(stock.image_variants), ['large', 'medium', 'thumb'])
+        self.assertEqual(len(self.server.objects), 6)
+        self.assertIn(' 20w', stock.image_webp_srcset)
+
+        large = Image.open(BytesIO(self.server.objects[f'/storage/v1/object/bucket/{stem}_large.jpg']))
+        self.assertEqual(large.size, (20, 40))  # rotated upright
+        self.assertEqual(dict(large.getexif()), {})  # metadata stripped
+
+    def test_deletes_wait_for_commit_and_go_out_in_one_batch(self):
+        cdn = f'{self.server.url}/storage/v1/object/public/bucket'
+        for name in ('a', 'b'):
+            Stock.objects.create(item_name=name, quantity=1, image=f'{cdn}/{name}_large.jpg', image_variants={
+                'thumb': {'width': 160, 'jpeg': f'{cdn}/{name}_thumb.jpg', 'webp': f'{cdn}/{name}_thumb.webp'},
+            })
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Stock.objects.all().delete()
+        self.assertEqual(StorageJob.objects.count(), 0)  # not before commit
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(run_pending(SupabaseStorage()), (6, 0))
+        self.assertEqual(self.server.removed, [[
+            'a_large.jpg', 'a_thumb.jpg', 'a_thumb.webp', 'b_large.jpg', 'b_thumb.jpg', 'b_thumb.webp',
+        ]])
+        self.assertFalse(StorageJob.objects.exclude(status=StorageJob.DONE).exists())
+
+    def test_download_sends_the_key_only_to_supabase(self):
+        elsewhere = FakeStorageServer()
+        self.addCleanup(elsewhere.close)
+        storage = SupabaseStorage()
+        self.assertEqual(storage.download(f'{self.server.url}/storage/v1/object/public/bucket/a.jpg'), b'image')
+        self.assertEqual(storage.download(f'{elsewhere.url}/storage/v1/object/public/bucket/a.jpg'), b'image')
+        self.assertEqual(self.server.auth_seen, ['Bearer test-key'])
+        self.assertEqual(elsewhere.auth_seen, [None])
+
+    def test_worker_exports_the_storage_calls_it_makes(self):
+        from urllib.request import urlopen
+        from . import metrics
+
+        sample = "supabase_storage_call_seconds_count"
+        before = REGISTRY.get_sample_value(sample, {'operation': 'delete'}) or 0
+        StorageJob.objects.create(kind=StorageJob.DELETE, filename='gone_thumb.jpg')
+        call_command('run_storage_worker', once=True, stdout=StringIO())
+        self.assertEqual(REGISTRY.get_sample_value(sample, {'operation': 'delete'}) - before, 1)
+
+        server = metrics.serve(0, '127.0.0.1')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        body = urlopen(f'http://127.0.0.1:{server.server_port}/metrics').read().decode()
+        self.assertIn(f'{sample}{{operation="delete"}} {float(before + 1)}', body)
+
+    def test_storage_client_retries_then_opens_circuit(self):
+        image = SimpleUploadedFile('pen.jpg', b'jpeg')
+        with self.settings(SUPABASE_RETRIES=1):
+            storage = SupabaseStorage()
+            self.server.fail_next = 1
+            self.assertTrue(storage.upload_image(image, 'a.jpg'))
+            self.assertEqual(self.server.requests, 2)
+
+        storage = SupabaseStorage()
+        self.server.fail_next = 10
+        self.assertIsNone(storage.upload_image(image, 'b.jpg'))
+        self.assertIsNone(storage.upload_image(image, 'c.jpg'))
+        self.assertEqual(storage.breaker.state, 'open')
+        self.assertIsNone(storage.upload_image(image, 'd.jpg'))
+        self.assertEqual(self.server.requests, 4)  # refused without a request
+        self.assertEqual(storage.metrics.snapshot()['upload']['failures'], 3)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "needs a database with row-level locking")
+class ConcurrentSaleTests(TransactionTestCase):
+    threads = 16
+    sales_per_thread = 10
+
+    def test_parallel_sales_never_oversell(self):
+        stock = Stock.objects.create(item_name='Hot Item', quantity=100, price='10')
+        results = {'sold': 0, 'rejected': 0}
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(self.sales_per_thread):
+                    try:
+                        Sale.objects.create(stock_id=stock.id, quantity_sold=1, selling_price=Decimal('10'))
+                        outcome = 'sold'
+                    except InsufficientStock:
+                        outcome = 'rejected'
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        stock.refresh_from_db()
+        self.assertEqual(stock.quantity, 0)
+        self.assertEqual(results['sold'], 100)
+        self.assertEqual(results['rejected'], self.threads * self.sales_per_thread - 100)
+        self.assertEqual(Sale.objects.filter(stock=stock).count(), 100)
@@ -5,9 +5,12 @@ urlpatterns = [
     path('', views.home, name="home"),
     path('list_items/', views.list_items, name="list_items"),
     path('add_items/', views.add_items, name="add_items"),
+    path('import_items/', views.import_items, name="import_items"),
     path('update_items/<str:pk>/', views.update_items, name="update_items"),
     path('delete_items/<str:pk>/', views.delete_items, name="delete_items"),
     path('stock_details/<str:pk>/', views.stock_details, name="stock_details"),
+    path('low-stock/events/', views.low_stock_events, name="low_stock_events"),
+    path('reports/valuation/', views.valuation_report, name="valuation_report"),
     path('issue_items/<str:pk>/', views.issue_items, name="issue_items"),
     path('receive_items/<str:pk>/', views.receive_items, name="receive_items"),
     path('reorder_level/<str:pk>/', views.reorder_level, name="reorder_level"),
@@ -15,12 +18,20 @@ urlpatterns = [
     path('history/delete/<int:pk>/',views.delete_history,name= 'delete_history'),
     path('history/bulk-delete/', views.bulk_delete_history, name='bulk_delete_history'),
     path('export-csv/', views.export_to_csv, name='export_to_csv'),
+    path('export/<str:dataset>/', views.export_data, name='export_data'),
     
     # Sales/POS URLs
     path('pos/', views.pos_page, name='pos_page'),
     path('add-sale/', views.add_sale, name='add_sale'),
+    path('checkout/', views.checkout, name='checkout'),
     path('get-product-price/<int:product_id>/', views.get_product_price, name='get_product_price'),
+    path('catalog-snapshot/', views.catalog_snapshot, name='catalog_snapshot'),
+    path('storage-metrics/', views.storage_metrics, name='storage_metrics'),
+    path('metrics', views.metrics, name='metrics'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:profile_id>/', views.profile_detail, name='profile_detail'),
     path('sales-list/', views.sales_list, name='sales_list'),
+    path('sales-analytics/', views.sales_analytics, name='sales_analytics'),
     path('delete-sale/<int:pk>/', views.delete_sale, name='delete_sale'),
 
 ]
@@ -1,4 +1,4 @@
-from PIL import Image
+from PIL import Image, ImageOps
 from io import BytesIO
 from django.core.files.uploadedfile import InMemoryUploadedFile
 import sys
@@ -69,3 +69,46 @@ def compress_image(image, max_size=(800, 800), quality=85):
     except Exception as e:
         print(f"Error compressing image: {e}")
         return image  # Return original if compression fails
+
+
+# name -> longest edge in pixels, smallest first
+IMAGE_VARIANTS = [
+    ('thumb', 160),
+    ('medium', 480),
+    ('large', 1200),
+]
+
+
+def build_derivatives(data, variants=IMAGE_VARIANTS, quality=82):
+    """
+    Render every size in `variants` from the raw bytes of one image, as
+    both JPEG and WebP.
+
+    Orientation from EXIF is applied first and no metadata is written to
+    the outputs, so EXIF (including GPS) is stripped. This is plain CPU
+    work with picklable arguments so it can run in a process pool.
+
+    Returns:
+        {name: {'width': int, 'jpeg': bytes, 'webp': bytes}}
+    """
+    img = Image.open(BytesIO(data))
+    img = ImageOps.exif_transpose(img)
+
+    # Flatten transparency onto white, as compress_image does
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    derivatives = {}
+    for name, edge in variants:
+        resized = img.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        jpeg, webp = BytesIO(), BytesIO()
+        resized.save(jpeg, format='JPEG', quality=quality, optimize=True, progressive=True)
+        resized.save(webp, format='WEBP', quality=quality, method=4)
+        derivatives[name] = {'width': resized.size[0], 'jpeg': jpeg.getvalue(), 'webp': webp.getvalue()}
+    return derivatives
@@ -1,20 +1,50 @@
 from django.shortcuts import render,redirect, get_object_or_404
-from .models import Stock, StockHistory, Sale
+from .models import Stock, StockMovement, Sale, DailySalesSummary, LowStockEvent
 from .forms import * 
+from . import caching as catalog_cache
+from . import metrics as prometheus
+from . import profiling
+from .exports import EXPORTS, csv_response, xlsx_response
+from .filters import day_range, filter_history, filter_stock, sales_queryset, summary_queryset
+from .importers import import_stock
+from .pagination import CursorPaginator
+from .rollups import totals as rollup_totals
+from .search import search_stock
+from .supabase_storage import get_supabase_storage
+from .services import (
+    CartError, InsufficientStock, issue_stock, receive_stock, record_movement, reverse_sale, save_edited_stock, sell_cart,
+)
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.core.paginator import Paginator
-from django.http import HttpResponse, JsonResponse
-from django.db.models import Q, Sum, F, DecimalField
-from django.db.models.functions import Cast
-import csv
-from datetime import datetime, date, timedelta
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import condition
+import json
+from datetime import date, timedelta
 from decimal import Decimal
+from urllib.parse import urlencode
 # Create your views here.
 
+def _export_query(data, fields):
+    """Querystring carrying the active list filters over to the export links"""
+    return urlencode({field: data.get(field) for field in fields if data.get(field)})
+
+
 @login_required
 def home(request):
-    return render(request, 'inventory/home.html')
+    return render(request, 'inventory/home.html', {
+        'low_stock': catalog_cache.low_stock(),
+        'valuation': catalog_cache.valuation(),
+    })
+
+
+@login_required
+def valuation_report(request):
+    return render(request, 'inventory/valuation_report.html', {'valuation': catalog_cache.valuation()})
 
 @login_required
 def list_items(request):
@@ -22,19 +52,15 @@ def list_items(request):
     queryset = Stock.objects.select_related('supplier').all()
     
     if request.method == 'POST' and form.is_valid():
-        item_name = form.cleaned_data.get('item_name')
-        brand = form.cleaned_data.get('brand')
-        category = form.cleaned_data.get('category')
-        
-        if item_name:
-            queryset = queryset.filter(item_name__icontains=item_name)
-        if brand:
-            queryset = queryset.filter(brand__icontains=brand)
-        if category:
-            queryset = queryset.filter(category__icontains=category)
-    
-    # Order by item name to avoid pagination warning
-    queryset = queryset.order_by('item_name')
+        queryset = filter_stock(
+            queryset,
+            form.cleaned_data.get('item_name'),
+            form.cleaned_data.get('brand'),
+            form.cleaned_data.get('category'),
+        )
+    else:
+        # Order by item name to avoid pagination warning
+        queryset = queryset.order_by('item_name')
     
     # pagination
     paginator = Paginator(queryset, 10)  # Show 10 items per page
@@ -44,6 +70,7 @@ def list_items(request):
     context = {
         'form': form,
         'queryset': page_obj,  # Use page_obj instead of queryset
+        'export_query': _export_query(form.data, ['item_name', 'brand', 'category']),
         'title': 'Inventory Items'
     }
     return render(request, 'inventory/list_items.html', context)
@@ -67,19 +94,14 @@ def add_items(request):
             item = form.save(commit=False)
             item.added_by = request.user  # Set the user who added this item
             item.save()
+            form.save_m2m()  # also queues the image upload
             
             # Create history record for item creation
-            StockHistory.objects.create(
-                stock_id=item.id,
-                item_name=item.item_name,
-                quantity=item.quantity,
-                category=item.category,
-                brand=item.brand,
-                price=item.price,
-                created_by=request.user.username,
+            record_movement(
+                item.id, StockMovement.Kind.CREATE, item.quantity,
+                actor=request.user,
+                balance=item.quantity,
                 supplier=item.supplier,
-                last_updated=item.last_updated,
-                timestamp=item.last_updated
             )
             
             messages.success(request, f'{item.item_name} has been added successfully')
@@ -97,6 +119,36 @@ def add_items(request):
     }
     return render(request, 'inventory/add_items.html', context)
 
+@login_required
+def import_items(request):
+    """Bulk upsert stock items from an uploaded CSV/XLSX catalog"""
+    report = None
+    if request.method == "POST":
+        form = StockImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                report = import_stock(upload, upload.name, username=request.user.username)
+            except ValueError as e:
+                form.add_error('file', str(e))
+            else:
+                messages.success(
+                    request,
+                    f"{report.imported} items imported from {report.rows} rows "
+                    f"({report.rows_per_sec:.0f} rows/sec)"
+                )
+                if report.error_count:
+                    messages.warning(request, f"{report.error_count} rows were skipped")
+    else:
+        form = StockImportForm()
+
+    context = {
+        'form': form,
+        'report': report,
+        'title': 'Import Items'
+    }
+    return render(request, 'inventory/import_items.html', context)
+
 @login_required
 def update_items(request, pk):
     item = Stock.objects.get(id=pk)
@@ -104,7 +156,7 @@ def update_items(request, pk):
         form = StockUpdateForm(request.POST, instance=item)
         if form.is_valid():
             changed_fields = form.changed_data  
-            updated_item = form.save()
+            save_edited_stock(form.save(commit=False), request.user)
 
             if changed_fields:
                 for field in changed_fields:
@@ -140,37 +192,35 @@ def delete_items(request, pk):
 @login_required
 def stock_details(request, pk):
     stock = get_object_or_404(Stock, id=pk)   
-    return render(request, 'inventory/stock_details.html', {'stock': stock})
+    # Served by the (stock, -created_at) and (stock, -sale_date) indexes
+    movements = stock.movements.select_related('actor', 'supplier').order_by('-created_at', '-id')[:10]
+    sales = stock.sales.order_by('-sale_date')[:10]
+    context = {
+        'stock': stock,
+        'movements': movements,
+        'sales': sales,
+    }
+    return render(request, 'inventory/stock_details.html', context)
 
 @login_required
 def issue_items(request, pk):
     queryset = Stock.objects.get(id=pk)
     form = IssueForm(request.POST or None, instance=queryset)
     if form.is_valid():
-        instance = form.save(commit=False)
-        instance.receive_quantity = 0
-        old_issue_quantity = instance.issue_quantity
-        instance.quantity -= old_issue_quantity
-        
-        # Create history record
-        StockHistory.objects.create(
-            stock_id=instance.id,
-            item_name=instance.item_name,
-            quantity=instance.quantity,
-            category=instance.category,
-            brand=instance.brand,
-            price=instance.price,
-            issue_quantity=old_issue_quantity,
-            issue_by=request.user.username,
-            issue_to=form.cleaned_data.get('issue_to', ''),
-            supplier=instance.supplier,
-            last_updated=instance.last_updated,
-            timestamp=instance.last_updated
-        )
-        
-        messages.success(request, f"Issued SUCCESSFULLY. {instance.quantity} {instance.item_name}s now left in Store")
-        instance.save()
-        return redirect(f'/stock_details/{instance.id}')
+        issue_quantity = form.cleaned_data['issue_quantity']
+        try:
+            instance = issue_stock(
+                queryset.id,
+                issue_quantity,
+                user=request.user,
+                issue_to=form.cleaned_data.get('issue_to', ''),
+            )
+        except InsufficientStock:
+            queryset.refresh_from_db(fields=['quantity'])
+            messages.error(request, f"Cannot issue {issue_quantity}. Only {queryset.quantity} {queryset.item_name}s left in Store")
+        else:
+            messages.success(request, f"Issued SUCCESSFULLY. {instance.quantity} {instance.item_name}s now left in Store")
+            return redirect(f'/stock_details/{instance.id}')
     
     context = {
         "title": f"Issue {queryset.item_name}",
@@ -187,28 +237,13 @@ def receive_items(request, pk):
     queryset = Stock.objects.get(id=pk)
     form = ReceiveForm(request.POST or None, instance=queryset)
     if form.is_valid():
-        instance = form.save(commit=False)
-        instance.issue_quantity = 0
-        old_receive_quantity = instance.receive_quantity
-        instance.quantity += old_receive_quantity
-        
-        # Create history record
-        StockHistory.objects.create(
-            stock_id=instance.id,
-            item_name=instance.item_name,
-            quantity=instance.quantity,
-            category=instance.category,
-            brand=instance.brand,
-            price=instance.price,
-            receive_quantity=old_receive_quantity,
-            receive_by=request.user.username,
-            supplier=instance.supplier,
-            last_updated=instance.last_updated,
-            timestamp=instance.last_updated
+        instance = receive_stock(
+            queryset.id,
+            form.cleaned_data['receive_quantity'],
+            user=request.user,
+            supplier=form.cleaned_data.get('supplier'),
         )
-        
         messages.success(request, f"Received Successfully. {instance.quantity} {instance.item_name}s now in Store")
-        instance.save()
         return redirect(f'/stock_details/{instance.id}')
 
     context = {
@@ -244,124 +279,142 @@ def reorder_level(request, pk):
     
 @login_required
 def list_history(request):
-    form = StockSearchForm(request.POST or None)
-    queryset = StockHistory.objects.select_related('supplier').all()
-    
-    if request.method == 'POST' and form.is_valid():
-        item_name = form.cleaned_data.get('item_name')
-        brand = form.cleaned_data.get('brand')
-        category = form.cleaned_data.get('category')
-        date_from = form.cleaned_data.get('date_from')
-        date_to = form.cleaned_data.get('date_to')
-        
-        if item_name:
-            queryset = queryset.filter(item_name__icontains=item_name)
-        if brand:
-            queryset = queryset.filter(brand__icontains=brand)
-        if category:
-            queryset = queryset.filter(category__icontains=category)
-        if date_from:
-            queryset = queryset.filter(last_updated__date__gte=date_from)
-        if date_to:
-            queryset = queryset.filter(last_updated__date__lte=date_to)
+    # Filters come from the form POST, or from the querystring on later pages
+    form = StockSearchForm(request.POST or request.GET or None)
+    queryset = StockMovement.objects.select_related('stock', 'supplier', 'actor').all()
     
-    # Order by most recent first
-    queryset = queryset.order_by('-last_updated')
+    if form.is_bound and form.is_valid():
+        queryset = filter_history(
+            queryset,
+            form.cleaned_data.get('item_name'),
+            form.cleaned_data.get('brand'),
+            form.cleaned_data.get('category'),
+            form.cleaned_data.get('date_from'),
+            form.cleaned_data.get('date_to'),
+        )
     
-    #pagination
-    paginator = Paginator(queryset, 10)  # Show 10 items per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination, most recent first; the total is a planner estimate
+    paginator = CursorPaginator(queryset, 10, 'created_at', count_mode='estimate')
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'form': form,
         'queryset': page_obj,  
+        'export_query': _export_query(form.data, ['item_name', 'brand', 'category', 'date_from', 'date_to']),
         'title': 'Inventory History'
     }
     return render(request, 'inventory/list_history.html', context)
 
+LEDGER_READ_ONLY = "History is the stock ledger and cannot be deleted; record a correcting issue or receipt instead."
+
 @login_required
 def delete_history(request, pk):
-    history = get_object_or_404(StockHistory, pk=pk)
+    """Kept for old links: ledger rows are never deleted"""
+    get_object_or_404(StockMovement, pk=pk)
     if request.method == "POST":
-        history.delete()
-        messages.success(request, "History entry deleted successfully.")
+        messages.error(request, LEDGER_READ_ONLY)
     return redirect('list_history')
 
 @login_required
 def bulk_delete_history(request):
-    """Delete multiple history entries at once"""
+    """Kept for old links: ledger rows are never deleted"""
     if request.method == "POST":
-        history_ids = request.POST.getlist('history_ids')
-        if history_ids:
-            deleted_count = StockHistory.objects.filter(id__in=history_ids).delete()[0]
-            messages.success(request, f"{deleted_count} history entries deleted successfully.")
-        else:
-            messages.warning(request, "No items selected for deletion.")
+        messages.error(request, LEDGER_READ_ONLY)
     return redirect('list_history')
 
 @login_required
 def export_to_csv(request):
     """Export all stock items to CSV file"""
-    # Create the HttpResponse object with CSV header
-    response = HttpResponse(content_type='text/csv')
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    response['Content-Disposition'] = f'attachment; filename="inventory_export_{timestamp}.csv"'
-    
-    # Create CSV writer
-    writer = csv.writer(response)
-    
-    # Write header row
-    writer.writerow([
-        'ID',
-        'Item Name',
-        'Quantity',
-        'Category',
-        'Brand',
-        'Price (रु)',
-        'Reorder Level',
-        'Supplier',
-        'Supplier Contact',
-        'Created By',
-        'Created Date',
-        'Last Updated'
-    ])
-    
-    # Get stock items (all or filtered)
-    stocks = Stock.objects.select_related('supplier').all()
-    
-    # Apply filters if provided in GET parameters
-    item_name = request.GET.get('item_name')
-    brand = request.GET.get('brand')
-    category = request.GET.get('category')
-    
-    if item_name:
-        stocks = stocks.filter(item_name__icontains=item_name)
-    if brand:
-        stocks = stocks.filter(brand__icontains=brand)
-    if category:
-        stocks = stocks.filter(category__icontains=category)
-    
-    stocks = stocks.order_by('item_name')
-    
-    # Write data rows
-    for stock in stocks:
-        writer.writerow([
-            stock.id,
-            stock.item_name,
-            stock.quantity,
-            stock.category or 'N/A',
-            stock.brand or 'N/A',
-            stock.price or '0',
-            stock.reorder_level or '0',
-            stock.supplier.name if stock.supplier else 'N/A',
-            stock.supplier.phone_number if stock.supplier else 'N/A',
-            stock.created_by or 'N/A',
-            stock.timestamp.strftime('%Y-%m-%d %H:%M') if stock.timestamp else 'N/A',
-            stock.last_updated.strftime('%Y-%m-%d %H:%M') if stock.last_updated else 'N/A'
-        ])
-    
-    return response
+    return csv_response(EXPORTS['stock'], request.GET)
+
+
+@login_required
+def export_data(request, dataset):
+    """Stream the stock, history or sales list (with its filters) as CSV or XLSX"""
+    export = EXPORTS.get(dataset)
+    if export is None:
+        raise Http404("Unknown export")
+    if request.GET.get('format') == 'xlsx':
+        return xlsx_response(export, request.GET)
+    return csv_response(export, request.GET)
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint. Open to staff sessions, or to a scraper
+    sending `Authorization: Bearer <METRICS_TOKEN>`.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if token and not authorized:
+        authorized = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    body, content_type = prometheus.exposition()
+    return HttpResponse(body, content_type=content_type)
+
+
+@login_required
+def low_stock_events(request):
+    """
+    Items that crossed their reorder level since event `after` (JSON).
+    Poll with the returned `last_id` to receive only new crossings.
+    """
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = min(int(request.GET.get('limit', 100)), 500)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'after and limit must be integers'}, status=400)
+    events = list(
+        LowStockEvent.objects.filter(id__gt=after).select_related('stock').order_by('id')[:limit]
+    )
+    return JsonResponse({
+        'status': 'success',
+        'events': [{
+            'id': event.id,
+            'kind': 'low' if event.kind == LowStockEvent.Kind.LOW else 'recovered',
+            'stock_id': event.stock_id,
+            'item_name': event.stock.item_name if event.stock else None,
+            'quantity': event.quantity,
+            'reorder_level': event.reorder_level,
+            'created_at': event.created_at.isoformat(),
+        } for event in events],
+        'last_id': events[-1].id if events else after,
+    })
+
+
+@staff_member_required
+def profile_list(request):
+    """Slowest (or newest, ?order=recent) profiled requests in the ring buffer"""
+    order = 'recent' if request.GET.get('order') == 'recent' else 'slowest'
+    context = {
+        'profiles': profiling.recent(limit=100, order=order),
+        'order': order,
+        'enabled': getattr(settings, 'PROFILING_ENABLED', False),
+        'title': 'Request Profiles',
+    }
+    return render(request, 'inventory/profile_list.html', context)
+
+
+@staff_member_required
+def profile_detail(request, profile_id):
+    """Top cumulative functions of one profiled request"""
+    profile = profiling.load(profile_id)
+    if profile is None:
+        raise Http404("Profile not found (it may have been rotated out)")
+    return render(request, 'inventory/profile_detail.html', {'profile': profile, 'title': 'Request Profile'})
+
+
+@staff_member_required
+def storage_metrics(request):
+    """Supabase call latency/failure counters and breaker state for this worker process"""
+    storage = get_supabase_storage()
+    return JsonResponse({
+        'status': 'success',
+        'configured': bool(storage.client),
+        'breaker': storage.breaker.state,
+        'operations': storage.metrics.snapshot(),
+    })
 
 
 # ==================== SALES/POS VIEWS ====================
@@ -373,34 +426,31 @@ def pos_page(request):
 	search_query = request.GET.get('search', '').strip()
 	category_filter = request.GET.get('category', '').strip()
 	
-	# Get all items in stock
-	items = Stock.objects.filter(quantity__gt=0).select_related('supplier')
-	
-	# Apply filters
+	# Get all items in stock, filtered and ranked by relevance. The plain
+	# catalog (no search text) comes from the shared cache.
 	if search_query:
-		items = items.filter(
-			Q(item_name__icontains=search_query) |
-			Q(brand__icontains=search_query)
+		items = search_stock(
+			Stock.objects.filter(quantity__gt=0).select_related('supplier'),
+			query=search_query,
+			category=category_filter,
 		)
-	
-	if category_filter:
-		items = items.filter(category__icontains=category_filter)
-	
-	items = items.order_by('item_name')
+	else:
+		items = catalog_cache.pos_items(category_filter)
 	
 	# Get unique categories for filter dropdown
-	categories = Stock.objects.filter(quantity__gt=0).values_list('category', flat=True).distinct()
-	categories = sorted([c for c in categories if c])
+	categories = catalog_cache.categories()
 	
 	# Get today's sales
-	today = date.today()
+	today = timezone.localdate()
+	day_begins, day_ends = day_range(today)
 	today_sales = Sale.objects.filter(
-		sale_date__date=today
+		sale_date__gte=day_begins, sale_date__lt=day_ends
 	).select_related('stock').order_by('-sale_date')
 	
-	# Calculate today's totals
-	today_total = today_sales.aggregate(total=Sum('subtotal'))['total'] or Decimal('0.00')
-	today_quantity = today_sales.aggregate(qty=Sum('quantity_sold'))['qty'] or 0
+	# Today's totals come from the daily rollup, not a scan of today's sales
+	today_totals = rollup_totals(DailySalesSummary.objects.filter(day=today))
+	today_total = today_totals['total']
+	today_quantity = today_totals['qty']
 	
 	# Paginate today's sales
 	paginator = Paginator(today_sales, 15)
@@ -415,6 +465,7 @@ def pos_page(request):
 		'sales_today': sales_page,
 		'today_total': today_total,
 		'today_quantity': today_quantity,
+		'low_stock': catalog_cache.low_stock(),
 		'form': SaleForm(),
 	}
 	return render(request, 'inventory/pos_page.html', context)
@@ -428,7 +479,14 @@ def add_sale(request):
 		if form.is_valid():
 			sale = form.save(commit=False)
 			sale.sold_by = request.user.username
-			sale.save()
+			try:
+				sale.save()
+			except InsufficientStock:
+				sale.stock.refresh_from_db(fields=['quantity'])
+				return JsonResponse({
+					'status': 'error',
+					'message': f'Only {sale.stock.quantity} items in stock!'
+				}, status=409)
 			
 			return JsonResponse({
 				'status': 'success',
@@ -447,6 +505,62 @@ def add_sale(request):
 	return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
 
 
+@login_required
+def checkout(request):
+	"""Sell a whole POS cart in one request (AJAX, JSON body)"""
+	if request.method != 'POST':
+		return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+	
+	try:
+		payload = json.loads(request.body or b'{}')
+		raw_lines = payload.get('items') or []
+	except (ValueError, AttributeError):
+		return JsonResponse({'status': 'error', 'message': 'Invalid JSON body'}, status=400)
+	
+	if not isinstance(raw_lines, list) or not raw_lines:
+		return JsonResponse({'status': 'error', 'message': 'Cart is empty'}, status=400)
+	
+	lines = []
+	line_errors = {}
+	for index, raw_line in enumerate(raw_lines):
+		line_form = CartLineForm(raw_line if isinstance(raw_line, dict) else {})
+		if line_form.is_valid():
+			data = line_form.cleaned_data
+			lines.append((data['stock'], data['quantity'], data['selling_price']))
+		else:
+			line_errors[index] = line_form.errors.get_json_data()
+	if line_errors:
+		return JsonResponse({'status': 'error', 'errors': line_errors}, status=400)
+	
+	try:
+		sales, stocks = sell_cart(lines, user=request.user)
+	except CartError as e:
+		return JsonResponse({'status': 'error', 'message': str(e), 'errors': e.errors}, status=409)
+	
+	receipt_lines = [
+		{
+			'sale_id': sale.id,
+			'stock_id': sale.stock_id,
+			'item_name': stocks[sale.stock_id]['item_name'],
+			'quantity': sale.quantity_sold,
+			'price': str(sale.selling_price),
+			'subtotal': str(sale.subtotal),
+		}
+		for sale in sales
+	]
+	return JsonResponse({
+		'status': 'success',
+		'message': f'{len(sales)} item(s) sold successfully!',
+		'receipt': {
+			'sold_by': request.user.username,
+			'timestamp': sales[0].sale_date.strftime('%Y-%m-%d %H:%M:%S'),
+			'lines': receipt_lines,
+			'total_quantity': sum(sale.quantity_sold for sale in sales),
+			'total': str(sum((sale.subtotal for sale in sales), Decimal('0.00'))),
+		}
+	})
+
+
 @login_required
 def get_product_price(request, product_id):
 	"""Get product price via AJAX"""
@@ -462,61 +576,84 @@ def get_product_price(request, product_id):
 		return JsonResponse({'status': 'error', 'message': 'Product not found'}, status=404)
 
 
+def _catalog_etag(request):
+	return catalog_cache.catalog_snapshot()['etag']
+
+
+@login_required
+@condition(etag_func=_catalog_etag)
+def catalog_snapshot(request):
+	"""Whole catalog as compact JSON; revalidate with If-None-Match"""
+	snapshot = catalog_cache.catalog_snapshot()
+	response = JsonResponse({'status': 'success', **snapshot})
+	response['Cache-Control'] = 'private, no-cache'
+	return response
+
+
 @login_required
 def sales_list(request):
 	"""View all sales with filters"""
 	form = SaleFilterForm(request.GET or None)
-	sales = Sale.objects.select_related('stock').all()
-	
 	# Apply filters
-	if request.GET:
-		item_name = request.GET.get('item_name', '').strip()
-		date_from = request.GET.get('date_from')
-		date_to = request.GET.get('date_to')
-		
-		if item_name:
-			sales = sales.filter(stock__item_name__icontains=item_name)
-		
-		if date_from:
-			sales = sales.filter(sale_date__date__gte=date_from)
-		
-		if date_to:
-			sales = sales.filter(sale_date__date__lte=date_to)
-	
-	sales = sales.order_by('-sale_date')
+	sales = sales_queryset(request.GET).select_related('stock')
 	
-	# Pagination
-	paginator = Paginator(sales, 25)
-	page_number = request.GET.get('page')
-	page_obj = paginator.get_page(page_number)
+	# Keyset pagination on (sale_date, id), newest first
+	paginator = CursorPaginator(sales, 25, 'sale_date')
+	page_obj = paginator.get_page(request.GET.get('cursor'))
 	
-	# Calculate totals
-	total_sales = sales.aggregate(total=Sum('subtotal'))['total'] or Decimal('0.00')
-	total_quantity = sales.aggregate(qty=Sum('quantity_sold'))['qty'] or 0
+	# Totals are read from the daily rollup: cost scales with days, not sales
+	totals = rollup_totals(summary_queryset(request.GET))
+	total_sales = totals['total']
+	total_quantity = totals['qty']
 	
 	context = {
 		'form': form,
 		'sales': page_obj,
 		'total_sales': total_sales,
 		'total_quantity': total_quantity,
+		'total_count': totals['count'],
+		'export_query': _export_query(request.GET, ['item_name', 'date_from', 'date_to']),
 		'title': 'Sales List'
 	}
 	return render(request, 'inventory/sales_list.html', context)
 
 
+# Default range per bucket, in days back from `to`
+ANALYTICS_DEFAULT_DAYS = {'hour': 1, 'day': 29, 'week': 7 * 12, 'month': 365}
+
+
+@login_required
+def sales_analytics(request):
+	"""
+	Revenue and units per time bucket for charts (JSON).
+	?bucket=hour|day|week|month&from=YYYY-MM-DD&to=YYYY-MM-DD
+	&dimension=category|cashier|item&top=N
+	"""
+	bucket = request.GET.get('bucket', 'day')
+	dimension = request.GET.get('dimension') or None
+	if dimension == 'total':
+		dimension = None
+	try:
+		date_to = date.fromisoformat(request.GET['to']) if request.GET.get('to') else timezone.localdate()
+		if request.GET.get('from'):
+			date_from = date.fromisoformat(request.GET['from'])
+		else:
+			date_from = date_to - timedelta(days=ANALYTICS_DEFAULT_DAYS.get(bucket, 29))
+		top = max(1, min(int(request.GET.get('top', 10)), 50))
+		data = catalog_cache.sales_series(bucket, date_from, date_to, dimension, top)
+	except ValueError as e:
+		return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+	return JsonResponse({'status': 'success', **data})
+
+
 @login_required
 def delete_sale(request, pk):
 	"""Delete a sale and restore stock"""
 	sale = get_object_or_404(Sale, id=pk)
 	
 	if request.method == 'POST':
-		# Restore stock if it exists (handle SET_NULL case)
-		if sale.stock:
-			sale.stock.quantity += sale.quantity_sold
-			sale.stock.save()
-		
-		# Delete sale
-		sale.delete()
+		# Restore stock (if it still exists) and delete the sale atomically
+		reverse_sale(sale, user=request.user)
 		messages.warning(request, 'Sale deleted and stock restored.')
 		return redirect('pos_page')
 	
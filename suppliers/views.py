@@ -3,11 +3,12 @@ from django.contrib import messages
 from .models import Supplier, Brand
 from .forms import SupplierForm
 from django.contrib.auth.decorators import login_required
+from inventorymgmt import caching
 
 
 @login_required
 def supplier_list(request):
-    suppliers = Supplier.objects.prefetch_related('stocks').all()
+    suppliers = caching.suppliers()
     return render(request, 'suppliers/supplier_list.html', {'suppliers': suppliers})
 
 def supplier_create(request):